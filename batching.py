@@ -0,0 +1,172 @@
+import re
+import base64
+import asyncio
+import logging
+from dataclasses import dataclass
+
+import litellm
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Pixel budget for all images in one request (a letter page at 300 DPI is ~8.4M)
+MAX_BATCH_PIXELS = 12_000_000
+# Most page images packed into one request
+MAX_BATCH_PAGES = 8
+# How long a page waits for others to share its request
+LINGER_SECONDS = 0.5
+
+PAGE_MARKER = "<<<PAGE {}>>>"
+PAGE_MARKER_RE = re.compile(r"^\s*<<<PAGE (\d+)>>>\s*$", re.MULTILINE)
+
+BATCH_INSTRUCTIONS = (
+    "You will receive {count} separate page images. Convert each page on its own, "
+    "in the order given. Start the output of page N with a line containing only "
+    "{marker} and nothing else, for every page from 1 to {count}, even if a page is blank. "
+    "Never merge content from different pages."
+)
+
+
+def image_size(image_path):
+    """(width, height) of an image, read from its header"""
+    with Image.open(image_path) as image:
+        return image.size
+
+
+def encode_image(image_path):
+    with open(image_path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+def split_pages(content, count):
+    """Split a batched response into per-page text
+
+    Returns None unless every marker from 1 to `count` appears exactly once
+    and in order, so a response that dropped or merged pages is never
+    attributed to the wrong page.
+    """
+    markers = list(PAGE_MARKER_RE.finditer(content or ""))
+    if [int(m.group(1)) for m in markers] != list(range(1, count + 1)):
+        return None
+    pages = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(content)
+        pages.append(content[marker.end():end].strip())
+    return pages
+
+
+@dataclass
+class _PendingPage:
+    data: str
+    pixels: int
+    future: asyncio.Future
+
+
+class PageBatcher:
+    """Packs small page images from concurrent conversions into shared requests
+
+    Pages submitted within LINGER_SECONDS of each other are sent together
+    until the pixel budget or page limit is reached. Each batched response
+    must contain one verified marker per page; otherwise the pages are
+    re-sent one per request. Pages larger than half the budget are always
+    sent alone.
+    """
+
+    def __init__(self, vision_model, max_pixels=MAX_BATCH_PIXELS,
+                 max_pages=MAX_BATCH_PAGES, linger=LINGER_SECONDS):
+        self.vision_model = vision_model
+        self.max_pixels = max_pixels
+        self.max_pages = max_pages
+        self.linger = linger
+        self._pending = []
+        self._pending_pixels = 0
+        self._timer = None
+        self._tasks = set()
+        self.requests_sent = 0
+
+    @classmethod
+    def from_config(cls, vision_model, settings):
+        """Build from the `batching` section of config.yaml"""
+        settings = settings or {}
+        linger = settings.get("linger")
+        return cls(
+            vision_model,
+            max_pixels=settings.get("max_pixels") or MAX_BATCH_PIXELS,
+            max_pages=settings.get("max_pages") or MAX_BATCH_PAGES,
+            linger=LINGER_SECONDS if linger is None else linger,
+        )
+
+    async def ocr(self, image_path):
+        """Raw model output for one page image, possibly shared with other pages"""
+        loop = asyncio.get_running_loop()
+        width, height = await asyncio.to_thread(image_size, image_path)
+        # Encode now: the caller may delete the image before the batch is sent
+        data = await asyncio.to_thread(encode_image, image_path)
+        page = _PendingPage(data=data, pixels=width * height, future=loop.create_future())
+
+        if page.pixels * 2 > self.max_pixels:
+            self._start([page])
+        else:
+            if self._pending_pixels + page.pixels > self.max_pixels:
+                self._flush()
+            self._pending.append(page)
+            self._pending_pixels += page.pixels
+            if len(self._pending) >= self.max_pages:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.linger, self._flush)
+        return await page.future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pages = [page for page in self._pending if not page.future.done()]
+        self._pending = []
+        self._pending_pixels = 0
+        if pages:
+            self._start(pages)
+
+    def _start(self, pages):
+        task = asyncio.ensure_future(self._send(pages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _complete(self, pages):
+        messages = [{"role": "system", "content": self.vision_model.system_prompt}]
+        if len(pages) > 1:
+            messages.append({
+                "role": "system",
+                "content": BATCH_INSTRUCTIONS.format(count=len(pages), marker=PAGE_MARKER.format("N")),
+            })
+        messages.append({
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{page.data}"}}
+                for page in pages
+            ],
+        })
+        self.requests_sent += 1
+        response = await litellm.acompletion(
+            model=self.vision_model.model,
+            messages=messages,
+            **self.vision_model.kwargs
+        )
+        return response["choices"][0]["message"]["content"]
+
+    async def _send(self, pages):
+        try:
+            if len(pages) == 1:
+                contents = [await self._complete(pages)]
+            else:
+                contents = split_pages(await self._complete(pages), len(pages))
+                if contents is None:
+                    logger.warning("Batched response for %d pages failed marker check, retrying individually", len(pages))
+                    contents = await asyncio.gather(*(self._complete([page]) for page in pages))
+            for page, content in zip(pages, contents):
+                if not page.future.done():
+                    page.future.set_result(content)
+        except Exception as e:
+            for page in pages:
+                if not page.future.done():
+                    page.future.set_exception(e)
@@ -0,0 +1,195 @@
+"""Soak test for long-running converter processes
+
+Converts thousands of small synthetic PDFs in rounds through one
+PDFConverterTool and one event loop, as the GUI or a weekend batch would,
+with a mock vision model in place of the real API. RSS and open file
+descriptors are measured after every round; the run fails if they keep
+growing once the warm-up rounds are over.
+
+    python benchmarks/soak.py --documents 2000 --max-growth-mb 50
+
+Pages are rendered with pdftoppm when it is installed; pass --mock-render
+(or run without poppler) to replace rendering and page counting with a
+small generated PNG and PyPDF2.
+"""
+import os
+import sys
+import gc
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from pyzerox import models
+
+import pipeline
+from converter import PDFConverterTool
+from logging_setup import setup_logging, stop_logging
+from profiling import Profiler, current_rss
+
+MOCK_MODEL_ID = "mock/vision-model"
+
+CONFIG = f"""
+vendors:
+- name: Mock
+  models:
+  - name: Mock Vision Model
+    model_id: {MOCK_MODEL_ID}
+    env_vars:
+    - key: MOCK_API_KEY
+      value: not-a-real-key
+"""
+
+
+class MockCompletion:
+    def __init__(self, content):
+        self.content = content
+
+
+class MockVisionModel:
+    """Stands in for zerox's litellmmodel; answers after `latency` seconds"""
+    latency = 0.005
+    system_prompt = "mock"
+
+    def __init__(self, model=None, **kwargs):
+        self.model = model
+        self.kwargs = kwargs
+
+    async def completion(self, image_path, maintain_format, prior_page):
+        await asyncio.sleep(self.latency)
+        name = os.path.basename(image_path)
+        rows = "\n".join(f"| {name} | {i} | {i * 1.5:.2f} |" for i in range(20))
+        return MockCompletion(
+            f"```markdown\n# {name}\n\n" + "Lorem ipsum dolor sit amet. " * 40
+            + f"\n\n| File | Row | Value |\n|---|---|---|\n{rows}\n```"
+        )
+
+
+async def mock_render(pdf_path, page, output_dir, dpi=pipeline.IMAGE_DENSITY, cancel_token=None, output_file=None,
+                      poppler_path=None):
+    path = os.path.join(output_dir, f"{output_file or f'page_{page:05d}'}.png")
+    Image.new("L", (850, 1100), 255).save(path)
+    return path
+
+
+async def mock_page_count(pdf_path, cancel_token=None, poppler_path=None):
+    return len(PdfReader(pdf_path).pages)
+
+
+def write_documents(folder, count, rng):
+    os.makedirs(folder)
+    for i in range(count):
+        writer = PdfWriter()
+        for _ in range(rng.randint(1, 3)):
+            writer.add_blank_page(612, 792)
+        with open(os.path.join(folder, f"doc_{i:05d}.pdf"), "wb") as f:
+            writer.write(f)
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+async def soak(args, work_dir):
+    config_file = os.path.join(work_dir, "config.yaml")
+    with open(config_file, "w", encoding="utf-8") as f:
+        f.write(CONFIG)
+    tool = PDFConverterTool(config_file)
+    if args.profile:
+        tool.profiler = Profiler(enabled=True, trace_memory=False)
+
+    rng = random.Random(0)
+    samples = []
+    rounds = -(-args.documents // args.round_size)
+    for round_no in range(rounds):
+        count = min(args.round_size, args.documents - round_no * args.round_size)
+        input_folder = os.path.join(work_dir, f"in_{round_no}")
+        output_folder = os.path.join(work_dir, f"out_{round_no}")
+        write_documents(input_folder, count, rng)
+
+        started = time.monotonic()
+        results = await tool.batch_convert(
+            input_folder,
+            output_folder=output_folder,
+            model_id=MOCK_MODEL_ID,
+            concurrency=args.concurrency,
+            incremental=args.incremental,
+        )
+        failed = [r for r in results if not r.get("success")]
+        if failed:
+            raise SystemExit(f"Round {round_no}: {len(failed)} conversion(s) failed, e.g. {failed[0]}")
+
+        shutil.rmtree(input_folder)
+        shutil.rmtree(output_folder)
+        gc.collect()
+        rss = current_rss() / 2 ** 20
+        samples.append((rss, open_fds()))
+        print(f"round {round_no + 1}/{rounds}: {count} docs in {time.monotonic() - started:.1f}s, "
+              f"RSS {rss:.1f} MB, fds {samples[-1][1]}, workspace usage {tool.workspaces.usage} B")
+        if args.tracemalloc and round_no + 1 == args.warmup:
+            baseline_snapshot = tracemalloc.take_snapshot()
+
+    if args.tracemalloc and rounds > args.warmup:
+        growth = tracemalloc.take_snapshot().compare_to(baseline_snapshot, "lineno")
+        print("Largest allocation growth since warm-up:")
+        for stat in growth[:10]:
+            print(f"  {stat}")
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--round-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2, help="Rounds before the memory baseline is taken")
+    parser.add_argument("--max-growth-mb", type=float, default=50.0, help="Allowed RSS growth after warm-up")
+    parser.add_argument("--max-fd-growth", type=int, default=10, help="Allowed open file growth after warm-up")
+    parser.add_argument("--latency", type=float, default=MockVisionModel.latency, help="Mock model latency (s)")
+    parser.add_argument("--incremental", action="store_true", help="Exercise the state index too")
+    parser.add_argument("--profile", action="store_true", help="Run with the Profiler enabled")
+    parser.add_argument("--tracemalloc", action="store_true", help="Report allocation growth (slow)")
+    parser.add_argument("--mock-render", action="store_true", help="Don't use pdftoppm")
+    args = parser.parse_args(argv)
+
+    MockVisionModel.latency = args.latency
+    models.litellmmodel = MockVisionModel
+    if args.mock_render or shutil.which("pdftoppm") is None:
+        pipeline.render_page = mock_render
+        pipeline.get_page_count = mock_page_count
+    if args.tracemalloc:
+        tracemalloc.start(10)
+
+    work_dir = tempfile.mkdtemp(prefix="ocr2md_soak_")
+    setup_logging(log_dir=os.path.join(work_dir, "logs"), level="INFO", console=False)
+    try:
+        samples = asyncio.run(soak(args, work_dir))
+    finally:
+        stop_logging()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if len(samples) <= args.warmup:
+        print("Not enough rounds after warm-up to judge memory growth")
+        return 0
+    base_rss, base_fds = samples[args.warmup - 1] if args.warmup else samples[0]
+    end_rss, end_fds = samples[-1]
+    peak_rss = max(rss for rss, _ in samples)
+    print(f"RSS after warm-up {base_rss:.1f} MB, at end {end_rss:.1f} MB, peak {peak_rss:.1f} MB; "
+          f"fds {base_fds} -> {end_fds}")
+    ok = end_rss - base_rss <= args.max_growth_mb and end_fds - base_fds <= args.max_fd_growth
+    print("PASS" if ok else "FAIL: memory or file descriptors kept growing")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+
+class OperationCancelled(Exception):
+    """Raised when work is abandoned through a CancelToken"""
+
+
+class DeadlineExceeded(OperationCancelled):
+    """Raised when a document or page runs past its deadline"""
+
+
+def _min_timeout(*timeouts):
+    timeouts = [t for t in timeouts if t is not None]
+    return min(timeouts) if timeouts else None
+
+
+def _abandon(task):
+    """Cancel a task nobody will await
+
+    Its exception is retrieved when it finishes, so it isn't logged as
+    "exception was never retrieved".
+    """
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+class CancelToken:
+    """Thread-safe cancellation flag with an optional deadline
+
+    A token is created by the caller (GUI, batch job, ...) and passed down
+    through convert_to_pdf, rasterization and model calls. Cancelling it from
+    any thread aborts whatever is currently awaited through guard().
+    Child tokens inherit cancellation and can only tighten the deadline.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        self._lock = threading.Lock()
+        self._reason = None
+        self._waiters = set()
+        self._children = set()
+        self.parent = parent
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if parent is not None:
+            if parent.deadline is not None:
+                deadline = _min_timeout(deadline, parent.deadline)
+            parent._add_child(self)
+        self.deadline = deadline
+
+    def _add_child(self, child):
+        with self._lock:
+            self._children.add(child)
+            reason = self._reason
+        if reason is not None:
+            child.cancel(reason)
+
+    def child(self, timeout=None):
+        """Token cancelled with this one, with an optional tighter deadline"""
+        return CancelToken(timeout=timeout, parent=self)
+
+    def cancel(self, reason="Cancelled"):
+        """Cancel the token and wake everything waiting on it"""
+        with self._lock:
+            if self._reason is not None:
+                return
+            self._reason = reason
+            waiters = list(self._waiters)
+            children = list(self._children)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+        for child in children:
+            child.cancel(reason)
+
+    def release(self):
+        """Detach from the parent once the work this token guarded is finished"""
+        if self.parent is not None:
+            with self.parent._lock:
+                self.parent._children.discard(self)
+
+    @property
+    def cancelled(self):
+        return self._reason is not None
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        """Seconds until the deadline, or None if there is none"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Raise if the token is cancelled or past its deadline"""
+        if self._reason is not None:
+            raise OperationCancelled(self._reason)
+        if self.expired:
+            raise DeadlineExceeded("Deadline exceeded")
+
+    async def guard(self, awaitable, timeout=None):
+        """Await `awaitable`, abandoning it as soon as the token is cancelled,
+        the token's deadline passes or `timeout` seconds elapse
+        """
+        try:
+            self.check()
+        except OperationCancelled:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(awaitable)
+        waiter = loop.create_future()
+        entry = (loop, waiter)
+        with self._lock:
+            self._waiters.add(entry)
+            already_cancelled = self._reason is not None
+        if already_cancelled:
+            waiter.set_result(None)
+
+        try:
+            wait_timeout = _min_timeout(self.remaining(), timeout)
+            done, _ = await asyncio.wait(
+                {task, waiter},
+                timeout=wait_timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if task in done:
+                return task.result()
+
+            _abandon(task)
+            self.check()
+            if timeout is None or (wait_timeout is not None and wait_timeout < timeout):
+                raise DeadlineExceeded("Deadline exceeded")
+            raise DeadlineExceeded(f"Timed out after {timeout} seconds")
+        except asyncio.CancelledError:
+            _abandon(task)
+            raise
+        finally:
+            with self._lock:
+                self._waiters.discard(entry)
+            if not waiter.done():
+                waiter.cancel()
+
+
+class Notifier:
+    """Wakes coroutines on any event loop when a shared resource is released
+
+    Like asyncio.Condition, but usable from several event loops and
+    threads, e.g. for a quota shared by the GUI's loop and worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    def notify_all(self):
+        with self._lock:
+            waiters = list(self._waiters)
+            self._waiters.clear()
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+            except RuntimeError:
+                # The waiter's loop is closed
+                pass
+
+    async def wait_for(self, predicate, cancel_token=None):
+        """Wait until predicate() returns something truthy and return it
+
+        The predicate is re-evaluated after every notify_all().
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            # Register before checking so a release in between isn't missed
+            entry = (loop, loop.create_future())
+            with self._lock:
+                self._waiters.add(entry)
+            try:
+                result = predicate()
+                if result:
+                    return result
+                if cancel_token is not None:
+                    await cancel_token.guard(entry[1])
+                else:
+                    await entry[1]
+            finally:
+                with self._lock:
+                    self._waiters.discard(entry)
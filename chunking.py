@@ -0,0 +1,197 @@
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from cancellation import CancelToken, OperationCancelled
+from workspace import PAGE_IMAGE_BYTES
+from state_index import STATE_DIR_NAME, file_digest, _write_json
+from scheduler import model_slot
+import pipeline
+
+logger = logging.getLogger(__name__)
+
+# Selections of at least this many pages are split into chunks
+CHUNK_THRESHOLD_PAGES = 200
+# Files this large are chunked even with fewer pages
+CHUNK_THRESHOLD_BYTES = 200 * 1024 * 1024
+# Pages per chunk
+CHUNK_PAGES = 100
+# Chunks of one document converted at the same time
+CHUNK_CONCURRENCY = 4
+
+CHECKPOINT_DIR_NAME = "chunks"
+
+
+def should_chunk(pdf_path, page_count):
+    """Whether a selection of `page_count` pages from `pdf_path` is worth chunking"""
+    if page_count <= CHUNK_PAGES:
+        return False
+    return page_count >= CHUNK_THRESHOLD_PAGES or os.path.getsize(pdf_path) >= CHUNK_THRESHOLD_BYTES
+
+
+def plan_chunks(pages, chunk_pages=CHUNK_PAGES):
+    """Split the selected pages into consecutive chunks"""
+    return [pages[i:i + chunk_pages] for i in range(0, len(pages), chunk_pages)]
+
+
+def extract_pages(pdf_path, pages, output_path):
+    """Write the given 1-based pages of a PDF to a new file
+
+    The source is read through an open file rather than loaded whole, so
+    only the objects of the copied pages are parsed.
+    """
+    with open(pdf_path, "rb") as source:
+        reader = PdfReader(source)
+        writer = PdfWriter()
+        for page in pages:
+            writer.add_page(reader.pages[page - 1])
+        with open(output_path, "wb") as f:
+            writer.write(f)
+
+
+class ChunkCheckpoint:
+    """Markdown of finished chunks, kept until the document has been merged
+
+    Checkpoints live in the output folder, keyed by the PDF's content and the
+    model, so re-running a conversion that failed or was cancelled only
+    converts the chunks that never finished.
+    """
+
+    def __init__(self, output_dir, key):
+        self.path = os.path.join(output_dir, STATE_DIR_NAME, CHECKPOINT_DIR_NAME, key)
+        os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    async def for_document(cls, output_dir, pdf_path, model_id):
+        digest = await asyncio.to_thread(file_digest, pdf_path)
+        key = hashlib.sha256(f"{digest}:{model_id}".encode("utf-8")).hexdigest()[:32]
+        return cls(output_dir, key)
+
+    def load(self):
+        """Page number -> Markdown of every checkpointed page"""
+        pages = {}
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                    pages.update({int(page): markdown for page, markdown in json.load(f).items()})
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable checkpoint %s: %s", name, e)
+        return pages
+
+    def save(self, first_page, results):
+        _write_json(
+            os.path.join(self.path, f"chunk_{first_page:06d}.json"),
+            {str(page): markdown for page, markdown in results.items()},
+        )
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+async def process_chunked(pdf_path, pages, vision_model, workspace, checkpoint=None,
+                          maintain_format=False, concurrency=pipeline.CONCURRENCY,
+                          on_progress=None, progress_path=None, cancel_token=None,
+                          chunk_pages=CHUNK_PAGES, chunk_concurrency=CHUNK_CONCURRENCY,
+                          **page_options):
+    """OCR a large document in independently checkpointed chunks
+
+    Each chunk's pages are extracted into a small PDF in `workspace`,
+    processed with pipeline.process_pages and removed again, so at most
+    `chunk_concurrency` extracts exist at a time. Finished chunks are saved
+    to `checkpoint`; a failing chunk doesn't stop the others, and its error
+    is raised once they are done. With maintain_format the page before a
+    chunk is recognised again as context for the chunk's first page unless
+    its Markdown is already known, so chunks don't wait for each other.
+    Returns a dict of page number -> Markdown like process_pages.
+    """
+    progress_path = progress_path or pdf_path
+    cancel_token = cancel_token or CancelToken()
+    selected = set(pages)
+    known = checkpoint.load() if checkpoint is not None else {}
+    total = len(pages)
+    done = sum(1 for page in pages if page in known)
+    if done:
+        logger.info("Resuming from checkpoint: %d of %d pages already converted", done, total)
+        pipeline.emit(on_progress, progress_path, "page", done=done, total=total)
+
+    semaphore = asyncio.Semaphore(chunk_concurrency)
+    page_concurrency = max(1, concurrency // chunk_concurrency)
+
+    def forward(event):
+        # Report progress for the whole document rather than for the chunk
+        nonlocal done
+        if event.stage == "page":
+            done += 1
+            pipeline.emit(on_progress, progress_path, "page", done=done, total=total, page=event.page)
+
+    async def seed(chunk_path, page):
+        """Markdown of the page before a chunk, recognised as context only"""
+        async with workspace.reserve(PAGE_IMAGE_BYTES, cancel_token):
+            image_path = await pipeline.render_page(
+                chunk_path, 1, workspace.path, cancel_token=cancel_token, output_file=f"seed_{page:05d}",
+                poppler_path=page_options.get("poppler_path"),
+            )
+            try:
+                async with model_slot(page_options.get("scheduler"), page_options.get("priority"), cancel_token):
+                    return await cancel_token.guard(pipeline.ocr_page(vision_model, image_path, True, ""))
+            finally:
+                os.remove(image_path)
+
+    async def run_chunk(chunk):
+        todo = [page for page in chunk if page not in known]
+        if not todo:
+            return
+        async with semaphore:
+            context = {page - 1: known[page - 1] for page in todo if page - 1 in known}
+            needs_seed = maintain_format and todo[0] - 1 in selected and todo[0] - 1 not in known
+            extract = [todo[0] - 1] + todo if needs_seed else todo
+
+            chunk_path = os.path.join(workspace.path, f"chunk_{todo[0]:06d}.pdf")
+            await cancel_token.guard(asyncio.to_thread(extract_pages, pdf_path, extract, chunk_path))
+            workspace.track(chunk_path)
+            try:
+                if needs_seed:
+                    context[extract[0]] = await seed(chunk_path, extract[0])
+                results = await pipeline.process_pages(
+                    chunk_path,
+                    todo,
+                    vision_model,
+                    workspace,
+                    maintain_format=maintain_format,
+                    concurrency=page_concurrency,
+                    on_progress=forward,
+                    progress_path=progress_path,
+                    cancel_token=cancel_token,
+                    source_pages={page: i + 1 for i, page in enumerate(extract)},
+                    prior_pages=context,
+                    **page_options
+                )
+            finally:
+                workspace.discard(chunk_path)
+
+        known.update(results)
+        if checkpoint is not None:
+            await asyncio.to_thread(checkpoint.save, todo[0], results)
+        logger.info("Chunk %d-%d converted (%d pages)", chunk[0], chunk[-1], len(todo))
+
+    tasks = [asyncio.ensure_future(run_chunk(chunk)) for chunk in plan_chunks(pages, chunk_pages)]
+    try:
+        outcomes = await cancel_token.guard(asyncio.gather(*tasks, return_exceptions=True))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    for error in errors:
+        if isinstance(error, OperationCancelled):
+            raise error
+    if errors:
+        raise errors[0]
+    return {page: known[page] for page in pages}
@@ -0,0 +1,200 @@
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+from converter import PDFConverterTool, NEED_PDF_CONVERSION
+from page_selection import PageSelection, PageSelectionError, SYNTAX_HELP
+from tiling import TILING_MODES
+from logging_setup import setup_logging_from_config
+from scheduler import INTERACTIVE, BULK
+from profiling import Profiler, PROFILERS
+from worker import FolderQueue, accepts, serve
+
+logger = logging.getLogger(__name__)
+
+
+def page_selection(value):
+    """argparse type for --pages, using the same parser as the GUI"""
+    try:
+        return PageSelection.parse(value)
+    except PageSelectionError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def join_page_values(argv):
+    """Attach a --pages value that starts with "-" to its option
+
+    argparse takes "-5..-1" for an option rather than the value of
+    "-p -5..-1", so that form is rewritten to "--pages=-5..-1".
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    joined = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--":
+            joined.extend(argv[i:])
+            break
+        if arg in ("-p", "--pages") and i + 1 < len(argv) and argv[i + 1].startswith("-") \
+                and argv[i + 1] not in ("-", "--") and not argv[i + 1].lstrip("-")[:1].isalpha():
+            joined.append(f"--pages={argv[i + 1]}")
+            i += 2
+            continue
+        joined.append(arg)
+        i += 1
+    return joined
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ocr2md",
+        description="Convert documents to Markdown without the GUI",
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="Files to convert, or folders of PDFs to batch convert (the inbox with --worker)")
+    parser.add_argument("-m", "--model", help="Model ID from config.yaml (defaults to the first model)")
+    parser.add_argument("-p", "--pages", type=page_selection, help=f"Pages to convert, {SYNTAX_HELP}; "
+                             "values starting with '-' can also be written --pages=-5..-1")
+    parser.add_argument("--keep-format", action="store_true",
+                        help="With --pages, pass each page's predecessor to the model for consistent formatting; "
+                             "consecutive selected pages then run one at a time")
+    parser.add_argument("-o", "--output", help="Output directory (defaults to Downloads)")
+    parser.add_argument("-c", "--config", default="config.yaml", help="Configuration file")
+    parser.add_argument("--tiling", choices=TILING_MODES, default="off", help="Tile oversized or dense pages")
+    parser.add_argument("--batch-pages", action="store_true", help="Pack small pages into shared requests")
+    parser.add_argument("--concurrency", type=int,
+                        help="Documents converted at the same time (default 1, sized from CPUs and memory with --worker)")
+    parser.add_argument("--incremental", action="store_true", help="Skip folder files unchanged since the last run")
+    parser.add_argument("--priority", help="Scheduling class (default: interactive for files, bulk for folders)")
+    parser.add_argument("--profile", action="store_true", help="Log per-document peak RSS and per-stage allocations")
+    parser.add_argument("--profile-dump", choices=PROFILERS,
+                        help="Also write a cprofile or pyinstrument profile per document (implies --profile)")
+    parser.add_argument("--worker", action="store_true",
+                        help="Run headless, converting files dropped into the inbox folder; "
+                             "any number of workers can share one inbox")
+    parser.add_argument("--once", action="store_true", help="With --worker, exit once the inbox is empty")
+    parser.add_argument("--timeout", type=float, help="Deadline in seconds for each document")
+    parser.add_argument("--page-timeout", type=float, help="Deadline in seconds for each page")
+    return parser
+
+
+async def convert_path(converter, input_path, args):
+    """Convert one file, going through PDF first when needed; returns (success, message)"""
+    async with converter.workspaces.workspace(input_path) as workspace:
+        pdf_path = input_path
+        if os.path.splitext(input_path)[1].lower().lstrip('.') in NEED_PDF_CONVERSION:
+            pdf_path = await converter.convert_to_pdf(input_path, workspace=workspace)
+        return await converter.convert_file(
+            pdf_path,
+            pages=args.pages,
+            model_id=args.model,
+            timeout=args.timeout,
+            page_timeout=args.page_timeout,
+            tiling=args.tiling,
+            batch_pages=args.batch_pages,
+            workspace=workspace,
+            output_dir=args.output,
+            priority=args.priority or INTERACTIVE,
+            maintain_format=True if args.keep_format else None,
+        )
+
+
+async def run_worker(converter, args):
+    """Serve the inbox folder until stopped; non-zero exit if a file failed"""
+    if len(args.inputs) != 1 or not os.path.isdir(args.inputs[0]):
+        print("--worker takes one inbox folder", file=sys.stderr)
+        return 2
+    tools = await asyncio.to_thread(lambda: converter.tools)
+    capabilities = tools.capabilities()
+    if not capabilities["render_pdf"]:
+        print("poppler (pdftoppm, pdfinfo) not found; this machine cannot convert anything", file=sys.stderr)
+        return 2
+    concurrency = args.concurrency or converter.limits.documents
+    logger.info("Worker started on %s", args.inputs[0], extra={
+        "capabilities": capabilities,
+        "cpus": converter.limits.cpus,
+        "office_workers": converter.limits.office_workers,
+        "concurrency": concurrency,
+    })
+    if args.priority is None:
+        args.priority = BULK
+    failures = await serve(
+        FolderQueue(args.inputs[0]),
+        lambda path: convert_path(converter, path, args),
+        accept=accepts(tools),
+        concurrency=concurrency,
+        once=args.once,
+    )
+    return 1 if failures else 0
+
+
+async def run(args):
+    converter = PDFConverterTool(args.config)
+    # Workers log everything to stderr for the container's log collector;
+    # interactive runs print results and only show warnings and errors
+    setup_logging_from_config(
+        converter.registry.logging,
+        console_level=None if args.worker else logging.WARNING,
+    )
+    if args.profile or args.profile_dump:
+        configured = converter.profiler
+        converter.profiler = Profiler(
+            enabled=True,
+            output_dir=configured.output_dir,
+            trace_memory=configured.trace_memory,
+            dump=args.profile_dump or configured.dump,
+        )
+    if not converter.set_current_model(args.model or next(iter(converter.model_map.values()), None)):
+        print(f"Unknown or missing model: {args.model}", file=sys.stderr)
+        return 2
+
+    if args.worker:
+        return await run_worker(converter, args)
+
+    failures = 0
+    for input_path in args.inputs:
+        if os.path.isdir(input_path):
+            if args.pages is not None:
+                logger.warning("--pages is ignored for folder %s", input_path)
+            results = await converter.batch_convert(
+                input_path,
+                output_folder=args.output,
+                timeout=args.timeout,
+                page_timeout=args.page_timeout,
+                tiling=args.tiling,
+                batch_pages=args.batch_pages,
+                concurrency=args.concurrency or 1,
+                incremental=args.incremental,
+                priority=args.priority or BULK,
+            )
+            for result in results:
+                if "error" in result:
+                    print(f"{input_path}: {result['error']}", file=sys.stderr)
+                    failures += 1
+                    continue
+                status = "skipped" if result.get("skipped") else "ok" if result["success"] else "failed"
+                print(f"[{status}] {result['filename']}: {result['message']}")
+                failures += not result["success"]
+            continue
+
+        try:
+            success, message = await convert_path(converter, input_path, args)
+        except Exception as e:
+            success, message = False, str(e)
+        print(f"[{'ok' if success else 'failed'}] {input_path}: {message}")
+        failures += not success
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(join_page_values(argv))
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,144 +1,303 @@
 import os
-import yaml
+import shutil
 import asyncio
-from pyzerox import zerox
-from pathlib import Path
-import subprocess
 import tempfile
+from pathlib import Path
+import weakref
+import logging
+import threading
+from contextlib import asynccontextmanager
 from pyzerox import models
+from model_registry import get_config_store
+from cancellation import CancelToken, OperationCancelled
+from tiling import TILING_MODES
+from batching import PageBatcher
+from workspace import WorkspaceManager
+from state_index import StateIndex, STATE_DIR_NAME
+from search_index import SearchIndex, INDEX_FILE_NAME, DEFAULT_TOKENIZER
+from page_selection import PageSelection, PageSelectionError
+from logging_setup import correlation_scope
+from scheduler import PageScheduler, INTERACTIVE, BULK
+from quality import QualityGate
+from profiling import Profiler
+from system_tools import get_tools, WorkerLimits, OfficePool
+import pipeline
+import chunking
 # Add this line to make model validation always return true, as there seems to be an issue with Volcano model validation
 models.litellmmodel.validate_model = lambda self: True
 
+# Credentials are passed per request instead of through os.environ, so only
+# fall back to zerox's environment checks when none were given
+_validate_environment = models.litellmmodel.validate_environment
+_validate_access = models.litellmmodel.validate_access
+
+def _has_credentials(kwargs):
+    return any(kwargs.get(kwarg) for kwarg in ("api_key", "aws_access_key_id", "aws_profile_name",
+                                               "vertex_credentials", "azure_ad_token"))
+
+def _validate_environment_unless_credentials(self):
+    if not _has_credentials(self.kwargs):
+        _validate_environment(self)
+
+def _validate_access_unless_credentials(self):
+    if not _has_credentials(self.kwargs):
+        _validate_access(self)
+
+models.litellmmodel.validate_environment = _validate_environment_unless_credentials
+models.litellmmodel.validate_access = _validate_access_unless_credentials
+
+logger = logging.getLogger(__name__)
+
+# Formats converted to PDF before OCR
+NEED_PDF_CONVERSION = {
+    "doc", "docx", "odt", "ott", "rtf", "txt", "html", "htm",
+    "xml", "wps", "wpd", "xls", "xlsx", "ods", "ots", "csv",
+    "tsv", "ppt", "pptx", "odp", "otp", "jpg", "jpeg", "png",
+    "gif", "bmp", "tiff", "webp"
+}
+# Of those, converted with GraphicsMagick (or Pillow) instead of LibreOffice
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp"}
+
+
+def image_to_pdf(image_path, output_pdf):
+    """Convert an image to PDF with Pillow, for machines without GraphicsMagick"""
+    from PIL import Image, ImageSequence
+    with Image.open(image_path) as image:
+        frames = [frame.convert("RGB") for frame in ImageSequence.Iterator(image)]
+    frames[0].save(output_pdf, "PDF", save_all=True, append_images=frames[1:])
+
+
+@asynccontextmanager
+async def _no_slot():
+    yield None
+
+
 class PDFConverterTool:
-    def __init__(self):
-        self.config_file = "config.yaml"
-        self.model_map = {}
+    def __init__(self, config_file="config.yaml"):
+        self.config_file = config_file
+        self.config_store = get_config_store(self.config_file)
         self.current_model_id = None
-        self.load_config()
-        
+        # Event loop -> {(model_id, credentials): PageBatcher}
+        self._batchers = weakref.WeakKeyDictionary()
+        # Event loop -> PageScheduler shared by every conversion on it
+        self._schedulers = weakref.WeakKeyDictionary()
+        # Index file -> SearchIndex
+        self._search_indexes = {}
+        # (model_id, credentials) -> fallback litellmmodel, built on first escalation
+        self._fallback_models = {}
+        self._fallback_lock = threading.Lock()
+        self.profiler = Profiler.from_config(self.registry.profiling)
+        self.workspaces = WorkspaceManager.from_config(self.registry.workspace)
+        self.limits = WorkerLimits.detect(self.registry.workers)
+        self.office_pool = OfficePool(self.limits.office_workers)
+
+    @property
+    def registry(self):
+        """Current validated model registry (hot-reloaded on config change)"""
+        return self.config_store.registry
+
+    @property
+    def model_map(self):
+        """Model display name to ID mapping"""
+        return self.registry.model_map
+
     def load_config(self):
-        """Load configuration"""
-        try:
-            with open(self.config_file, "r", encoding="utf-8") as f:
-                self.config = yaml.safe_load(f)
-            self.setup_model_map()
-        except Exception as e:
-            print(f"Failed to load config file: {str(e)}")
-            self.config = {"vendors": []}
-            
-    def setup_model_map(self):
-        """Setup model name to ID mapping"""
-        try:
-            for vendor in self.config.get("vendors", []):
-                for model in vendor.get("models", []):
-                    name = model.get("name", "")
-                    model_id = model.get("model_id", "")
-                    if name and model_id:
-                        self.model_map[name] = model_id
-        except Exception as e:
-            print(f"Error setting up model map: {str(e)}")
-            
+        """Reload configuration from disk"""
+        self.config_store.reload()
+
     def get_model_list(self):
         """Get list of available models"""
-        try:
-            model_list = []
-            for vendor in self.config.get("vendors", []):
-                vendor_name = vendor.get("name", "")
-                if vendor_name:
-                    model_list.append(f"───── {vendor_name} ─────")
-                    for model in vendor.get("models", []):
-                        name = model.get("name", "")
-                        if name:
-                            model_list.append(name)
-            return model_list
-        except Exception as e:
-            print(f"Error getting model list: {str(e)}")
-            return []
-            
+        return self.registry.get_model_list()
+
     def set_current_model(self, model_id):
-        """Set current model and update environment variables"""
+        """Set the default model used when a request doesn't name one"""
         if not model_id:
             return False
-            
-        try:
-            for vendor in self.config.get("vendors", []):
-                for model in vendor.get("models", []):
-                    if model.get("model_id") == model_id:
-                        # Set environment variables
-                        for env_var in model.get("env_vars", []):
-                            key = env_var.get("key", "")
-                            value = env_var.get("value", "")
-                            if key and value:
-                                os.environ[key] = value
-                                print(f"Set environment variable: {key}")
-                        
-                        self.current_model_id = model_id
-                        return True
-                        
-            return False
-            
-        except Exception as e:
-            print(f"Error setting current model: {str(e)}")
+
+        if self.registry.get(model_id) is None:
+            logger.warning("Unknown model: %s", model_id)
             return False
-            
+
+        self.current_model_id = model_id
+        return True
+
+    def get_batcher(self, model_id, vision_model):
+        """Shared PageBatcher for a model on the running event loop
+
+        Budgets come from the `batching` section of config.yaml; an edited
+        section starts a new batcher.
+        """
+        loop = asyncio.get_running_loop()
+        batchers = self._batchers.setdefault(loop, {})
+        settings = self.registry.batching
+        key = (model_id, tuple(sorted(vision_model.kwargs.items())), tuple(sorted(settings.items())))
+        if key not in batchers:
+            batchers[key] = PageBatcher.from_config(vision_model, settings)
+        return batchers[key]
+
+    @property
+    def tools(self):
+        """External converters found on this machine (probed on first use)"""
+        return get_tools(self.registry.tools)
+
+    def get_scheduler(self):
+        """PageScheduler for the running event loop
+
+        Built from the `scheduling` section of config.yaml the first time a
+        loop converts something; later edits apply to new loops only.
+        Priorities only arbitrate between conversions running concurrently
+        on this loop: the GUI, a CLI run and each worker process have their
+        own scheduler and don't yield to each other.
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._schedulers:
+            self._schedulers[loop] = PageScheduler.from_config(self.registry.scheduling)
+        return self._schedulers[loop]
+
+    def get_quality_gate(self, model_id):
+        """QualityGate escalating to the model's configured fallback, or None if disabled"""
+        if self.registry.quality.get("enabled") is False:
+            return None
+        fallback = self.registry.get_fallback(model_id)
+        if fallback is None:
+            return QualityGate()
+        return QualityGate(
+            fallback_model_id=fallback.model_id,
+            fallback_factory=lambda: self._fallback_model(fallback),
+        )
+
+    def _fallback_model(self, spec):
+        """Cached litellmmodel for a fallback model
+
+        Creating one validates the model's environment, which may make a
+        request, so it only happens once a page actually fails.
+        """
+        credentials = spec.completion_kwargs()
+        key = (spec.model_id, tuple(sorted(credentials.items())))
+        with self._fallback_lock:
+            if key not in self._fallback_models:
+                self._fallback_models[key] = models.litellmmodel(model=spec.model_id, **credentials)
+            return self._fallback_models[key]
+
+    def get_search_index(self, output_dir):
+        """SearchIndex converted pages are added to, or None unless enabled in config.yaml
+
+        The index lives in the output folder unless `search.path` names a
+        single index for every folder.
+        """
+        settings = self.registry.search
+        if not settings.get("enabled"):
+            return None
+        db_path = settings.get("path") or os.path.join(output_dir, STATE_DIR_NAME, INDEX_FILE_NAME)
+        db_path = os.path.abspath(db_path)
+        if db_path not in self._search_indexes:
+            try:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                self._search_indexes[db_path] = SearchIndex(
+                    db_path, tokenizer=settings.get("tokenizer") or DEFAULT_TOKENIZER
+                )
+            except Exception as e:
+                # e.g. an SQLite build without FTS5; conversions carry on unindexed
+                logger.warning("Search index unavailable at %s: %s", db_path, e)
+                return None
+        return self._search_indexes[db_path]
+
+    @asynccontextmanager
+    async def _workspace_for(self, input_path, workspace=None):
+        """Use the caller's workspace, or a scoped one removed on exit"""
+        if workspace is not None:
+            yield workspace
+        else:
+            async with self.workspaces.workspace(input_path) as ws:
+                yield ws
+
     def get_downloads_dir(self):
         """Get user's downloads directory"""
         return str(Path.home() / "Downloads")
         
-    async def convert_to_pdf(self, input_path):
-        """Convert other formats to PDF"""
+    async def convert_to_pdf(self, input_path, cancel_token=None, workspace=None):
+        """Convert other formats to PDF
+
+        The PDF is written into `workspace` and removed with it. Without a
+        workspace the converter's scratch files are removed when the call
+        ends and the PDF is returned as a temporary file the caller deletes.
+        The converter subprocess is killed if `cancel_token` is cancelled or
+        its deadline passes. LibreOffice runs in one of `office_pool`'s slots.
+        """
+        cancel_token = cancel_token or CancelToken()
+        if workspace is None:
+            async with self.workspaces.workspace(input_path) as scratch:
+                pdf_path = await self.convert_to_pdf(input_path, cancel_token, scratch)
+                fd, output_pdf = tempfile.mkstemp(prefix="ocr2md_", suffix=".pdf", dir=self.workspaces.root)
+                os.close(fd)
+                shutil.move(pdf_path, output_pdf)
+                return output_pdf
         try:
-            # Create temporary directory
-            temp_dir = tempfile.mkdtemp()
+            temp_dir = workspace.path
             try:
                 # Get input filename and extension
                 input_filename = os.path.splitext(os.path.basename(input_path))[0]
                 input_ext = os.path.splitext(input_path)[1].lower()
                 
-                print(f"Input filename: {input_filename}")  # Debug log
-                print(f"Input extension: {input_ext}")  # Debug log
+                logger.debug("Input filename: %s, extension: %s", input_filename, input_ext)
+                
+                # Probing a tool the first time can take seconds, keep it off the loop
+                tools = await asyncio.to_thread(get_tools, self.registry.tools)
                 
                 # Check if input is an image
-                image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-                if input_ext in image_extensions:
-                    # Use GraphicsMagick to convert image to PDF
+                if input_ext.lstrip('.') in IMAGE_EXTENSIONS:
                     output_pdf = os.path.join(temp_dir, f"{input_filename}.pdf")
-                    cmd = [
-                        "gm",
-                        "convert",
-                        input_path,
-                        output_pdf
-                    ]
+                    gm = tools.get("gm")
+                    if gm is None:
+                        # No GraphicsMagick on this machine: Pillow does the same job
+                        async with workspace.reserve(2 * os.path.getsize(input_path), cancel_token):
+                            await cancel_token.guard(asyncio.to_thread(image_to_pdf, input_path, output_pdf))
+                        workspace.track(output_pdf)
+                        return output_pdf
+                    cmd = [gm, "convert", input_path, output_pdf]
+                    slot = _no_slot()
                 else:
-                    # Use LibreOffice for other formats
-                    cmd = [
-                        "/Applications/LibreOffice.app/Contents/MacOS/soffice",
-                        "--headless",
-                        "--convert-to", "pdf",
-                        "--outdir", temp_dir,
-                        input_path
-                    ]
-                
-                print(f"Execute command: {' '.join(cmd)}")  # Debug log
+                    soffice = tools.get("soffice")
+                    if soffice is None:
+                        raise Exception(
+                            "LibreOffice (soffice) not found; install it or set OCR2MD_SOFFICE to its path"
+                        )
+                    cmd = [soffice, "--headless", "--convert-to", "pdf", "--outdir", temp_dir, input_path]
+                    slot = self.office_pool.slot(cancel_token)
                 
-                # Execute command synchronously
-                process = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    check=False  # Don't raise exception automatically
-                )
+                # Execute command without blocking the event loop; hold quota for
+                # the output (estimated at twice the input) while it is produced
+                async with workspace.reserve(2 * os.path.getsize(input_path), cancel_token):
+                    async with slot as profile:
+                        if profile:
+                            # A private profile, so concurrent soffice processes don't collide
+                            cmd.insert(1, profile)
+                        logger.debug("Execute command: %s", cmd)
+                        process = await asyncio.create_subprocess_exec(
+                            *cmd,
+                            stdout=asyncio.subprocess.PIPE,
+                            stderr=asyncio.subprocess.PIPE
+                        )
+                        try:
+                            with self.profiler.stage("convert_to_pdf"):
+                                stdout, stderr = await cancel_token.guard(process.communicate())
+                        finally:
+                            if process.returncode is None:
+                                # Cancelled or timed out: stop the converter right away
+                                process.kill()
+                                await process.wait()
+                stdout = stdout.decode(errors="replace")
+                stderr = stderr.decode(errors="replace")
                 
-                print(f"Command output: {process.stdout}")  # Debug log
-                print(f"Error output: {process.stderr}")  # Debug log
-                print(f"Return code: {process.returncode}")  # Debug log
+                logger.debug("Converter exited with %s", process.returncode,
+                             extra={"stdout": stdout, "stderr": stderr})
                 
                 if process.returncode != 0:
-                    raise Exception(f"File conversion failed: {process.stderr}")
+                    raise Exception(f"File conversion failed: {stderr}")
                 
                 # Check files in temporary directory
                 temp_files = os.listdir(temp_dir)
-                print(f"Temporary directory contents: {temp_files}")  # Debug log
+                logger.debug("Temporary directory contents: %s", temp_files)
                 
                 # Find generated PDF file
                 pdf_files = [f for f in temp_files if f.endswith('.pdf')]
@@ -147,124 +306,258 @@ class PDFConverterTool:
                 
                 # Use first found PDF file
                 temp_pdf = os.path.join(temp_dir, pdf_files[0])
-                print(f"Found PDF file: {temp_pdf}")  # Debug log
+                logger.debug("Found PDF file: %s", temp_pdf)
                 
                 if not os.path.exists(temp_pdf):
                     raise Exception(f"PDF file does not exist: {temp_pdf}")
                 
                 # Check file size
                 file_size = os.path.getsize(temp_pdf)
-                print(f"PDF file size: {file_size} bytes")  # Debug log
+                logger.debug("PDF file size: %d bytes", file_size)
                 
                 if file_size == 0:
                     raise Exception("Generated PDF file is empty")
                 
+                workspace.track(temp_pdf)
                 return temp_pdf
                 
+            except OperationCancelled:
+                raise
             except Exception as e:
-                print(f"Conversion error details: {str(e)}")  # Debug log
+                logger.error("PDF conversion failed: %s", e)
                 raise Exception(f"Failed to convert to PDF: {str(e)}")
                 
+        except OperationCancelled:
+            raise
         except Exception as e:
-            print(f"Conversion error details: {str(e)}")  # Debug log
+            logger.debug("Conversion error details: %s", e)
             raise Exception(f"Failed to convert to PDF: {str(e)}")
-        finally:
-            # Don't delete temporary directory as we need to return its file
-            pass
             
-    async def convert_file(self, input_path, pages=None):
-        """Convert file to markdown"""
-        try:
-            # Check if model is selected
-            if not self.current_model_id:
-                return False, "No model selected"
+    async def convert_file(self, input_path, pages=None, model_id=None, on_progress=None,
+                           cancel_token=None, timeout=None, page_timeout=None, tiling="off",
+                           batch_pages=False, workspace=None, output_dir=None, page_cache=None,
+                           priority=INTERACTIVE, maintain_format=None):
+        """Convert file to markdown
+
+        Args:
+            input_path: File to convert
+            pages: Selection string such as "1,3,5-10,-1", a PageSelection,
+                page number or list of page numbers (optional, defaults to all).
+                Only the selected pages are rendered and recognised.
+            model_id: Model to use (optional, defaults to the current model)
+            on_progress: Callback receiving pipeline.ProgressEvent (optional).
+                Called from the converting thread.
+            cancel_token: CancelToken to abort the conversion (optional)
+            timeout: Deadline in seconds for the whole document (optional,
+                defaults to the priority class's timeout)
+            page_timeout: Deadline in seconds for each page (optional)
+            tiling: "off", "auto" (tile oversized or dense pages) or "always".
+                Tiles overlap and are recognised concurrently, then stitched.
+            batch_pages: Pack small pages from this and other concurrent
+                conversions on the same model into multi-image requests
+            workspace: Workspace for page images (optional). A temporary one
+                is created and removed when the conversion ends otherwise.
+            output_dir: Directory for the Markdown file (optional, defaults to Downloads)
+            page_cache: state_index.PageCache of previously recognised pages (optional)
+            priority: Scheduling class, "interactive" (default) or "bulk" or
+                any class from config.yaml. Model requests of all running
+                conversions are shared out between classes by get_scheduler().
+            maintain_format: Give each page the previous page's Markdown as
+                context (optional). This recognises consecutive pages one at
+                a time, so it defaults to on for whole documents only; page
+                selections run their pages concurrently unless it is set.
+
+        Large selections are split into chunks converted in parallel and
+        checkpointed under output_dir, so a failed or cancelled run resumes
+        where it stopped when retried.
+
+        Raises:
+            OperationCancelled: The token was cancelled or a deadline passed
+        """
+        # Every record logged while converting carries this document's correlation ID
+        with correlation_scope(document=input_path), self.profiler.document(input_path) as profile:
+            scheduler = self.get_scheduler()
+            try:
+                policy = scheduler.policy(priority)
+            except ValueError as e:
+                return False, str(e)
+            if timeout is None:
+                timeout = policy.timeout
+            cancel_token = (cancel_token or CancelToken()).child(timeout=timeout)
+            try:
+                # Check if model is selected
+                model_id = model_id or self.current_model_id
+                if not model_id:
+                    return False, "No model selected"
+
+                model = self.registry.get(model_id)
+                if model is None:
+                    return False, f"Unknown model: {model_id}"
                 
-            # Check input file
-            if not os.path.exists(input_path):
-                return False, "Input file not found"
+                # Check input file
+                if not os.path.exists(input_path):
+                    return False, "Input file not found"
+
+                if tiling not in TILING_MODES:
+                    return False, f"Invalid tiling mode: {tiling}"
                 
-            # Get user's downloads directory
-            output_dir = self.get_downloads_dir()
+                # Default to user's downloads directory
+                output_dir = output_dir or self.get_downloads_dir()
                 
-            # Format pages parameter for zerox
-            select_pages = None
-            if pages:
-                if isinstance(pages, list):
-                    select_pages = pages  # Keep as list
-                    print(f"Using page list: {select_pages}")  # Debug print
-                else:
-                    # If it's a single page number
-                    try:
-                        select_pages = int(pages)
-                        print(f"Using single page: {select_pages}")  # Debug print
-                    except (ValueError, TypeError):
-                        return False, "Invalid page format"
+                # Strings like "1,3,5-10,-1" are resolved once the page count is known
+                try:
+                    selection = PageSelection.coerce(pages)
+                except PageSelectionError as e:
+                    return False, str(e)
             
-            # Print debug info
-            print("\n=== Zerox Request Parameters ===")
-            print(f"Input file: {input_path}")
-            print(f"Output directory: {output_dir}")
-            print(f"Model ID: {self.current_model_id}")
-            print(f"Pages parameter: {pages}")
-            print(f"Formatted pages: {select_pages}")
-            print(f"Environment variables:")
-            for key in ['OPENAI_API_BASE', 'OPENAI_API_KEY', 'ANTHROPIC_API_KEY', 'VOLCENGINE_API_KEY']:
-                value = os.environ.get(key, 'Not set')
-                # Mask API keys for security
-                if 'API_KEY' in key and value != 'Not set':
-                    value = value[:6] + '...' + value[-4:]
-                print(f"  {key}: {value}")
-            print("=============================\n")
+                # Print debug info
+                credentials = model.completion_kwargs()
+                logger.info("Converting %s", input_path, extra={
+                    "output_dir": output_dir,
+                    "model_id": model_id,
+                    "pages": str(selection or "all"),
+                    "tiling": tiling,
+                    "batch_pages": batch_pages,
+                    "priority": priority,
+                    "credentials": ",".join(sorted(credentials)) or "environment",
+                })
             
-            # Create output directory if needed
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+                # Create output directory if needed
+                if not os.path.exists(output_dir):
+                    os.makedirs(output_dir)
+
+                output_file = os.path.join(output_dir, pipeline.output_file_name(input_path)) + ".md"
+                checkpoint = None
+                quality_gate = None
+                search_index = self.get_search_index(output_dir)
+                doc_id = None
+                try:
+                    # Convert file page by page so progress can be reported
+                    tools = await asyncio.to_thread(get_tools, self.registry.tools)
+                    with self.profiler.stage("page_count", profile):
+                        page_count = await pipeline.get_page_count(
+                            input_path, cancel_token=cancel_token, poppler_path=tools.poppler_path
+                        )
+                    if selection is None:
+                        page_list = list(range(1, page_count + 1))
+                    else:
+                        try:
+                            page_list = selection.resolve(page_count)
+                        except PageSelectionError as e:
+                            return False, str(e)
+                        if not page_list:
+                            return False, f"No pages selected (document has {page_count} pages)"
+
+                    pipeline.emit(on_progress, input_path, "started", total=len(page_list))
+                    vision_model = models.litellmmodel(model=model_id, **credentials)
+                    quality_gate = self.get_quality_gate(model_id)
+                    if search_index is not None:
+                        # Pages are indexed as they come out; the document becomes searchable once written
+                        doc_id = await asyncio.to_thread(search_index.begin_document,
+                                                    os.path.abspath(output_file), input_path, model_id)
+                    page_options = dict(
+                        # 只在不选择页面时保持格式; 选择页面时并发处理
+                        maintain_format=selection is None if maintain_format is None else maintain_format,
+                        on_progress=on_progress,
+                        cancel_token=cancel_token,
+                        page_timeout=page_timeout,
+                        tiling=tiling,
+                        batcher=self.get_batcher(model_id, vision_model) if batch_pages else None,
+                        page_cache=page_cache,
+                        scheduler=scheduler,
+                        priority=priority,
+                        quality_gate=quality_gate,
+                        on_page=(lambda page, markdown: search_index.add_page(doc_id, page, markdown))
+                        if doc_id is not None else None,
+                        poppler_path=tools.poppler_path,
+                    )
+                    with self.profiler.stage("pages", profile):
+                        async with self._workspace_for(input_path, workspace) as ws:
+                            if chunking.should_chunk(input_path, len(page_list)):
+                                # Large documents run as parallel chunks that survive a failed run
+                                checkpoint = await chunking.ChunkCheckpoint.for_document(output_dir, input_path, model_id)
+                                page_results = await chunking.process_chunked(
+                                    input_path, page_list, vision_model, ws, checkpoint, **page_options
+                                )
+                            else:
+                                page_results = await pipeline.process_pages(
+                                    input_path, page_list, vision_model, ws, **page_options
+                                )
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    error_msg = str(e)
+                    if "BadRequestError" in error_msg:
+                        return False, "API请求错误，请检查API密钥是否正确设置"
+                    else:
+                        raise  # 重新抛出其他类型的异常
+
+                if quality_gate is not None and quality_gate.failed:
+                    logger.info("%d page(s) failed quality checks, %d re-recognised by %s",
+                                quality_gate.failed, quality_gate.escalated,
+                                quality_gate.fallback_model_id or "no fallback model")
+
+                aggregated_markdown = [page_results[p] for p in page_list if page_results.get(p)]
+                if not aggregated_markdown:
+                    return False, "Conversion failed"
+
+                with self.profiler.stage("write", profile), open(output_file, "w", encoding="utf-8") as f:
+                    f.write("\n\n".join(aggregated_markdown))
 
-            try:
-                # Convert file
-                result = await zerox(
-                    file_path=input_path,
-                    model=self.current_model_id,
-                    output_dir=output_dir,
-                    cleanup=True,
-                    maintain_format=select_pages is None,  # 只在不选择页面时保持格式
-                    select_pages=select_pages
-                )
-            except Exception as e:
-                error_msg = str(e)
-                if "BadRequestError" in error_msg:
-                    return False, "API请求错误，请检查API密钥是否正确设置"
-                else:
-                    raise  # 重新抛出其他类型的异常
-            
-            if result and result.file_name:
-                output_file = os.path.join(output_dir, result.file_name)+".md"
                 if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+                    if checkpoint is not None:
+                        checkpoint.remove()
+                    if doc_id is not None:
+                        try:
+                            await asyncio.to_thread(search_index.finish_document, doc_id, [
+                                (p, page_results[p]) for p in page_list if page_results.get(p)
+                            ])
+                        except Exception as e:
+                            logger.warning("Failed to index %s: %s", output_file, e)
                     return True, output_file
                 else:
                     return False, "Output file not generated"
-            else:
-                return False, "Conversion failed"
                 
-        except Exception as e:
-            error_msg = str(e)
-            if "rate limit" in error_msg.lower():
-                return False, "API调用频率超限，请稍后重试"
-            elif "api key" in error_msg.lower():
-                return False, "API密钥无效或未设置"
-            else:
-                return False, f"转换错误: {error_msg}"
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                error_msg = str(e)
+                if "rate limit" in error_msg.lower():
+                    return False, "API调用频率超限，请稍后重试"
+                elif "api key" in error_msg.lower():
+                    return False, "API密钥无效或未设置"
+                else:
+                    return False, f"转换错误: {error_msg}"
+            finally:
+                cancel_token.release()
             
-    async def batch_convert(self, input_folder, output_folder=None):
+    async def batch_convert(self, input_folder, output_folder=None, model_id=None,
+                            cancel_token=None, timeout=None, page_timeout=None, tiling="off",
+                            batch_pages=False, concurrency=1, incremental=False, priority=BULK):
         """
         Batch convert PDF files
         
         Args:
             input_folder: Input folder path
             output_folder: Output folder path (optional, uses downloads directory by default)
+            model_id: Model to use (optional, defaults to the current model)
+            cancel_token: CancelToken to stop the batch (optional)
+            timeout: Deadline in seconds for each document (optional)
+            page_timeout: Deadline in seconds for each page (optional)
+            tiling: Tiling mode passed to convert_file (optional)
+            batch_pages: Pack small pages into multi-image requests (optional).
+                Only useful with concurrency > 1, e.g. for single-page documents.
+            concurrency: Number of documents converted at the same time
+            incremental: Skip files unchanged since the last run into this
+                output folder, and re-recognise only the changed pages of
+                modified PDFs (optional)
+            priority: Scheduling class of the batch's documents (defaults to
+                "bulk", which yields model requests to interactive conversions)
         """
+        cancel_token = cancel_token or CancelToken()
         # Check if model is selected
-        if not self.current_model_id:
+        model_id = model_id or self.current_model_id
+        if not model_id:
             return [{"error": "No model selected"}]
             
         # If no output folder specified, create one in downloads directory
@@ -274,15 +567,61 @@ class PDFConverterTool:
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
             
-        results = []
-        for filename in os.listdir(input_folder):
-            if filename.lower().endswith('.pdf'):
-                input_path = os.path.join(input_folder, filename)
-                success, message = await self.convert_file(input_path=input_path)
-                results.append({
-                    'filename': filename,
-                    'success': success,
-                    'message': message
-                })
-                
-        return results 
\ No newline at end of file
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        state = StateIndex(output_folder) if incremental else None
+        
+        async def convert_one(filename):
+            input_path = os.path.join(input_folder, filename)
+            page_cache = None
+            digest = None
+            if state is not None:
+                unchanged, digest = await asyncio.to_thread(state.check, input_path, model_id)
+                if unchanged:
+                    return {
+                        'filename': filename,
+                        'success': True,
+                        'message': state.files[state.key(input_path)]["output"],
+                        'skipped': True
+                    }
+                page_cache = await asyncio.to_thread(state.page_cache, input_path, model_id)
+            async with semaphore:
+                try:
+                    success, message = await self.convert_file(
+                        input_path=input_path,
+                        model_id=model_id,
+                        cancel_token=cancel_token,
+                        timeout=timeout,
+                        page_timeout=page_timeout,
+                        tiling=tiling,
+                        batch_pages=batch_pages,
+                        output_dir=output_folder,
+                        page_cache=page_cache,
+                        priority=priority
+                    )
+                except OperationCancelled as e:
+                    if cancel_token.cancelled or cancel_token.expired:
+                        raise
+                    # Only this document ran out of time; carry on with the rest
+                    success, message = False, str(e)
+            if state is not None and success:
+                await asyncio.to_thread(state.update, input_path, model_id, message, page_cache, digest)
+                # index.json is rewritten at most every SAVE_INTERVAL during the batch
+                await asyncio.to_thread(state.save, False)
+                logger.info("Reused %d unchanged page(s) of %s", page_cache.hits, filename)
+            return {
+                'filename': filename,
+                'success': success,
+                'message': message
+            }
+            
+        filenames = [f for f in os.listdir(input_folder) if f.lower().endswith('.pdf')]
+        try:
+            results = list(await asyncio.gather(*(convert_one(f) for f in filenames)))
+            if state is not None:
+                await asyncio.to_thread(state.prune, input_folder,
+                                        [os.path.join(input_folder, f) for f in filenames])
+        finally:
+            # Also on cancellation, so finished files are skipped next time
+            if state is not None:
+                await asyncio.to_thread(state.save)
+        return results
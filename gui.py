@@ -1,34 +1,54 @@
 import tkinter as tk
 import customtkinter as ctk
-from tkinter import filedialog, messagebox
-from converter import PDFConverterTool
+from tkinter import filedialog, messagebox, ttk
+from converter import PDFConverterTool, NEED_PDF_CONVERSION
+from pipeline import ProgressEvent
+from cancellation import CancelToken, DeadlineExceeded, OperationCancelled
 import os
 import asyncio
 import threading
+import queue
+import itertools
 import logging
-from datetime import datetime
 import yaml
+from logging_setup import setup_logging_from_config, correlation_scope
+from page_selection import PageSelection, PageSelectionError
+
+# Drag and drop is optional; it needs the tkinterdnd2 package
+try:
+    from tkinterdnd2 import TkinterDnD, DND_FILES
+except ImportError:
+    TkinterDnD = None
+
+SUPPORTED_EXTENSIONS = NEED_PDF_CONVERSION | {"pdf"}
+PAGE_PLACEHOLDER = "Example: 1,3,5-10,20-,-1 or leave empty for all"
+
+# Number of documents converted at the same time
+MAX_CONCURRENT_FILES = 3
 
 # Configure logging
-def setup_logger():
-    # Create logs directory
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    # Generate log filename with timestamp
-    log_filename = os.path.join('logs', f'pdf_converter_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
-    
-    # Configure log format
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename, encoding='utf-8'),
-            logging.StreamHandler()  # Output to console as well
-        ]
-    )
+def setup_logger(settings=None):
+    """Start queue-based logging configured by the `logging` section of config.yaml"""
+    setup_logging_from_config(settings, log_dir='logs')
     return logging.getLogger(__name__)
 
+logger = logging.getLogger(__name__)
+
+class AsyncRunner:
+    """Runs an asyncio event loop in a background thread"""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine; cancelling the returned future cancels the task"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
 class PDFConverterGUI:
     def __init__(self, root):
         self.root = root
@@ -39,10 +59,17 @@ class PDFConverterGUI:
         self.converter = PDFConverterTool()
         
         # Initialize variables
-        self.input_path = None
         self.is_converting = False
         self.default_model_set = False
         
+        # Conversion queue. Worker callbacks only put events on self.events;
+        # widgets are updated from the Tk thread in poll_events.
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.events = queue.Queue()
+        self.runner = AsyncRunner()
+        self.file_slots = None
+        
         # Setup styles
         self.bg_color = '#f5f5f5'  # Light gray background
         self.card_bg = '#ffffff'   # White card background
@@ -59,9 +86,11 @@ class PDFConverterGUI:
         self.center_window()
         
         # Initialize logger
-        self.logger = setup_logger()
+        self.logger = setup_logger(self.converter.registry.logging)
         self.logger.info("OCR started")
         
+        self.root.after(100, self.poll_events)
+        
     def create_widgets(self):
         # Main container
         self.main_frame = ctk.CTkFrame(self.root, fg_color=self.bg_color, border_width=0)
@@ -73,9 +102,18 @@ class PDFConverterGUI:
         
         self.file_entry = ctk.CTkEntry(self.file_frame, border_width=1, fg_color=self.bg_color)
         self.file_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10, pady=10)
-        self.file_entry.insert(0, "Select file to convert...")
+        self.file_entry.insert(0, "Select files to convert...")
         self.file_entry.configure(state="readonly")
         
+        self.folder_btn = ctk.CTkButton(
+            self.file_frame,
+            text="Add Folder",
+            command=self.select_folder,
+            fg_color=self.button_color,
+            hover_color=self.button_hover_color
+        )
+        self.folder_btn.pack(side=tk.RIGHT, padx=(0, 10), pady=10)
+        
         self.file_btn = ctk.CTkButton(
             self.file_frame,
             text="Browse",
@@ -129,11 +167,11 @@ class PDFConverterGUI:
                     self.model_var.set(item)
                     self.converter.set_current_model(model_id)
                     self.default_model_set = True
-                    print(f"Default model set to: {item}")
+                    logger.info("Default model set to: %s", item)
                     break
                     
         if not self.default_model_set:
-            print("Warning: No default model set")
+            logger.warning("No default model set")
         
         # Page selection
         self.page_frame = ctk.CTkFrame(self.options_frame, border_width=0, fg_color=self.card_bg)
@@ -144,7 +182,7 @@ class PDFConverterGUI:
         
         self.page_entry = ctk.CTkEntry(self.page_frame, fg_color=self.card_bg)
         self.page_entry.pack(side=tk.LEFT, padx=(5, 0))
-        self.page_entry.insert(0, "Example: 1,2,3 or 1-5 or leave empty for all")
+        self.page_entry.insert(0, PAGE_PLACEHOLDER)
         
         # Button area
         self.button_frame = ctk.CTkFrame(self.main_frame, border_width=0, fg_color=self.bg_color)
@@ -173,6 +211,33 @@ class PDFConverterGUI:
         )
         self.stop_btn.pack(side=tk.LEFT)
         
+        self.clear_btn = ctk.CTkButton(
+            self.button_frame,
+            text="Clear Finished",
+            command=self.clear_finished,
+            fg_color="#9e9e9e",
+            hover_color="#757575"
+        )
+        self.clear_btn.pack(side=tk.RIGHT)
+        
+        # Queue / progress table
+        self.queue_frame = ctk.CTkFrame(self.main_frame, fg_color=self.card_bg, border_width=0)
+        self.queue_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        
+        self.queue_tree = ttk.Treeview(
+            self.queue_frame,
+            columns=("status", "pages"),
+            height=8
+        )
+        self.queue_tree.heading("#0", text="File")
+        self.queue_tree.heading("status", text="Status")
+        self.queue_tree.heading("pages", text="Pages")
+        self.queue_tree.column("#0", width=380)
+        self.queue_tree.column("status", width=200)
+        self.queue_tree.column("pages", width=80, anchor=tk.CENTER)
+        self.queue_tree.pack(fill=tk.BOTH, expand=True)
+        self.enable_drop()
+        
         # Status display area
         self.status_frame = ctk.CTkFrame(self.main_frame, fg_color=self.card_bg, border_width=0)
         self.status_frame.pack(fill=tk.BOTH, expand=True)
@@ -180,13 +245,28 @@ class PDFConverterGUI:
         self.status_text = ctk.CTkTextbox(
             self.status_frame,
             wrap="word",
-            height=180,
+            height=120,
             font=ctk.CTkFont(size=13),
             border_width=0,
             fg_color=self.card_bg
         )
         self.status_text.pack(fill="both", expand=True, padx=0, pady=0)
         
+    def enable_drop(self):
+        """Accept files and folders dropped on the queue (needs tkinterdnd2)"""
+        if TkinterDnD is None:
+            return
+        try:
+            TkinterDnD._require(self.root)
+            self.queue_tree.drop_target_register(DND_FILES)
+            self.queue_tree.dnd_bind("<<Drop>>", self.on_drop)
+        except Exception as e:
+            logger.warning("Drag and drop unavailable: %s", e)
+            
+    def on_drop(self, event):
+        """Handle files or folders dropped on the queue"""
+        self.add_paths(self.root.tk.splitlist(event.data))
+        
     def select_file(self):
         """Handle file selection"""
         filetypes = [
@@ -205,60 +285,147 @@ class PDFConverterGUI:
         ]
         
         try:
-            filepath = filedialog.askopenfilename(
+            filepaths = filedialog.askopenfilenames(
                 parent=self.root,
-                title="Select File to Convert",
+                title="Select Files to Convert",
                 filetypes=filetypes
             )
             
-            if filepath:
-                self.input_path = filepath
-                self.file_entry.configure(state="normal")
-                self.file_entry.delete(0, tk.END)
-                self.file_entry.insert(0, filepath)
-                self.file_entry.configure(state="readonly")
-                self.logger.info(f"Selected file: {filepath}")
+            if filepaths:
+                self.add_paths(filepaths)
         except Exception as e:
-            self.logger.error(f"Error selecting file: {str(e)}")
+            self.logger.error("Error selecting file: %s", e)
             messagebox.showerror("Error", f"Failed to select file: {str(e)}")
             
+    def select_folder(self):
+        """Queue every supported file in a folder"""
+        folder = filedialog.askdirectory(parent=self.root, title="Select Folder to Convert")
+        if folder:
+            self.add_paths([folder])
+            
+    def add_paths(self, paths):
+        """Add files, or supported files inside folders, to the queue"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    for filename in sorted(filenames):
+                        files.append(os.path.join(dirpath, filename))
+            else:
+                files.append(path)
+                
+        pending = {job["path"] for job in self.jobs.values() if job["state"] in ("queued", "running")}
+        added = 0
+        for filepath in files:
+            ext = os.path.splitext(filepath)[1].lower().lstrip('.')
+            if ext not in SUPPORTED_EXTENSIONS or filepath in pending:
+                continue
+            job_id = next(self.job_ids)
+            item = self.queue_tree.insert("", tk.END, text=os.path.basename(filepath), values=("Queued", ""))
+            self.jobs[job_id] = {"path": filepath, "item": item, "state": "queued", "future": None,
+                                 "token": CancelToken()}
+            pending.add(filepath)
+            added += 1
+            self.logger.info("Queued file: %s", filepath)
+            
+        self.file_entry.configure(state="normal")
+        self.file_entry.delete(0, tk.END)
+        self.file_entry.insert(0, f"{len(self.jobs)} file(s) in queue")
+        self.file_entry.configure(state="readonly")
+        if added == 0 and files:
+            self.update_status("No new supported files found")
+            
     def set_converting_state(self, is_converting):
         """Update UI state during conversion"""
         self.is_converting = is_converting
         
         if is_converting:
-            self.start_btn.configure(state="disabled")
             self.stop_btn.configure(
                 state="normal",
                 fg_color=self.error_color,
                 hover_color="#d32f2f"
             )
-            self.file_btn.configure(state="disabled")
         else:
-            self.start_btn.configure(state="normal")
             self.stop_btn.configure(
                 state="disabled",
                 fg_color="#9e9e9e",
                 hover_color="#d32f2f"
             )
-            self.file_btn.configure(state="normal")
             
     def update_status(self, message, level="info"):
-        """Update status text area"""
+        """Update status text area (Tk thread only)"""
         self.status_text.insert(tk.END, f"{message}\n")
         self.status_text.see(tk.END)
         
+    def post_status(self, message, level="info"):
+        """Queue a status message from a worker thread"""
+        self.events.put(("status", message, level))
+        
+    def poll_events(self):
+        """Apply worker events to the widgets"""
+        try:
+            while True:
+                event = self.events.get_nowait()
+                if event[0] == "status":
+                    self.update_status(event[1], event[2])
+                else:
+                    self.apply_progress(event[1], event[2])
+        except queue.Empty:
+            pass
+        
+        # Jobs cancelled before they got a conversion slot never report back
+        for job in self.jobs.values():
+            future = job["future"]
+            if future is not None and future.cancelled() and job["state"] in ("queued", "running"):
+                job["state"] = "cancelled"
+                self.queue_tree.item(job["item"], values=("Cancelled", self.queue_tree.set(job["item"], "pages")))
+        
+        running = any(job["state"] in ("queued", "running") and job["future"] is not None
+                      for job in self.jobs.values())
+        if self.is_converting and not running:
+            self.set_converting_state(False)
+        self.root.after(100, self.poll_events)
+        
+    def apply_progress(self, job_id, event):
+        """Update a queue row from a ProgressEvent"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        labels = {
+            "preparing": "Converting to PDF...",
+            "started": "Converting",
+            "page": "Converting",
+            "done": "Done",
+            "failed": "Failed",
+            "cancelled": "Cancelled",
+        }
+        status = labels.get(event.stage, event.stage)
+        if event.message and event.stage in ("failed", "done"):
+            status = f"{status}: {os.path.basename(event.message) if event.stage == 'done' else event.message}"
+        pages = f"{event.done}/{event.total}" if event.total else self.queue_tree.set(job["item"], "pages")
+        self.queue_tree.item(job["item"], values=(status, pages))
+        
+        if event.stage in ("done", "failed", "cancelled"):
+            job["state"] = event.stage
+        else:
+            job["state"] = "running"
+            
+    def clear_finished(self):
+        """Remove finished rows from the queue"""
+        for job_id, job in list(self.jobs.items()):
+            if job["state"] in ("done", "failed", "cancelled"):
+                self.queue_tree.delete(job["item"])
+                del self.jobs[job_id]
+        
     def show_settings(self):
         """Show settings dialog"""
         from settings import SettingsDialog
         dialog = SettingsDialog(self.root)
         self.root.wait_window(dialog)  # Wait for dialog to close
         
-        # Update environment variables
-        if hasattr(dialog, 'settings'):
-            for key, value in dialog.settings.items():
-                if value:  # Only set non-empty values
-                    os.environ[key] = value 
+        # Credentials are read per request from the reloaded config
+        self.converter.load_config()
+        self.model_menu.configure(values=self.converter.get_model_list())
         
     def on_model_select(self, display_name):
         """Handle model selection"""
@@ -271,96 +438,117 @@ class PDFConverterGUI:
             self.converter.set_current_model(model_id)
             
     def start_convert(self):
-        """Start conversion process"""
-        if not self.input_path:
+        """Start converting every queued file"""
+        queued = [job_id for job_id, job in self.jobs.items()
+                  if job["state"] == "queued" and job["future"] is None]
+        if not queued:
             messagebox.showerror("Error", "Please select a file to convert")
             return
             
         # Get selected pages
         pages = self.page_entry.get().strip()
         select_pages = None
-        if pages and pages != "Example: 1,2,3 or 1-5 or leave empty for all":
+        if pages and pages != PAGE_PLACEHOLDER:
             try:
-                # Parse page numbers
-                select_pages = []
-                # Split by comma and handle each part
-                parts = [p.strip() for p in pages.split(',')]
-                for part in parts:
-                    if '-' in part:
-                        # Handle range format (e.g. 1-5)
-                        start, end = map(int, part.split('-'))
-                        select_pages.extend(list(range(start, end + 1)))
-                    else:
-                        # Handle single page number
-                        select_pages.append(int(part))
-                self.logger.info(f"Parsed pages: {select_pages}")
-            except ValueError:
-                messagebox.showerror("Error", "Invalid page format")
+                # Ranges are resolved per file against its own page count
+                select_pages = PageSelection.parse(pages)
+                self.logger.info("Parsed pages: %s", select_pages)
+            except PageSelectionError as e:
+                messagebox.showerror("Error", f"Invalid page format: {str(e)}")
                 return
             
         # Start conversion
         self.set_converting_state(True)
-        self.update_status("Starting conversion...")
+        self.update_status(f"Starting conversion of {len(queued)} file(s)...")
         
-        # Run conversion in thread
-        threading.Thread(
-            target=lambda: asyncio.run(self.run_conversion(self.input_path, select_pages)),
-            daemon=True
-        ).start()
+        model_id = self.converter.current_model_id
+        for job_id in queued:
+            job = self.jobs[job_id]
+            job["future"] = self.runner.submit(
+                self.run_conversion(job_id, job["path"], select_pages, model_id, job["token"])
+            )
         
     def stop_convert(self):
-        """Stop conversion process"""
-        self.is_converting = False
-        self.update_status("Conversion stopped by user")
-        self.set_converting_state(False)
-        
-    async def run_conversion(self, input_path, pages=None):
-        """Run conversion process"""
-        try:
-            # Log conversion parameters
-            self.logger.info("\n=== Zerox Conversion Parameters ===")
-            self.logger.info(f"Input file: {input_path}")
-            self.logger.info(f"Output directory: {self.converter.get_downloads_dir()}")
-            self.logger.info(f"Selected pages: {pages}")
-            self.logger.info(f"Model ID: {self.converter.current_model_id}")
-            self.logger.info("================================\n")
+        """Cancel queued and running conversions"""
+        cancelled = 0
+        for job in self.jobs.values():
+            if job["state"] in ("queued", "running") and job["future"] is not None:
+                # The token aborts model requests and kills converter subprocesses;
+                # cancelling the future covers jobs still waiting for a slot
+                job["token"].cancel("Cancelled by user")
+                job["future"].cancel()
+                cancelled += 1
+        self.update_status(f"Conversion stopped by user ({cancelled} file(s) cancelled)")
+        
+    async def run_conversion(self, job_id, input_path, pages=None, model_id=None, cancel_token=None):
+        """Run conversion process for one queued file (event loop thread)"""
+        def on_progress(event):
+            self.events.put(("progress", job_id, event))
             
-            # Check if file needs conversion to PDF
-            file_ext = os.path.splitext(input_path)[1].lower().lstrip('.')
-            need_pdf_conversion = file_ext in [
-                "doc", "docx", "odt", "ott", "rtf", "txt", "html", "htm", 
-                "xml", "wps", "wpd", "xls", "xlsx", "ods", "ots", "csv", 
-                "tsv", "ppt", "pptx", "odp", "otp", "jpg", "jpeg", "png", 
-                "gif", "bmp", "tiff", "webp"
-            ]
+        if self.file_slots is None:
+            self.file_slots = asyncio.Semaphore(MAX_CONCURRENT_FILES)
             
-            if need_pdf_conversion:
-                self.logger.info(f"Converting {file_ext} file to PDF...")
-                self.update_status(f"Converting {file_ext} file to PDF...")
-                try:
-                    input_path = await self.converter.convert_to_pdf(input_path)
-                    self.logger.info(f"File converted to PDF: {input_path}")
-                    self.update_status("File converted to PDF successfully")
-                except Exception as e:
-                    self.logger.error(f"PDF conversion failed: {str(e)}")
-                    self.update_status(f"PDF conversion failed: {str(e)}", "error")
-                    return
-            
-            success, result = await self.converter.convert_file(
-                input_path,
-                pages=pages
-            )
-            
-            if success:
-                self.update_status(f"Conversion completed: {result}")
-            else:
-                self.update_status(f"Conversion failed: {result}", "error")
+        # Tag this job's records, including those from the converter, with one ID
+        with correlation_scope(document=input_path):
+            try:
+                async with self.file_slots:
+                    # Log conversion parameters
+                    self.logger.info("Starting job %s", job_id, extra={
+                        "output_dir": self.converter.get_downloads_dir(),
+                        "pages": str(pages),
+                        "model_id": model_id,
+                    })
                 
-        except Exception as e:
-            self.update_status(f"Error: {str(e)}", "error")
-            
-        finally:
-            self.set_converting_state(False)
+                    # Intermediates live in a per-document workspace removed when it finishes
+                    async with self.converter.workspaces.workspace(input_path) as workspace:
+                        # Check if file needs conversion to PDF
+                        file_ext = os.path.splitext(input_path)[1].lower().lstrip('.')
+                        pdf_path = input_path
+                        if file_ext in NEED_PDF_CONVERSION:
+                            self.logger.info("Converting %s file to PDF...", file_ext)
+                            on_progress(ProgressEvent(input_path, "preparing"))
+                            try:
+                                pdf_path = await self.converter.convert_to_pdf(
+                                    input_path, cancel_token=cancel_token, workspace=workspace
+                                )
+                                self.logger.info("File converted to PDF: %s", pdf_path)
+                            except OperationCancelled:
+                                raise
+                            except Exception as e:
+                                self.logger.error("PDF conversion failed: %s", e)
+                                on_progress(ProgressEvent(input_path, "failed", message=str(e)))
+                                self.post_status(f"PDF conversion failed: {str(e)}", "error")
+                                return
+                
+                        success, result = await self.converter.convert_file(
+                            pdf_path,
+                            pages=pages,
+                            model_id=model_id,
+                            on_progress=on_progress,
+                            cancel_token=cancel_token,
+                            workspace=workspace
+                        )
+                
+                        if success:
+                            on_progress(ProgressEvent(input_path, "done", message=result))
+                            self.post_status(f"Conversion completed: {result}")
+                        else:
+                            on_progress(ProgressEvent(input_path, "failed", message=result))
+                            self.post_status(f"Conversion failed: {result}", "error")
+                    
+            except DeadlineExceeded as e:
+                on_progress(ProgressEvent(input_path, "failed", message=str(e)))
+                self.post_status(f"Conversion timed out: {input_path}", "error")
+            except OperationCancelled:
+                on_progress(ProgressEvent(input_path, "cancelled"))
+                self.logger.info("Conversion cancelled: %s", input_path)
+            except asyncio.CancelledError:
+                on_progress(ProgressEvent(input_path, "cancelled"))
+                self.logger.info("Conversion cancelled: %s", input_path)
+                raise
+            except Exception as e:
+                on_progress(ProgressEvent(input_path, "failed", message=str(e)))
+                self.post_status(f"Error: {str(e)}", "error")
             
     def center_window(self):
         """Center window on screen"""
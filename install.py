@@ -1,20 +1,58 @@
 import os
 import sys
+import shutil
 import platform
 import subprocess
 
+from system_tools import find_tool, get_tools
+
+# Dependency -> executable that shows it is installed
+DEPENDENCY_TOOLS = {
+    'libreoffice': 'soffice',
+    'graphicsmagick': 'gm',
+    'poppler': 'pdftoppm',
+}
+
+# Linux package manager -> install command and package names per dependency.
+# LibreOffice is installed without its desktop integration, which headless
+# servers and containers don't need.
+LINUX_PACKAGES = {
+    'apt-get': (['apt-get', 'install', '-y', '--no-install-recommends'], {
+        'libreoffice': ['libreoffice-core', 'libreoffice-writer', 'libreoffice-calc', 'libreoffice-impress'],
+        'graphicsmagick': ['graphicsmagick'],
+        'poppler': ['poppler-utils'],
+    }),
+    'dnf': (['dnf', 'install', '-y'], {
+        'libreoffice': ['libreoffice-core', 'libreoffice-writer', 'libreoffice-calc', 'libreoffice-impress'],
+        'graphicsmagick': ['GraphicsMagick'],
+        'poppler': ['poppler-utils'],
+    }),
+    'yum': (['yum', 'install', '-y'], {
+        'libreoffice': ['libreoffice-core', 'libreoffice-writer', 'libreoffice-calc', 'libreoffice-impress'],
+        'graphicsmagick': ['GraphicsMagick'],
+        'poppler': ['poppler-utils'],
+    }),
+    'apk': (['apk', 'add', '--no-cache'], {
+        'libreoffice': ['libreoffice'],
+        'graphicsmagick': ['graphicsmagick'],
+        'poppler': ['poppler-utils'],
+    }),
+    'zypper': (['zypper', '--non-interactive', 'install'], {
+        'libreoffice': ['libreoffice'],
+        'graphicsmagick': ['GraphicsMagick'],
+        'poppler': ['poppler-tools'],
+    }),
+}
+
 def check_dependency(name):
     """Check if dependency is installed"""
-    try:
-        if platform.system() == "Darwin":  # macOS
-            result = subprocess.run(['brew', 'list', name], capture_output=True, text=True)
-            return result.returncode == 0
-        elif platform.system() == "Windows":
-            # Windows check logic
-            pass
-        return False
-    except:
-        return False
+    return find_tool(DEPENDENCY_TOOLS[name]) is not None
+
+def _as_root(command):
+    """Prefix sudo unless already running as root"""
+    if os.geteuid() != 0 and shutil.which('sudo'):
+        return ['sudo'] + command
+    return command
 
 def install_dependency(name):
     """Install dependency"""
@@ -22,11 +60,20 @@ def install_dependency(name):
         if platform.system() == "Darwin":  # macOS
             subprocess.run(['brew', 'install', name], check=True)
             return True
+        elif platform.system() == "Linux":
+            for manager, (command, packages) in LINUX_PACKAGES.items():
+                if shutil.which(manager):
+                    if manager == 'apt-get':
+                        # Package lists are often missing in fresh containers
+                        subprocess.run(_as_root(['apt-get', 'update']), check=True)
+                    subprocess.run(_as_root(command + packages[name]), check=True)
+                    return True
+            return False
         elif platform.system() == "Windows":
             # Windows installation logic
             pass
         return False
-    except:
+    except Exception:
         return False
 
 def main():
@@ -46,6 +93,12 @@ def main():
         else:
             print(f"{dep} is already installed")
     
+    # Probe what was found so the first conversion doesn't have to
+    tools = get_tools(refresh=True)
+    for info in tools.tools.values():
+        if info.available:
+            print(f"{info.name} {info.version or ''} at {info.path}")
+    
     # Install Python dependencies
     print("\nInstalling Python dependencies...")
     subprocess.run([sys.executable, '-m', 'pip', 'install', '-r', 'requirements.txt'])
@@ -0,0 +1,175 @@
+import os
+import copy
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Correlation ID and document of the conversion the current task works on.
+# contextvars follow asyncio tasks and asyncio.to_thread calls automatically.
+_correlation_id = contextvars.ContextVar("correlation_id", default=None)
+_document = contextvars.ContextVar("document", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+
+
+@contextmanager
+def correlation_scope(document=None, correlation_id=None):
+    """Tag log records emitted inside the block with a correlation ID
+
+    An ID already set by the caller (e.g. a GUI job) is kept, so one
+    document's records share an ID across the whole pipeline.
+    """
+    cid = correlation_id or _correlation_id.get() or uuid.uuid4().hex[:12]
+    cid_token = _correlation_id.set(cid)
+    doc_token = _document.set(document or _document.get())
+    try:
+        yield cid
+    finally:
+        _document.reset(doc_token)
+        _correlation_id.reset(cid_token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the correlation context onto each record"""
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        record.document = _document.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records below WARNING"""
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value if isinstance(value, (str, int, float, bool)) else str(value)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() formats the record in the calling thread, folds the
+    traceback into the message and drops exc_info. The queue never leaves
+    the process, so the record only needs its arguments merged.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(log_dir="logs", level="INFO", sample_rate=1.0, json_format=True,
+                  max_mb=10, backups=5, console=True, console_level=None):
+    """Route all logging through a queue drained by a background thread
+
+    Callers only pay for merging a record's arguments and putting it on an
+    in-memory queue; formatting (tracebacks included), file writes and
+    rotation happen on the listener thread. Safe to call
+    more than once; later calls reconfigure the handlers. The console
+    handler writes to stderr; `console_level` raises its threshold above
+    the file's.
+    """
+    global _listener
+
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, "ocr2md.log"),
+        maxBytes=int(max_mb * 1024 * 1024),
+        backupCount=backups,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(
+        JsonFormatter() if json_format
+        else logging.Formatter('%(asctime)s [%(levelname)s] [%(correlation_id)s] %(message)s')
+    )
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+        if console_level is not None:
+            console_handler.setLevel(console_level)
+        handlers.append(console_handler)
+
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    # Handler filters run in the logging thread, so the context is captured there
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return _listener
+
+
+def setup_logging_from_config(settings=None, log_dir="logs", console=True, console_level=None):
+    """Start logging configured by the `logging` section of config.yaml"""
+    settings = settings or {}
+    sample_rate = settings.get("sample_rate")
+    backups = settings.get("backups")
+    return setup_logging(
+        log_dir=log_dir,
+        level=settings.get("level") or "INFO",
+        sample_rate=1.0 if sample_rate is None else sample_rate,
+        json_format=settings.get("json") is not False,
+        max_mb=settings.get("max_mb") or 10,
+        backups=5 if backups is None else backups,
+        console=console,
+        console_level=console_level,
+    )
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
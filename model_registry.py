@@ -0,0 +1,452 @@
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Suffix of a config env var key -> litellm completion keyword argument
+CREDENTIAL_SUFFIXES = (
+    ("_API_KEY", "api_key"),
+    ("_API_BASE", "api_base"),
+    ("_BASE_URL", "api_base"),
+    ("_API_VERSION", "api_version"),
+)
+# Provider settings litellm also takes per request, by exact env var name
+PROVIDER_ENV_VARS = {
+    "AWS_ACCESS_KEY_ID": "aws_access_key_id",
+    "AWS_SECRET_ACCESS_KEY": "aws_secret_access_key",
+    "AWS_SESSION_TOKEN": "aws_session_token",
+    "AWS_REGION_NAME": "aws_region_name",
+    "AWS_REGION": "aws_region_name",
+    "AWS_DEFAULT_REGION": "aws_region_name",
+    "AWS_PROFILE": "aws_profile_name",
+    "AWS_ROLE_NAME": "aws_role_name",
+    "VERTEXAI_PROJECT": "vertex_project",
+    "VERTEX_PROJECT": "vertex_project",
+    "VERTEXAI_LOCATION": "vertex_location",
+    "VERTEX_LOCATION": "vertex_location",
+    "VERTEXAI_CREDENTIALS": "vertex_credentials",
+    "GOOGLE_APPLICATION_CREDENTIALS": "vertex_credentials",
+    "AZURE_AD_TOKEN": "azure_ad_token",
+}
+
+
+class ConfigError(Exception):
+    """Raised when config.yaml is malformed"""
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """A single configured model and its credentials"""
+    vendor: str
+    name: str
+    model_id: str
+    env: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}), repr=False)
+    # Model that re-recognises pages failing the quality checks
+    fallback_model: Optional[str] = None
+
+    def completion_kwargs(self):
+        """Per-request credentials for litellm, derived from the model's env vars"""
+        kwargs = {}
+        for key, value in self.env.items():
+            kwarg = _completion_kwarg(key)
+            if value and kwarg:
+                kwargs.setdefault(kwarg, value)
+        return kwargs
+
+    def process_env(self):
+        """Env vars litellm can't take per request; these are exported to os.environ"""
+        return {key: value for key, value in self.env.items() if value and not _completion_kwarg(key)}
+
+
+def _completion_kwarg(key):
+    """litellm keyword argument an env var maps to, or None"""
+    key = key.upper()
+    if key in PROVIDER_ENV_VARS:
+        return PROVIDER_ENV_VARS[key]
+    for suffix, kwarg in CREDENTIAL_SUFFIXES:
+        if key.endswith(suffix):
+            return kwarg
+    return None
+
+
+def export_process_env(registry):
+    """Export the env vars no model can receive per request
+
+    These are process-wide, so a key set to different values by two models
+    keeps the first model's value and is logged.
+    """
+    exported = {}
+    for spec in registry.models:
+        for key, value in spec.process_env().items():
+            if key in exported:
+                if exported[key][1] != value:
+                    logger.warning("%s is set differently by models %s and %s; using %s's value",
+                                   key, exported[key][0], spec.name, exported[key][0])
+                continue
+            exported[key] = (spec.name, value)
+            if os.environ.get(key) != value:
+                os.environ[key] = value
+                logger.info("Exported %s for model %s", key, spec.name)
+
+
+@dataclass(frozen=True)
+class ModelRegistry:
+    """Immutable, validated view of config.yaml"""
+    vendors: Tuple[Tuple[str, Tuple[ModelSpec, ...]], ...] = ()
+    workspace: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    logging: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    scheduling: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    quality: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    search: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    batching: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    profiling: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    tools: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    workers: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    raw: Mapping = field(default_factory=lambda: MappingProxyType({}), repr=False)
+
+    @property
+    def models(self):
+        return tuple(spec for _, specs in self.vendors for spec in specs)
+
+    @property
+    def model_map(self):
+        """Model display name -> model ID"""
+        return {spec.name: spec.model_id for spec in self.models}
+
+    def get(self, model_id) -> Optional[ModelSpec]:
+        """Look up a model by ID"""
+        for spec in self.models:
+            if spec.model_id == model_id:
+                return spec
+        return None
+
+    def get_fallback(self, model_id) -> Optional[ModelSpec]:
+        """Model that pages failing the quality checks are escalated to, if any"""
+        spec = self.get(model_id)
+        fallback_id = (spec.fallback_model if spec else None) or self.quality.get("fallback_model")
+        if not fallback_id or fallback_id == model_id:
+            return None
+        return self.get(fallback_id)
+
+    def get_by_name(self, name) -> Optional[ModelSpec]:
+        """Look up a model by display name"""
+        for spec in self.models:
+            if spec.name == name:
+                return spec
+        return None
+
+    def get_model_list(self):
+        """Display list with vendor separators, as shown in the model dropdown"""
+        model_list = []
+        for vendor_name, specs in self.vendors:
+            model_list.append(f"───── {vendor_name} ─────")
+            model_list.extend(spec.name for spec in specs)
+        return model_list
+
+
+def _require_str(value, where):
+    if not isinstance(value, str) or not value.strip():
+        raise ConfigError(f"{where} must be a non-empty string")
+    return value.strip()
+
+
+def _freeze(value):
+    """Recursively convert parsed YAML into read-only containers"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def parse_config(data):
+    """Validate parsed config.yaml contents and build a ModelRegistry"""
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ConfigError("Top level of config must be a mapping")
+
+    vendors_data = data.get("vendors") or []
+    if not isinstance(vendors_data, list):
+        raise ConfigError("'vendors' must be a list")
+
+    vendors = []
+    seen_names = set()
+    seen_ids = set()
+    for i, vendor in enumerate(vendors_data):
+        if not isinstance(vendor, dict):
+            raise ConfigError(f"vendors[{i}] must be a mapping")
+        vendor_name = _require_str(vendor.get("name"), f"vendors[{i}].name")
+
+        models_data = vendor.get("models") or []
+        if not isinstance(models_data, list):
+            raise ConfigError(f"vendors[{i}].models must be a list")
+
+        specs = []
+        for j, model in enumerate(models_data):
+            where = f"vendors[{i}].models[{j}]"
+            if not isinstance(model, dict):
+                raise ConfigError(f"{where} must be a mapping")
+            name = _require_str(model.get("name"), f"{where}.name")
+            model_id = _require_str(model.get("model_id"), f"{where}.model_id")
+            if name in seen_names:
+                raise ConfigError(f"Duplicate model name: {name}")
+            if model_id in seen_ids:
+                raise ConfigError(f"Duplicate model_id: {model_id}")
+            seen_names.add(name)
+            seen_ids.add(model_id)
+
+            env = {}
+            for k, env_var in enumerate(model.get("env_vars") or []):
+                if not isinstance(env_var, dict):
+                    raise ConfigError(f"{where}.env_vars[{k}] must be a mapping")
+                key = _require_str(env_var.get("key"), f"{where}.env_vars[{k}].key")
+                value = env_var.get("value")
+                if value is None:
+                    value = ""
+                if not isinstance(value, (str, int, float)):
+                    raise ConfigError(f"{where}.env_vars[{k}].value must be a scalar")
+                env[key] = str(value).strip()
+
+            fallback_model = model.get("fallback_model")
+            if fallback_model is not None:
+                fallback_model = _require_str(fallback_model, f"{where}.fallback_model")
+
+            specs.append(ModelSpec(
+                vendor=vendor_name,
+                name=name,
+                model_id=model_id,
+                env=MappingProxyType(env),
+                fallback_model=fallback_model,
+            ))
+        vendors.append((vendor_name, tuple(specs)))
+
+    workspace = data.get("workspace") or {}
+    if not isinstance(workspace, dict):
+        raise ConfigError("'workspace' must be a mapping")
+    for key in ("root", "memory_root"):
+        value = workspace.get(key)
+        if value is not None and value is not False and not isinstance(value, str):
+            raise ConfigError(f"workspace.{key} must be a path")
+    for key in ("quota_mb", "memory_threshold_mb"):
+        value = workspace.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+            raise ConfigError(f"workspace.{key} must be a non-negative number")
+
+    logging_settings = data.get("logging") or {}
+    if not isinstance(logging_settings, dict):
+        raise ConfigError("'logging' must be a mapping")
+    level = logging_settings.get("level")
+    if level is not None and (not isinstance(level, str)
+                              or level.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")):
+        raise ConfigError("logging.level must be DEBUG, INFO, WARNING, ERROR or CRITICAL")
+    sample_rate = logging_settings.get("sample_rate")
+    if sample_rate is not None and (isinstance(sample_rate, bool) or not isinstance(sample_rate, (int, float))
+                                    or not 0 <= sample_rate <= 1):
+        raise ConfigError("logging.sample_rate must be between 0 and 1")
+    unknown = set(logging_settings) - {"level", "sample_rate", "json", "max_mb", "backups"}
+    if unknown:
+        raise ConfigError(f"logging: unknown keys {sorted(unknown)}")
+    json_format = logging_settings.get("json")
+    if json_format is not None and not isinstance(json_format, bool):
+        raise ConfigError("logging.json must be true or false")
+    max_mb = logging_settings.get("max_mb")
+    if max_mb is not None and (isinstance(max_mb, bool) or not isinstance(max_mb, (int, float)) or max_mb <= 0):
+        raise ConfigError("logging.max_mb must be a positive number")
+    backups = logging_settings.get("backups")
+    if backups is not None and (isinstance(backups, bool) or not isinstance(backups, int) or backups < 0):
+        raise ConfigError("logging.backups must be a non-negative integer")
+
+    scheduling = data.get("scheduling") or {}
+    if not isinstance(scheduling, dict):
+        raise ConfigError("'scheduling' must be a mapping")
+    slots = scheduling.get("slots")
+    if slots is not None and (isinstance(slots, bool) or not isinstance(slots, int) or slots < 1):
+        raise ConfigError("scheduling.slots must be a positive integer")
+    classes = scheduling.get("classes") or {}
+    if not isinstance(classes, dict):
+        raise ConfigError("scheduling.classes must be a mapping of class name to settings")
+    reserved_total = 0
+    for name, settings in classes.items():
+        settings = settings or {}
+        if not isinstance(settings, dict):
+            raise ConfigError(f"scheduling.classes.{name} must be a mapping")
+        unknown = set(settings) - {"weight", "reserved", "max_wait", "timeout"}
+        if unknown:
+            raise ConfigError(f"scheduling.classes.{name}: unknown keys {sorted(unknown)}")
+        weight = settings.get("weight")
+        if weight is not None and (isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0):
+            raise ConfigError(f"scheduling.classes.{name}.weight must be a positive number")
+        reserved = settings.get("reserved")
+        if reserved is not None and (isinstance(reserved, bool) or not isinstance(reserved, int) or reserved < 0):
+            raise ConfigError(f"scheduling.classes.{name}.reserved must be a non-negative integer")
+        reserved_total += reserved or 0
+        for key in ("max_wait", "timeout"):
+            value = settings.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+                raise ConfigError(f"scheduling.classes.{name}.{key} must be a non-negative number")
+    if slots is not None and reserved_total >= slots:
+        raise ConfigError("scheduling: reserved slots must be fewer than scheduling.slots")
+
+    quality = data.get("quality") or {}
+    if not isinstance(quality, dict):
+        raise ConfigError("'quality' must be a mapping")
+    enabled = quality.get("enabled")
+    if enabled is not None and not isinstance(enabled, bool):
+        raise ConfigError("quality.enabled must be true or false")
+    fallbacks = [(f"{spec.model_id}.fallback_model", spec.fallback_model)
+                 for _, specs in vendors for spec in specs if spec.fallback_model]
+    if quality.get("fallback_model") is not None:
+        fallbacks.append(("quality.fallback_model", _require_str(quality["fallback_model"], "quality.fallback_model")))
+    for where, fallback_id in fallbacks:
+        if fallback_id not in seen_ids:
+            raise ConfigError(f"{where} refers to unknown model_id: {fallback_id}")
+
+    search = data.get("search") or {}
+    if not isinstance(search, dict):
+        raise ConfigError("'search' must be a mapping")
+    enabled = search.get("enabled")
+    if enabled is not None and not isinstance(enabled, bool):
+        raise ConfigError("search.enabled must be true or false")
+    for key in ("path", "tokenizer"):
+        value = search.get(key)
+        if value is not None and not isinstance(value, str):
+            raise ConfigError(f"search.{key} must be a string")
+
+    batching = data.get("batching") or {}
+    if not isinstance(batching, dict):
+        raise ConfigError("'batching' must be a mapping")
+    unknown = set(batching) - {"max_pixels", "max_pages", "linger"}
+    if unknown:
+        raise ConfigError(f"batching: unknown keys {sorted(unknown)}")
+    for key in ("max_pixels", "max_pages"):
+        value = batching.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise ConfigError(f"batching.{key} must be a positive integer")
+    linger = batching.get("linger")
+    if linger is not None and (isinstance(linger, bool) or not isinstance(linger, (int, float)) or linger < 0):
+        raise ConfigError("batching.linger must be a non-negative number")
+
+    profiling = data.get("profiling") or {}
+    if not isinstance(profiling, dict):
+        raise ConfigError("'profiling' must be a mapping")
+    for key in ("enabled", "tracemalloc"):
+        value = profiling.get(key)
+        if value is not None and not isinstance(value, bool):
+            raise ConfigError(f"profiling.{key} must be true or false")
+    if profiling.get("dir") is not None and not isinstance(profiling["dir"], str):
+        raise ConfigError("profiling.dir must be a path")
+    if profiling.get("dump") not in (None, False, "cprofile", "pyinstrument"):
+        raise ConfigError("profiling.dump must be cprofile or pyinstrument")
+
+    tools = data.get("tools") or {}
+    if not isinstance(tools, dict):
+        raise ConfigError("'tools' must be a mapping of tool name to path")
+    unknown = set(tools) - {"soffice", "gm", "pdftoppm", "pdfinfo"}
+    if unknown:
+        raise ConfigError(f"tools: unknown tools {sorted(unknown)}")
+    for name, path in tools.items():
+        if path is not None and not isinstance(path, str):
+            raise ConfigError(f"tools.{name} must be a path")
+
+    workers = data.get("workers") or {}
+    if not isinstance(workers, dict):
+        raise ConfigError("'workers' must be a mapping")
+    for key in ("office", "documents"):
+        value = workers.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise ConfigError(f"workers.{key} must be a positive integer")
+
+    return ModelRegistry(
+        vendors=tuple(vendors),
+        workspace=_freeze(workspace),
+        logging=_freeze(logging_settings),
+        scheduling=_freeze(scheduling),
+        quality=_freeze(quality),
+        search=_freeze(search),
+        batching=_freeze(batching),
+        profiling=_freeze(profiling),
+        tools=_freeze({name: path for name, path in tools.items() if path}),
+        workers=_freeze(workers),
+        raw=_freeze(data),
+    )
+
+
+class ConfigStore:
+    """Loads config.yaml once and hot-reloads it when the file changes
+
+    Readers always get a complete, validated ModelRegistry. If an edited file
+    fails validation the previous registry stays active.
+    """
+
+    def __init__(self, config_file="config.yaml", check_interval=1.0):
+        self.config_file = config_file
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._registry = ModelRegistry()
+        self._signature = None
+        self._last_check = 0.0
+        self.reload()
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.config_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def reload(self):
+        """Re-read the config file; returns True if the registry changed"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            signature = self._stat_signature()
+            if signature is None:
+                if self._signature is not None:
+                    logger.warning("Config file disappeared: %s", self.config_file)
+                return False
+            try:
+                with open(self.config_file, "r", encoding="utf-8") as f:
+                    registry = parse_config(yaml.safe_load(f))
+            except (OSError, yaml.YAMLError, ConfigError) as e:
+                logger.error("Failed to load config file: %s", e)
+                self._signature = signature  # Don't retry until the file changes again
+                return False
+            self._registry = registry
+            self._signature = signature
+            export_process_env(registry)
+            return True
+
+    def reload_if_changed(self):
+        """Reload if the file changed on disk; returns True if it was reloaded"""
+        if self._stat_signature() == self._signature:
+            return False
+        return self.reload()
+
+    @property
+    def registry(self):
+        """Current registry, reloaded first if the file changed"""
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self._last_check = time.monotonic()
+            self.reload_if_changed()
+        return self._registry
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_config_store(config_file="config.yaml"):
+    """Shared ConfigStore per config path, so the file is parsed once per process"""
+    key = os.path.abspath(config_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ConfigStore(config_file)
+        return store
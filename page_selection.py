@@ -0,0 +1,137 @@
+import re
+
+# One comma-separated term: [start][(-|..)[end]][:step]
+_TERM_RE = re.compile(r"^(?P<start>-?\d+)?(?:(?P<sep>\.\.|-)(?P<end>-?\d+)?)?(?::(?P<step>\d+))?$")
+
+SYNTAX_HELP = "e.g. 1,3,5-10, 20- (to end), -1 (last page), -5..-1, 1-20:2 (every 2nd)"
+
+
+class PageSelectionError(ValueError):
+    """Raised for malformed or out-of-range page selections"""
+
+
+class PageSelection:
+    """Lazy page selection shared by the GUI, the CLI and convert_file
+
+    Terms are kept as written and only expanded against the document's page
+    count, so "1-500" never becomes a list before the PDF is opened and
+    open ranges and negative indices resolve correctly.
+
+    Syntax, comma separated (pages are 1-based):
+        7         single page
+        -1        last page (negative indices count from the end)
+        3-9, 3..9 inclusive range
+        10-, 10.. from page 10 to the end
+        ..5       from the first page to page 5
+        -5..-1    the last five pages
+        1-20:2    every second page of a range; ":3" alone is every third page
+    """
+
+    def __init__(self, terms):
+        self.terms = tuple(terms)
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse a selection string; empty means all pages (returns None)"""
+        if spec is None or not str(spec).strip():
+            return None
+        terms = []
+        for raw in str(spec).split(","):
+            term = raw.strip().replace(" ", "")
+            if not term:
+                continue
+            match = _TERM_RE.match(term)
+            if not match or term in ("-", ".."):
+                raise PageSelectionError(f"Invalid page term '{raw.strip()}' ({SYNTAX_HELP})")
+            start, sep, end, step = match.group("start", "sep", "end", "step")
+            start = int(start) if start is not None else None
+            end = int(end) if end is not None else None
+            step = int(step) if step is not None else 1
+            if 0 in (start, end):
+                raise PageSelectionError("Pages are numbered from 1")
+            if step < 1:
+                raise PageSelectionError("Step must be at least 1")
+            if start is not None and end is not None and (start > 0) == (end > 0) and start > end:
+                raise PageSelectionError(f"Range '{raw.strip()}' ends before it starts")
+            if sep is None and start is not None:
+                if match.group("step"):
+                    # "5:2" means from page 5 to the end, every second page
+                    terms.append((start, None, step, True))
+                else:
+                    terms.append((start, start, 1, False))
+            else:
+                terms.append((start, end, step, True))
+        if not terms:
+            return None
+        return cls(terms)
+
+    @classmethod
+    def coerce(cls, pages):
+        """Accept a selection string, PageSelection, page number or list of page numbers"""
+        if pages is None or isinstance(pages, cls):
+            return pages
+        if isinstance(pages, str):
+            return cls.parse(pages)
+        if isinstance(pages, int):
+            pages = [pages]
+        try:
+            numbers = [int(p) for p in pages]
+        except (TypeError, ValueError):
+            raise PageSelectionError(f"Invalid page selection: {pages!r}")
+        if not numbers:
+            return None
+        if 0 in numbers:
+            raise PageSelectionError("Pages are numbered from 1")
+        return cls((n, n, 1, False) for n in numbers)
+
+    @staticmethod
+    def _absolute(index, page_count):
+        return page_count + 1 + index if index < 0 else index
+
+    def resolve(self, page_count):
+        """Selected page numbers, ascending and unique, for a document of `page_count` pages
+
+        Single pages outside the document are an error; ranges are clipped.
+        """
+        selected = set()
+        for start, end, step, is_range in self.terms:
+            first = 1 if start is None else self._absolute(start, page_count)
+            last = page_count if end is None else self._absolute(end, page_count)
+            if not is_range:
+                if not 1 <= first <= page_count:
+                    raise PageSelectionError(
+                        f"Page out of range (document has {page_count} pages): {start}"
+                    )
+                selected.add(first)
+                continue
+            lo = max(first, 1)
+            hi = min(last, page_count)
+            # Keep the step aligned with the range's written start
+            if lo > first:
+                lo = first + -(-(lo - first) // step) * step
+            selected.update(range(lo, hi + 1, step))
+        return sorted(selected)
+
+    def __str__(self):
+        parts = []
+        for start, end, step, is_range in self.terms:
+            if not is_range:
+                parts.append(str(start))
+                continue
+            text = f"{'' if start is None else start}..{'' if end is None else end}"
+            parts.append(f"{text}:{step}" if step != 1 else text)
+        return ",".join(parts)
+
+    def __repr__(self):
+        return f"PageSelection({str(self)!r})"
+
+
+def contiguous_runs(pages):
+    """Split ascending page numbers into runs of consecutive pages"""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][-1] + 1:
+            runs[-1].append(page)
+        else:
+            runs.append([page])
+    return runs
@@ -0,0 +1,244 @@
+import os
+import re
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from cancellation import CancelToken
+from workspace import PAGE_IMAGE_BYTES
+from state_index import file_digest
+from page_selection import contiguous_runs
+from scheduler import model_slot
+import tiling as page_tiling
+
+logger = logging.getLogger(__name__)
+
+# Same defaults zerox uses for rasterization and page concurrency
+IMAGE_DENSITY = 300
+CONCURRENCY = 10
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Progress notification for one document
+
+    stage is one of: "preparing", "started", "page", "done",
+    "failed", "cancelled".
+    """
+    path: str
+    stage: str
+    done: int = 0
+    total: int = 0
+    page: Optional[int] = None
+    message: str = ""
+
+
+def emit(on_progress, path, stage, **kwargs):
+    """Send a progress event, never letting a callback break a conversion"""
+    if on_progress is None:
+        return
+    try:
+        on_progress(ProgressEvent(path=path, stage=stage, **kwargs))
+    except Exception as e:
+        logger.warning("Progress callback failed: %s", e)
+
+
+def output_file_name(input_path):
+    """Output base name, sanitized the same way zerox does"""
+    raw_file_name = os.path.splitext(os.path.basename(input_path))[0]
+    file_name = "".join(c.lower() if c.isalnum() else "_" for c in raw_file_name)
+    return re.sub(r"_+", "_", file_name)[:255]
+
+
+def format_markdown(text):
+    """Strip the code fence models like to wrap their Markdown in"""
+    text = (text or "").strip()
+    text = re.sub(r"^```[a-zA-Z]*\s*\n", "", text)
+    text = re.sub(r"\n?```$", "", text)
+    return text.strip()
+
+
+async def get_page_count(pdf_path, cancel_token=None, poppler_path=None):
+    """Number of pages in a PDF
+
+    `poppler_path` is the directory of pdfinfo, see system_tools.ToolSet.
+    """
+    cancel_token = cancel_token or CancelToken()
+    info = await cancel_token.guard(asyncio.to_thread(
+        pdfinfo_from_path, pdf_path, timeout=cancel_token.remaining(), poppler_path=poppler_path
+    ))
+    return int(info["Pages"])
+
+
+async def render_page(pdf_path, page, output_dir, dpi=IMAGE_DENSITY, cancel_token=None, output_file=None,
+                      poppler_path=None):
+    """Rasterize a single 1-based page to a PNG file and return its path
+
+    The pdftoppm subprocess is given the token's remaining time as its
+    timeout, so an abandoned render doesn't outlive the deadline.
+    """
+    cancel_token = cancel_token or CancelToken()
+    paths = await cancel_token.guard(asyncio.to_thread(
+        convert_from_path,
+        pdf_path,
+        dpi=dpi,
+        first_page=page,
+        last_page=page,
+        fmt="png",
+        output_folder=output_dir,
+        output_file=output_file or f"page_{page:05d}",
+        paths_only=True,
+        timeout=cancel_token.remaining(),
+        poppler_path=poppler_path,
+    ))
+    if not paths:
+        raise Exception(f"Failed to render page {page}")
+    return paths[0]
+
+
+async def ocr_page(vision_model, image_path, maintain_format=False, prior_page=""):
+    """Run one page image through the vision model and return its Markdown"""
+    completion = await vision_model.completion(
+        image_path=image_path,
+        maintain_format=maintain_format,
+        prior_page=prior_page,
+    )
+    return format_markdown(completion.content)
+
+
+async def process_pages(pdf_path, pages, vision_model, workspace, maintain_format=False,
+                        concurrency=CONCURRENCY, on_progress=None, progress_path=None,
+                        cancel_token=None, page_timeout=None, tiling="off", batcher=None,
+                        page_cache=None, source_pages=None, prior_pages=None,
+                        scheduler=None, priority=None, quality_gate=None, on_page=None,
+                        poppler_path=None):
+    """OCR the given 1-based pages of a PDF
+
+    Page images are rendered into `workspace`, each holding quota until
+    it is recognised and deleted. Returns a dict of page number -> Markdown.
+    With maintain_format each run of consecutive pages is processed in
+    order so every page sees its predecessor, and separate runs of a
+    sparse selection proceed concurrently; otherwise all pages run
+    concurrently. Either way at most `concurrency` are in flight.
+    Cancelling `cancel_token` or running past its deadline (or
+    `page_timeout` for a single page) raises OperationCancelled/
+    DeadlineExceeded and aborts the remaining pages.
+    With `tiling` set to "auto" or "always", oversized or dense pages are
+    split into overlapping tiles that are recognised concurrently. With a
+    batching.PageBatcher, pages without prior-page context share requests
+    with pages from other conversions. With a state_index.PageCache, pages
+    whose rendered image is unchanged since the last run reuse their
+    Markdown instead of calling the model.
+
+    When `pdf_path` is an extract of a larger document, `source_pages` maps
+    the document's page numbers to pages of the extract. `prior_pages` holds
+    Markdown of pages outside `pages` (e.g. the end of a previous chunk) so a
+    run starting right after one of them continues its formatting. With a
+    scheduler.PageScheduler, each model call waits for a slot of the
+    `priority` class, shared with every other conversion. With a
+    quality.QualityGate, pages failing its checks are recognised again by
+    the gate's fallback model. `on_page` is called with (page, markdown)
+    as soon as each page is done, e.g. to index it. `poppler_path` is
+    passed to render_page.
+    """
+    progress_path = progress_path or pdf_path
+    cancel_token = cancel_token or CancelToken()
+    total = len(pages)
+    results = {}
+
+    async def recognise(page, image_path, prior_page, page_token):
+        markdown = await call_model(vision_model, image_path, prior_page, page_token)
+        if quality_gate is None:
+            return markdown
+        # The loop checks scan up to 12k characters; keep them off the event loop
+        problems = await asyncio.to_thread(quality_gate.check, page, markdown)
+        if not problems:
+            return markdown
+        fallback_model = await quality_gate.get_fallback()
+        if fallback_model is None:
+            return markdown
+        retry = await call_model(fallback_model, image_path, prior_page, page_token)
+        return await asyncio.to_thread(quality_gate.choose, page, markdown, problems, retry)
+
+    async def call_model(model, image_path, prior_page, page_token):
+        # Every request takes its own scheduler slot, so a tiled page's tiles
+        # count one by one against the requests in flight
+        # The batcher is bound to the primary model
+        if batcher is not None and model is vision_model and tiling == "off" and not prior_page:
+            async with model_slot(scheduler, priority, page_token):
+                return format_markdown(await page_token.guard(batcher.ocr(image_path)))
+        if tiling == "off":
+            async with model_slot(scheduler, priority, page_token):
+                return await page_token.guard(
+                    ocr_page(model, image_path, maintain_format, prior_page)
+                )
+
+        async def ocr_tile(tile_path, is_first_tile):
+            # Only the top tile continues the previous page's formatting
+            async with model_slot(scheduler, priority, page_token):
+                return await page_token.guard(ocr_page(
+                    model, tile_path, maintain_format, prior_page if is_first_tile else ""
+                ))
+
+        return await page_token.guard(
+            page_tiling.ocr_tiled(image_path, workspace.path, ocr_tile, mode=tiling)
+        )
+
+    async def run_page(page, prior_page=""):
+        page_token = cancel_token.child(timeout=page_timeout)
+        try:
+            async with workspace.reserve(PAGE_IMAGE_BYTES, page_token):
+                image_path = await render_page(
+                    pdf_path,
+                    source_pages.get(page, page) if source_pages else page,
+                    workspace.path,
+                    cancel_token=page_token,
+                    output_file=f"page_{page:05d}",
+                    poppler_path=poppler_path,
+                )
+                try:
+                    if page_cache is None:
+                        markdown = await recognise(page, image_path, prior_page, page_token)
+                    else:
+                        digest = await asyncio.to_thread(file_digest, image_path)
+                        markdown = page_cache.get(digest)
+                        if markdown is None:
+                            markdown = await recognise(page, image_path, prior_page, page_token)
+                        page_cache.record(page, digest, markdown)
+                finally:
+                    if os.path.exists(image_path):
+                        os.remove(image_path)
+        finally:
+            page_token.release()
+        results[page] = markdown
+        if on_page is not None:
+            try:
+                on_page(page, markdown)
+            except Exception as e:
+                logger.warning("Page callback failed for page %d: %s", page, e)
+        logger.debug("Page %d recognised (%d/%d)", page, len(results), total)
+        emit(on_progress, progress_path, "page", done=len(results), total=total, page=page)
+        return markdown
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_sequence(run):
+        # Pages in a run are consecutive, so each one can continue its predecessor
+        async with semaphore:
+            prior_page = (prior_pages or {}).get(run[0] - 1, "")
+            for page in run:
+                prior_page = await run_page(page, prior_page if maintain_format else "")
+
+    runs = contiguous_runs(sorted(pages)) if maintain_format else [[page] for page in pages]
+    tasks = [asyncio.ensure_future(run_sequence(run)) for run in runs]
+    try:
+        await cancel_token.guard(asyncio.gather(*tasks))
+    finally:
+        # Make sure siblings stop generating cost if one page fails or we're cancelled
+        for task in tasks:
+            task.cancel()
+
+    return results
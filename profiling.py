@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Environment variable that turns profiling on regardless of config.yaml
+PROFILE_ENV = "OCR2MD_PROFILE"
+# How often the sampler thread reads the process RSS
+RSS_INTERVAL = 0.1
+# Frames kept per tracemalloc allocation; more is slower but easier to trace
+TRACEMALLOC_FRAMES = 5
+# Allocation sites reported per document
+TOP_ALLOCATIONS = 5
+# Document reports kept in memory
+MAX_REPORTS = 100
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak RSS where unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+class _DocumentStats:
+    def __init__(self, path, snapshot=False):
+        self.path = path
+        self.started = time.monotonic()
+        self.rss_start = current_rss()
+        self.rss_peak = self.rss_start
+        self.stages = {}
+        self.snapshot = tracemalloc.take_snapshot() if snapshot and tracemalloc.is_tracing() else None
+
+
+class Profiler:
+    """Opt-in memory and CPU profiling for conversions
+
+    document() tracks peak RSS while a document converts, sampled by a
+    background thread, and logs a report when it ends. With tracemalloc on,
+    the report also lists the allocation sites that grew the most between
+    the document's start and end, and stage() records the traced memory each
+    stage left behind next to its duration. Tracing is process-wide, so
+    concurrent documents show up in each other's numbers.
+    With `dump` set to "cprofile" or "pyinstrument", each document's profile
+    is written to `output_dir`; cProfile only profiles one document at a time.
+    A disabled Profiler does nothing and costs nothing.
+    """
+
+    def __init__(self, enabled=False, output_dir="profiles", trace_memory=True, dump=None):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.trace_memory = trace_memory
+        self.dump = dump
+        self.reports = deque(maxlen=MAX_REPORTS)
+        self._lock = threading.Lock()
+        self._active = set()
+        self._sampler = None
+        self._cprofile_busy = False
+        if enabled and trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build from the `profiling` section of config.yaml and OCR2MD_PROFILE"""
+        settings = settings or {}
+        env = os.environ.get(PROFILE_ENV, "").strip().lower()
+        enabled = bool(settings.get("enabled")) or env not in ("", "0", "false", "no")
+        dump = settings.get("dump") or (env if env in PROFILERS else None)
+        return cls(
+            enabled=enabled,
+            output_dir=settings.get("dir") or "profiles",
+            trace_memory=settings.get("tracemalloc") is not False,
+            dump=dump,
+        )
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active)
+            rss = current_rss()
+            for stats in active:
+                stats.rss_peak = max(stats.rss_peak, rss)
+            time.sleep(RSS_INTERVAL)
+
+    @contextmanager
+    def document(self, path):
+        """Profile one document's conversion"""
+        if not self.enabled:
+            yield None
+            return
+        stats = _DocumentStats(path, snapshot=self.trace_memory)
+        with self._lock:
+            self._active.add(stats)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+                self._sampler.start()
+        profile = self._start_dump()
+        try:
+            yield stats
+        finally:
+            self._finish_dump(profile, path)
+            with self._lock:
+                self._active.discard(stats)
+            stats.rss_peak = max(stats.rss_peak, current_rss())
+            self._report(stats)
+
+    @contextmanager
+    def stage(self, name, stats=None):
+        """Time a stage of `stats`'s document and record what it allocated"""
+        if not self.enabled:
+            yield
+            return
+        tracing = tracemalloc.is_tracing()
+        traced_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            entry = {"seconds": round(time.monotonic() - started, 3)}
+            if tracing:
+                traced, traced_peak = tracemalloc.get_traced_memory()
+                entry["traced_delta_kb"] = round((traced - traced_before) / 1024, 1)
+                entry["traced_peak_mb"] = round(traced_peak / 2 ** 20, 1)
+            if stats is not None:
+                stats.stages[name] = entry
+            logger.debug("Stage %s finished", name, extra={"stage": name, **entry})
+
+    def _start_dump(self):
+        if self.dump == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as PyinstrumentProfiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed; no profile will be written")
+                return None
+            profile = PyinstrumentProfiler(async_mode="enabled")
+            profile.start()
+            return profile
+        if self.dump == "cprofile":
+            import cProfile
+            with self._lock:
+                if self._cprofile_busy:
+                    logger.debug("cProfile already running for another document")
+                    return None
+                self._cprofile_busy = True
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) owns the hook
+                with self._lock:
+                    self._cprofile_busy = False
+                return None
+            return profile
+        return None
+
+    def _finish_dump(self, profile, path):
+        if profile is None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        base = os.path.join(self.output_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{stamp}")
+        try:
+            if self.dump == "pyinstrument":
+                profile.stop()
+                with open(base + ".html", "w", encoding="utf-8") as f:
+                    f.write(profile.output_html())
+            else:
+                profile.disable()
+                profile.dump_stats(base + ".prof")
+        except Exception as e:
+            logger.warning("Failed to write profile for %s: %s", path, e)
+        finally:
+            if self.dump == "cprofile":
+                with self._lock:
+                    self._cprofile_busy = False
+
+    def _report(self, stats):
+        report = {
+            "document": stats.path,
+            "seconds": round(time.monotonic() - stats.started, 3),
+            "rss_start_mb": round(stats.rss_start / 2 ** 20, 1),
+            "rss_peak_mb": round(stats.rss_peak / 2 ** 20, 1),
+            "rss_end_mb": round(current_rss() / 2 ** 20, 1),
+            "stages": stats.stages,
+        }
+        if stats.snapshot is not None and tracemalloc.is_tracing():
+            growth = tracemalloc.take_snapshot().compare_to(stats.snapshot, "lineno")
+            report["top_growth"] = [
+                f"{s.traceback[0].filename}:{s.traceback[0].lineno} {s.size_diff / 1024:+.1f} KiB"
+                for s in growth[:TOP_ALLOCATIONS] if s.size_diff > 0
+            ]
+        stats.snapshot = None
+        self.reports.append(report)
+        logger.info("Profile of %s: peak RSS %.1f MB (started at %.1f MB)",
+                    stats.path, report["rss_peak_mb"], report["rss_start_mb"], extra={
+                        "rss_peak_mb": report["rss_peak_mb"],
+                        "rss_end_mb": report["rss_end_mb"],
+                        "stages": stats.stages,
+                        "top_growth": report.get("top_growth"),
+                    })
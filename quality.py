@@ -0,0 +1,173 @@
+import re
+import asyncio
+import logging
+import unicodedata
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# A unit of at least this many characters repeated this many times in a row
+# is a generation loop...
+REPEAT_MIN_UNIT = 8
+REPEAT_MIN_COUNT = 5
+REPEAT_LINE_MIN = 8
+# ...but forms and spreadsheets repeat lines too. A loop runs until the output
+# limit, so the repeated text must also be this long and this share of the page
+REPEAT_LOOP_CHARS = 4000
+REPEAT_LOOP_SHARE = 0.3
+# Share of replacement, control, private-use or mojibake characters tolerated
+CHARSET_ANOMALY_RATIO = 0.02
+# Share of a table's rows allowed to disagree with the header's column count
+TABLE_MISMATCH_RATIO = 0.2
+# Refusals are short and come first; only the start of short pages is searched
+REFUSAL_WINDOW = 300
+REFUSAL_MAX_LENGTH = 800
+
+_REPEAT_RE = re.compile(r"(.{%d,200}?)\1{%d,}" % (REPEAT_MIN_UNIT, REPEAT_MIN_COUNT - 1), re.DOTALL)
+# Declining the task, not just apologising: "I'm sorry for the delay" in a
+# transcribed letter is content
+_REFUSAL_RE = re.compile(
+    r"((?:(?:i'?m|i am) sorry|i apologi[sz]e),? but (?:i (?:can(?:no|')?t|am unable|'?m unable|won'?t)|as an ai)"
+    r"|i (?:can(?:no|')?t|am unable to|'?m unable to|won'?t) (?:help|assist) with (?:this|that|the) (?:image|request)"
+    r"|(?:can(?:no|')?t|unable to|not able to) (?:process|read|transcribe|view|see) (?:the|this|that) (?:image|picture|scan)"
+    r"|as an ai (?:language )?model"
+    r"|(?:抱歉|对不起)[，,]?\s*我(?:无法|不能)|无法(?:识别|处理|读取)(?:该|这张|此)?(?:图片|图像))",
+    re.IGNORECASE,
+)
+# UTF-8 decoded as Latin-1/cp1252, e.g. "Ã©" for "é" or "â€™" for "’"
+_MOJIBAKE_RE = re.compile(r"[ÃÂ][\u0080-¿]|â€[\u0080-¿™œ\u009d˜¦“”]")
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+
+
+def _is_loop(repeated, markdown):
+    return len(repeated) >= REPEAT_LOOP_CHARS and len(repeated) >= REPEAT_LOOP_SHARE * len(markdown)
+
+
+def _repetition(markdown):
+    lines = [line.strip() for line in markdown.splitlines() if line.strip()]
+    content = [line for line in lines if len(line) >= 10]
+    if len(content) >= REPEAT_LINE_MIN:
+        line, count = Counter(content).most_common(1)[0]
+        if count >= REPEAT_LINE_MIN and _is_loop(line * count, markdown):
+            return f"line repeated {count} times"
+    # Loops usually run until the output limit, so only a repeat reaching
+    # the end of the text counts
+    text = markdown[-3 * REPEAT_LOOP_CHARS:].rstrip()
+    for match in _REPEAT_RE.finditer(text):
+        unit = match.group(1)
+        if len(text) - match.end() <= len(unit) and sum(c.isalnum() for c in unit) >= 4 \
+                and _is_loop(match.group(0), text):
+            return f"text repeated {len(match.group(0)) // len(unit)} times: {unit[:40]!r}"
+    return None
+
+
+def _refusal(markdown):
+    if len(markdown) > REFUSAL_MAX_LENGTH:
+        return None
+    match = _REFUSAL_RE.search(markdown[:REFUSAL_WINDOW])
+    return f"refusal text {match.group(0)!r}" if match else None
+
+
+def _charset(markdown):
+    suspicious = sum(
+        1 for c in markdown
+        if c == "�"
+        or (unicodedata.category(c) in ("Cc", "Co", "Cs") and c not in "\n\r\t")
+    )
+    suspicious += 2 * len(_MOJIBAKE_RE.findall(markdown))
+    if suspicious and suspicious / max(len(markdown), 1) > CHARSET_ANOMALY_RATIO:
+        return f"{suspicious} garbled characters"
+    return None
+
+
+def _cells(row):
+    return len(re.split(r"(?<!\\)\|", row.strip().strip("|")))
+
+
+def _tables(markdown):
+    tables, current = [], []
+    for line in markdown.splitlines() + [""]:
+        if line.lstrip().startswith("|"):
+            current.append(line.strip())
+        elif current:
+            tables.append(current)
+            current = []
+    return tables
+
+
+def _broken_table(markdown):
+    for i, rows in enumerate(_tables(markdown), 1):
+        if len(rows) < 2:
+            continue
+        if not _TABLE_SEPARATOR_RE.match(rows[1]):
+            return f"table {i} has no header separator"
+        columns = _cells(rows[0])
+        body = rows[2:]
+        mismatched = sum(1 for row in body if _cells(row) != columns)
+        if body and mismatched / len(body) > TABLE_MISMATCH_RATIO:
+            return f"table {i}: {mismatched} of {len(body)} rows don't have {columns} columns"
+    return None
+
+
+CHECKS = (_repetition, _refusal, _charset, _broken_table)
+
+
+def check_page(markdown):
+    """Problems found in one page's Markdown; an empty list means it passed"""
+    if not (markdown or "").strip():
+        return ["empty output"]
+    return [problem for problem in (check(markdown) for check in CHECKS) if problem]
+
+
+class QualityGate:
+    """Validates each recognised page and picks what to keep after a retry
+
+    Pages that fail check_page are re-recognised with `fallback_model`
+    (a zerox litellmmodel) when one is configured; otherwise they are only
+    logged. `fallback_factory` builds the model in a worker thread when the
+    first page fails instead. The retry is kept unless it has more problems
+    than the original.
+    """
+
+    def __init__(self, fallback_model=None, fallback_model_id=None, fallback_factory=None):
+        self.fallback_model = fallback_model
+        self.fallback_model_id = fallback_model_id
+        self._fallback_factory = fallback_factory
+        self._fallback_lock = None
+        self.failed = 0
+        self.escalated = 0
+
+    async def get_fallback(self):
+        """The fallback model, built on first use; None if there is none or it can't be used"""
+        if self.fallback_model is not None or self._fallback_factory is None:
+            return self.fallback_model
+        if self._fallback_lock is None:
+            self._fallback_lock = asyncio.Lock()
+        async with self._fallback_lock:
+            if self.fallback_model is None and self._fallback_factory is not None:
+                try:
+                    self.fallback_model = await asyncio.to_thread(self._fallback_factory)
+                except Exception as e:
+                    logger.warning("Fallback model %s unavailable, keeping failed pages: %s",
+                                   self.fallback_model_id, e)
+                    self._fallback_factory = None
+        return self.fallback_model
+
+    def check(self, page, markdown):
+        problems = check_page(markdown)
+        if problems:
+            self.failed += 1
+            logger.warning("Page %d failed quality checks: %s", page, "; ".join(problems), extra={
+                "page": page,
+                "fallback_model": self.fallback_model_id,
+            })
+        return problems
+
+    def choose(self, page, markdown, problems, retry):
+        """Keep the fallback model's Markdown unless it is worse"""
+        self.escalated += 1
+        retry_problems = check_page(retry)
+        if retry_problems:
+            logger.warning("Page %d still has problems on %s: %s",
+                           page, self.fallback_model_id, "; ".join(retry_problems))
+        return retry if len(retry_problems) <= len(problems) else markdown
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Model requests in flight across all conversions on one event loop
+DEFAULT_SLOTS = 10
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    """Scheduling policy for one class of conversion jobs
+
+    weight: share of slots while several classes are waiting
+    reserved: slots other classes may never take, kept free for this one
+    max_wait: queueing SLA in seconds; an overdue page is served next
+    timeout: default deadline in seconds for a document of this class
+    """
+    name: str
+    weight: float = 1.0
+    reserved: int = 0
+    max_wait: Optional[float] = None
+    timeout: Optional[float] = None
+
+
+DEFAULT_CLASSES = (
+    PriorityClass(INTERACTIVE, weight=4.0, reserved=2, max_wait=5.0),
+    PriorityClass(BULK, weight=1.0, reserved=0, max_wait=300.0),
+)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    enqueued: float
+
+
+class PageScheduler:
+    """Shares the model's request slots between priority classes
+
+    Every page acquires a slot around its model call. When a slot frees up
+    the next page is chosen by weighted fair queuing between the classes
+    with pending pages, so interactive pages overtake queued bulk pages
+    instead of waiting behind a whole backfill. A page queued longer than
+    its class's max_wait is served first. Slots reserved for a class are
+    never handed to another one, keeping the interactive path responsive
+    while bulk work saturates the rest.
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS, classes=DEFAULT_CLASSES):
+        self.slots = slots
+        self.classes = {cls.name: cls for cls in classes}
+        if sum(cls.reserved for cls in classes) >= slots:
+            raise ValueError("Reserved slots must leave at least one shared slot")
+        self._queues = {name: deque() for name in self.classes}
+        self._running = dict.fromkeys(self.classes, 0)
+        # Virtual time per class for weighted fair queuing
+        self._pass = dict.fromkeys(self.classes, 0.0)
+        self.sla_misses = dict.fromkeys(self.classes, 0)
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build from the `scheduling` section of config.yaml"""
+        settings = settings or {}
+        classes = {c.name: c for c in DEFAULT_CLASSES}
+        for name, overrides in (settings.get("classes") or {}).items():
+            base = classes.get(name, PriorityClass(name))
+            classes[name] = replace(base, **{k: v for k, v in (overrides or {}).items() if v is not None})
+        return cls(slots=settings.get("slots") or DEFAULT_SLOTS, classes=tuple(classes.values()))
+
+    def policy(self, priority):
+        """PriorityClass for a class name"""
+        try:
+            return self.classes[priority]
+        except KeyError:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+    @property
+    def running(self):
+        return sum(self._running.values())
+
+    def _may_start(self, name):
+        # Keep the unused part of other classes' reservations free
+        held_back = sum(
+            max(0, cls.reserved - self._running[other])
+            for other, cls in self.classes.items() if other != name
+        )
+        return self.slots - self.running > held_back
+
+    def _head(self, name):
+        queue = self._queues[name]
+        while queue and queue[0].future.done():
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def _pick(self):
+        now = time.monotonic()
+        eligible = [name for name in self.classes if self._head(name) is not None and self._may_start(name)]
+        if not eligible:
+            return None
+        overdue = [
+            (now - self._head(name).enqueued - self.classes[name].max_wait, name)
+            for name in eligible
+            if self.classes[name].max_wait is not None
+            and now - self._head(name).enqueued >= self.classes[name].max_wait
+        ]
+        if overdue:
+            return max(overdue)[1]
+        return min(eligible, key=lambda name: self._pass[name])
+
+    def _dispatch(self):
+        while self.running < self.slots:
+            name = self._pick()
+            if name is None:
+                return
+            waiter = self._queues[name].popleft()
+            cls = self.classes[name]
+            waited = time.monotonic() - waiter.enqueued
+            if cls.max_wait is not None and waited > cls.max_wait:
+                self.sla_misses[name] += 1
+                logger.warning("%s page waited %.1fs for a model slot (SLA %.1fs)", name, waited, cls.max_wait)
+            self._running[name] += 1
+            self._pass[name] += 1.0 / cls.weight
+            waiter.future.set_result(None)
+
+    def _enqueue(self, name, waiter):
+        if not self._queues[name] and not self._running[name]:
+            # A class returning from idle starts level with the busy ones
+            # rather than claiming every slot to catch up
+            busy = [self._pass[other] for other in self.classes if self._queues[other] or self._running[other]]
+            if busy:
+                self._pass[name] = max(self._pass[name], min(busy))
+        self._queues[name].append(waiter)
+
+    def _release(self, name):
+        self._running[name] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority, cancel_token=None):
+        """Hold one model request slot for a page of the given class"""
+        self.policy(priority)
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), time.monotonic())
+        self._enqueue(priority, waiter)
+        self._dispatch()
+        try:
+            if cancel_token is not None:
+                await cancel_token.guard(waiter.future)
+            else:
+                await waiter.future
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we gave up
+                self._release(priority)
+            else:
+                waiter.future.cancel()
+            raise
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+
+@asynccontextmanager
+async def model_slot(scheduler, priority, cancel_token=None):
+    """scheduler.slot(), or no limit when running without a scheduler"""
+    if scheduler is None:
+        yield
+    else:
+        async with scheduler.slot(priority, cancel_token):
+            yield
@@ -0,0 +1,254 @@
+import re
+import sys
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = "search.sqlite3"
+# unicode61 splits on punctuation and spaces; "trigram" also finds words
+# inside unsegmented text such as Chinese, at roughly three times the size
+DEFAULT_TOKENIZER = "unicode61 remove_diacritics 2"
+
+# Queued pages written in one transaction
+WRITE_BATCH = 100
+
+_HEADING_RE = re.compile(r"^#{1,6}[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    source TEXT,
+    model_id TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS documents_path ON documents(path);
+CREATE TABLE IF NOT EXISTS pages (
+    document_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    PRIMARY KEY (document_id, page)
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    heading TEXT NOT NULL DEFAULT '',
+    char_offset INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_page ON sections(document_id, page);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(
+    content, content='sections', content_rowid='id', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS sections_ai AFTER INSERT ON sections BEGIN
+    INSERT INTO sections_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS sections_ad AFTER DELETE ON sections BEGIN
+    INSERT INTO sections_fts(sections_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def split_sections(markdown):
+    """(heading, offset, text) for each heading-delimited section of a page
+
+    Text before the first heading gets an empty heading; offsets are
+    character positions within the page.
+    """
+    starts = [m.start() for m in _HEADING_RE.finditer(markdown)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(markdown)
+        raw = markdown[start:end]
+        text = raw.strip()
+        if not text:
+            continue
+        match = _HEADING_RE.match(markdown, start)
+        sections.append((match.group(1).strip() if match else "", start + len(raw) - len(raw.lstrip()), text))
+    return sections
+
+
+class SearchIndex:
+    """SQLite FTS5 index of converted Markdown, filled while pages are recognised
+
+    Each page is split into heading sections and inserted as soon as it is
+    recognised, by a writer thread so that add_page() never blocks the
+    caller's event loop. Once the Markdown file has been written, finish_document()
+    records where every page starts in it and makes the document
+    searchable, replacing the previous conversion of the same file. A
+    conversion that fails never replaces a good one.
+    """
+
+    def __init__(self, db_path, tokenizer=DEFAULT_TOKENIZER):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA.format(tokenizer=tokenizer))
+        self._pages = queue.Queue()
+        self._writer = threading.Thread(target=self._write_pages, name="search-index-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        self._pages.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+    def _write_pages(self):
+        # Items are (doc_id, page, markdown), an Event set once everything
+        # queued before it is written, or None to stop
+        while True:
+            batch = [self._pages.get()]
+            while len(batch) < WRITE_BATCH and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self._pages.get_nowait())
+                except queue.Empty:
+                    break
+            pages = [item for item in batch if isinstance(item, tuple)]
+            try:
+                rows = [(doc_id, page, split_sections(markdown or "")) for doc_id, page, markdown in pages]
+                with self._lock, self._conn:
+                    for doc_id, page, sections in rows:
+                        self._insert_sections(doc_id, page, sections)
+            except Exception as e:
+                logger.warning("Failed to index %d page(s): %s", len(pages), e)
+            finally:
+                if isinstance(batch[-1], threading.Event):
+                    batch[-1].set()
+            if None in batch:
+                return
+
+    def _insert_sections(self, doc_id, page, sections):
+        self._conn.execute("DELETE FROM sections WHERE document_id = ? AND page = ?", (doc_id, page))
+        self._conn.executemany(
+            "INSERT INTO sections (document_id, page, heading, char_offset, content) VALUES (?, ?, ?, ?, ?)",
+            [(doc_id, page, heading, offset, text) for heading, offset, text in sections],
+        )
+
+    def _delete_documents(self, ids):
+        for doc_id in ids:
+            self._conn.execute("DELETE FROM sections WHERE document_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM pages WHERE document_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def begin_document(self, path, source=None, model_id=None):
+        """Start indexing a conversion whose Markdown will be written to `path`"""
+        with self._lock, self._conn:
+            stale = self._conn.execute(
+                "SELECT id FROM documents WHERE path = ? AND complete = 0", (path,)
+            ).fetchall()
+            self._delete_documents(row[0] for row in stale)
+            cursor = self._conn.execute(
+                "INSERT INTO documents (path, source, model_id, updated) VALUES (?, ?, ?, ?)",
+                (path, source, model_id, time.time()),
+            )
+            return cursor.lastrowid
+
+    def add_page(self, doc_id, page, markdown):
+        """Queue one recognised page for indexing, replacing any earlier version of it"""
+        self._pages.put((doc_id, page, markdown))
+
+    def finish_document(self, doc_id, pages):
+        """Mark a conversion complete
+
+        `pages` lists (page, markdown) in the order they were written to the
+        file, joined by blank lines. Pages that never went through add_page
+        (e.g. restored from a checkpoint) are indexed here. Blocks until
+        the pages queued so far are written, so call it from a worker thread;
+        pages other conversions queue meanwhile are not waited for.
+        """
+        flushed = threading.Event()
+        self._pages.put(flushed)
+        flushed.wait()
+        with self._lock:
+            indexed = {row[0] for row in self._conn.execute(
+                "SELECT DISTINCT page FROM sections WHERE document_id = ?", (doc_id,)
+            )}
+        # Split outside the lock so other documents' pages keep being written
+        missing = {page: split_sections(markdown) for page, markdown in pages if page not in indexed}
+        with self._lock, self._conn:
+            start = 0
+            last_heading = ""
+            for page, markdown in pages:
+                if page in missing:
+                    self._insert_sections(doc_id, page, missing[page])
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pages (document_id, page, start) VALUES (?, ?, ?)",
+                    (doc_id, page, start),
+                )
+                start += len(markdown) + 2
+                # A page that starts mid-section belongs under the previous page's last heading
+                for section_id, heading in self._conn.execute(
+                    "SELECT id, heading FROM sections WHERE document_id = ? AND page = ? ORDER BY char_offset",
+                    (doc_id, page),
+                ).fetchall():
+                    if heading:
+                        last_heading = heading
+                    elif last_heading:
+                        self._conn.execute("UPDATE sections SET heading = ? WHERE id = ?", (last_heading, section_id))
+
+            path = self._conn.execute("SELECT path FROM documents WHERE id = ?", (doc_id,)).fetchone()[0]
+            previous = self._conn.execute(
+                "SELECT id FROM documents WHERE path = ? AND id != ?", (path, doc_id)
+            ).fetchall()
+            self._delete_documents(row[0] for row in previous)
+            self._conn.execute(
+                "UPDATE documents SET complete = 1, updated = ? WHERE id = ?", (time.time(), doc_id)
+            )
+
+    def search(self, query, limit=20):
+        """Best matching sections of completed documents
+
+        `query` uses FTS5 syntax. `offset` is the section's character
+        position in the Markdown file.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT d.path, s.page, s.heading, p.start + s.char_offset,
+                       snippet(sections_fts, 0, '[', ']', '...', 12)
+                FROM sections_fts
+                JOIN sections s ON s.id = sections_fts.rowid
+                JOIN documents d ON d.id = s.document_id
+                LEFT JOIN pages p ON p.document_id = s.document_id AND p.page = s.page
+                WHERE sections_fts MATCH ? AND d.complete = 1
+                ORDER BY rank
+                LIMIT ?
+                """,
+                (query, limit),
+            ).fetchall()
+        return [
+            {"document": path, "page": page, "heading": heading, "offset": offset, "snippet": snippet}
+            for path, page, heading, offset, snippet in rows
+        ]
+
+
+def main(argv=None):
+    """python search_index.py <index file> <query>"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("Usage: python search_index.py <index file> <query>", file=sys.stderr)
+        return 2
+    index = SearchIndex(argv[0])
+    try:
+        for hit in index.search(argv[1]):
+            heading = f" > {hit['heading']}" if hit["heading"] else ""
+            print(f"{hit['document']}:{hit['page']} @{hit['offset']}{heading}\n    {hit['snippet']}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
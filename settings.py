@@ -2,6 +2,7 @@ import customtkinter as ctk
 from tkinter import messagebox
 import yaml
 import os
+from model_registry import get_config_store
 
 class SettingsDialog(ctk.CTkToplevel):
     def __init__(self, parent):
@@ -163,25 +164,14 @@ class SettingsDialog(ctk.CTkToplevel):
             with open(self.config_file, "w", encoding="utf-8") as f:
                 yaml.dump(self.config, f, allow_unicode=True, sort_keys=False)
             
-            # Update environment variables
-            self.update_environment_variables()
+            # Pick up the new credentials without touching process environment
+            get_config_store(self.config_file).reload()
             
             self.destroy()
             messagebox.showinfo("Success", "Settings saved successfully")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save settings: {str(e)}")
     
-    def update_environment_variables(self):
-        """Update environment variables"""
-        # Update environment variables for all models
-        for vendor in self.config.get("vendors", []):
-            for model in vendor.get("models", []):
-                for env_var in model.get("env_vars", []):
-                    key = env_var.get("key", "")
-                    value = env_var.get("value", "")
-                    if value:  # Only set non-empty values
-                        os.environ[key] = value
-            
     def center_window(self):
         """Center window in parent window"""
         self.update_idletasks()
@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+import time
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR_NAME = ".ocr2md_state"
+INDEX_FILE_NAME = "index.json"
+STATE_VERSION = 1
+# A batch rewrites index.json at most this often; the rest is saved at the end
+SAVE_INTERVAL = 30.0
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    """Write JSON atomically so an interrupted run never leaves a torn index"""
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class PageCache:
+    """Markdown of previously recognised pages, keyed by rendered image hash
+
+    Pages whose rendered image is unchanged reuse their old Markdown;
+    everything seen during a conversion is recorded for the next run.
+    """
+
+    def __init__(self, pages=None):
+        self._by_digest = {entry["digest"]: entry["markdown"] for entry in (pages or [])}
+        self.recorded = {}
+        self.hits = 0
+
+    def get(self, digest):
+        markdown = self._by_digest.get(digest)
+        if markdown is not None:
+            self.hits += 1
+        return markdown
+
+    def record(self, page, digest, markdown):
+        self.recorded[page] = {"digest": digest, "markdown": markdown}
+
+    def pages(self):
+        return [dict(self.recorded[page], page=page) for page in sorted(self.recorded)]
+
+
+class StateIndex:
+    """Per-output-folder record of what has been converted
+
+    index.json maps each input path to its size, mtime, content hash, model
+    and output file. The Markdown of every page is kept in a sidecar file so
+    a changed PDF only needs its changed pages re-recognised.
+    Methods may be called from worker threads. update() only writes the
+    file's own sidecar; index.json is rewritten by save(), which callers
+    can ask to skip unless SAVE_INTERVAL has passed since the last write.
+    """
+
+    def __init__(self, output_folder, save_interval=SAVE_INTERVAL):
+        self.state_dir = os.path.join(output_folder, STATE_DIR_NAME)
+        self.index_path = os.path.join(self.state_dir, INDEX_FILE_NAME)
+        self.save_interval = save_interval
+        self.files = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == STATE_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable state index %s: %s", self.index_path, e)
+            self.files = {}
+
+    def save(self, force=True):
+        """Write index.json if anything changed; with force=False only once SAVE_INTERVAL has passed"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                if not force and time.monotonic() - self._saved_at < self.save_interval:
+                    return False
+                files = dict(self.files)
+                self._dirty = False
+            try:
+                _write_json(self.index_path, {"version": STATE_VERSION, "files": files})
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                raise
+            self._saved_at = time.monotonic()
+            return True
+
+    def _pages_path(self, key):
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.state_dir, f"{name}.json")
+
+    @staticmethod
+    def key(input_path):
+        return os.path.abspath(input_path)
+
+    def check(self, input_path, model_id):
+        """Return (unchanged, content_digest) for an input file
+
+        Size and mtime are compared first; the content is only hashed when
+        they differ, so a nightly run over untouched files costs a stat each.
+        """
+        entry = self.files.get(self.key(input_path))
+        st = os.stat(input_path)
+        if entry is None or entry.get("model_id") != model_id:
+            return False, None
+        if not entry.get("output") or not os.path.exists(entry["output"]):
+            return False, None
+        if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return True, entry["sha256"]
+
+        digest = file_digest(input_path)
+        if digest == entry["sha256"]:
+            # Touched but not modified
+            with self._lock:
+                entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+                self._dirty = True
+            return True, digest
+        return False, digest
+
+    def page_cache(self, input_path, model_id):
+        """PageCache seeded with the pages from the last conversion of this file"""
+        entry = self.files.get(self.key(input_path))
+        if entry is None or entry.get("model_id") != model_id:
+            return PageCache()
+        try:
+            with open(self._pages_path(self.key(input_path)), "r", encoding="utf-8") as f:
+                return PageCache(json.load(f))
+        except (OSError, ValueError):
+            return PageCache()
+
+    def update(self, input_path, model_id, output_file, page_cache, digest=None):
+        """Record a successful conversion"""
+        key = self.key(input_path)
+        st = os.stat(input_path)
+        _write_json(self._pages_path(key), page_cache.pages())
+        entry = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest or file_digest(input_path),
+            "model_id": model_id,
+            "output": output_file,
+        }
+        with self._lock:
+            self.files[key] = entry
+            self._dirty = True
+
+    def prune(self, input_folder, existing_paths):
+        """Forget files from `input_folder` that no longer exist"""
+        prefix = os.path.join(os.path.abspath(input_folder), "")
+        keep = {self.key(p) for p in existing_paths}
+        with self._lock:
+            removed = [k for k in self.files if k.startswith(prefix) and k not in keep]
+            for key in removed:
+                del self.files[key]
+            self._dirty = self._dirty or bool(removed)
+        for key in removed:
+            pages_path = self._pages_path(key)
+            if os.path.exists(pages_path):
+                os.remove(pages_path)
@@ -0,0 +1,388 @@
+import os
+import re
+import sys
+import json
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from state_index import _write_json
+from cancellation import Notifier
+
+logger = logging.getLogger(__name__)
+
+# Executables searched on PATH, in order of preference
+TOOL_NAMES = {
+    "soffice": ("soffice", "libreoffice"),
+    "gm": ("gm",),
+    "pdftoppm": ("pdftoppm",),
+    "pdfinfo": ("pdfinfo",),
+}
+# Usual install locations, for tools missing from PATH (e.g. the GUI started
+# from Finder, which doesn't see Homebrew's PATH)
+KNOWN_LOCATIONS = {
+    "soffice": (
+        "/Applications/LibreOffice.app/Contents/MacOS/soffice",
+        "/usr/lib/libreoffice/program/soffice",
+        "/opt/libreoffice/program/soffice",
+        r"C:\Program Files\LibreOffice\program\soffice.exe",
+    ),
+    "gm": ("/opt/homebrew/bin/gm", "/usr/local/bin/gm"),
+    "pdftoppm": ("/opt/homebrew/bin/pdftoppm", "/usr/local/bin/pdftoppm"),
+    "pdfinfo": ("/opt/homebrew/bin/pdfinfo", "/usr/local/bin/pdfinfo"),
+}
+VERSION_ARGS = {
+    "soffice": ("--version",),
+    "gm": ("version",),
+    "pdftoppm": ("-v",),
+    "pdfinfo": ("-v",),
+}
+# OCR2MD_SOFFICE=/path/to/soffice etc. override discovery
+ENV_PREFIX = "OCR2MD_"
+# A cold LibreOffice start can take a while
+PROBE_TIMEOUT = 60
+CACHE_FILE_NAME = "tools.json"
+
+# Memory one LibreOffice conversion may use, for sizing the office pool
+OFFICE_WORKER_BYTES = 768 * 1024 * 1024
+# Memory one document conversion may use while pages render, for sizing batches
+DOCUMENT_WORKER_BYTES = 512 * 1024 * 1024
+
+_VERSION_RE = re.compile(r"(\d+(?:\.\d+)+)")
+
+
+@dataclass(frozen=True)
+class ToolInfo:
+    """An external converter found on this machine"""
+    name: str
+    path: Optional[str] = None
+    version: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def available(self):
+        return self.path is not None and self.error is None
+
+
+def default_cache_path():
+    """Probe cache in the user cache directory, shared by every worker on the host"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+    return os.path.join(base, "ocr2md", CACHE_FILE_NAME)
+
+
+def find_tool(name, override=None):
+    """Path of a tool from `override`, OCR2MD_<NAME>, PATH or a known location"""
+    override = override or os.environ.get(ENV_PREFIX + name.upper())
+    if override:
+        return shutil.which(override) or (override if os.path.isfile(override) else None)
+    for executable in TOOL_NAMES[name]:
+        path = shutil.which(executable)
+        if path:
+            return path
+    for path in KNOWN_LOCATIONS.get(name, ()):
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def probe_tool(name, path):
+    """Run a tool's version command; a tool that can't start is reported unavailable"""
+    try:
+        result = subprocess.run(
+            [path, *VERSION_ARGS[name]],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            errors="replace",
+            timeout=PROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return ToolInfo(name, path, error=str(e))
+    # poppler prints its version to stderr, and old releases exit non-zero
+    match = _VERSION_RE.search(result.stdout + result.stderr)
+    if match is None and result.returncode != 0:
+        return ToolInfo(name, path, error=(result.stderr or result.stdout).strip()[:200])
+    return ToolInfo(name, path, version=match.group(1) if match else None)
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _link_directory(tools):
+    """Temporary directory of links named after each tool, removed at exit; None if links fail"""
+    directory = tempfile.mkdtemp(prefix="ocr2md_poppler_")
+    atexit.register(shutil.rmtree, directory, True)
+    try:
+        for name, path in tools.items():
+            os.symlink(path, os.path.join(directory, name + os.path.splitext(path)[1]))
+    except OSError as e:
+        # e.g. Windows without the symlink privilege
+        logger.warning("Could not link poppler tools into %s: %s", directory, e)
+        return None
+    return directory
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class ToolSet:
+    """Converters available on this machine, probed once and cached
+
+    Probes are cached in memory and in `cache_path`, keyed by each binary's
+    path, size and modification time, so workers starting on the same host
+    (or image) don't each pay for a cold LibreOffice start; upgrading a tool
+    invalidates its entry.
+    """
+
+    def __init__(self, tools):
+        self.tools = tools
+        self._poppler_links = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def detect(cls, overrides=None, cache_path=None):
+        overrides = overrides or {}
+        cache_path = cache_path or default_cache_path()
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+        tools, changed = {}, False
+        for name in TOOL_NAMES:
+            path = find_tool(name, overrides.get(name))
+            if path is None:
+                tools[name] = ToolInfo(name, error="not found")
+                continue
+            try:
+                key = _fingerprint(path)
+            except OSError:
+                key = None
+            cached = cache.get(name)
+            if key and cached and cached.get("key") == key:
+                tools[name] = ToolInfo(**cached["info"])
+                continue
+            tools[name] = probe_tool(name, path)
+            if key:
+                cache[name] = {"key": key, "info": asdict(tools[name])}
+                changed = True
+
+        if changed:
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                _write_json(cache_path, cache)
+            except OSError as e:
+                logger.debug("Could not write tool cache %s: %s", cache_path, e)
+        for info in tools.values():
+            if info.available:
+                logger.info("Found %s %s at %s", info.name, info.version or "(unknown version)", info.path)
+            else:
+                logger.info("%s unavailable: %s", info.name, info.error)
+        return cls(tools)
+
+    def get(self, name):
+        """Path of an available tool, or None"""
+        info = self.tools.get(name)
+        return info.path if info is not None and info.available else None
+
+    @property
+    def poppler_path(self):
+        """Directory to pass to pdf2image as poppler_path, or None to use PATH
+
+        pdf2image runs both pdftoppm and pdfinfo from one directory under
+        their standard names. When the tools found aren't laid out like that
+        (e.g. overridden separately), a directory of links to them is made.
+        """
+        pdftoppm, pdfinfo = self.get("pdftoppm"), self.get("pdfinfo")
+        if pdftoppm is None or pdfinfo is None:
+            return None
+        if shutil.which("pdftoppm") == pdftoppm and shutil.which("pdfinfo") == pdfinfo:
+            return None
+        directory = os.path.dirname(pdftoppm)
+        if (os.path.dirname(pdfinfo) == directory and _stem(pdftoppm) == "pdftoppm"
+                and _stem(pdfinfo) == "pdfinfo"):
+            return directory
+        with self._lock:
+            if self._poppler_links is None:
+                self._poppler_links = _link_directory({"pdftoppm": pdftoppm, "pdfinfo": pdfinfo}) or directory
+            return self._poppler_links
+
+    def capabilities(self):
+        """What this machine can convert, for health checks and worker startup logs"""
+        return {
+            "office_to_pdf": self.get("soffice") is not None,
+            # Pillow takes over image conversion when GraphicsMagick is missing
+            "image_to_pdf": True,
+            "render_pdf": self.get("pdftoppm") is not None and self.get("pdfinfo") is not None,
+        }
+
+
+_detected = None
+_detected_overrides = None
+_detect_lock = threading.Lock()
+
+
+def get_tools(overrides=None, refresh=False):
+    """Process-wide ToolSet, detected on first use
+
+    `overrides` maps tool names to paths (the `tools` section of
+    config.yaml); passing different ones detects again. None keeps whatever
+    was detected last.
+    """
+    global _detected, _detected_overrides
+    with _detect_lock:
+        changed = overrides is not None and dict(overrides) != _detected_overrides
+        if _detected is None or refresh or changed:
+            _detected = ToolSet.detect(overrides)
+            _detected_overrides = dict(overrides or {})
+        return _detected
+
+
+def _cgroup_value(*paths):
+    for path in paths:
+        try:
+            with open(path) as f:
+                return f.read().split()
+        except OSError:
+            continue
+    return None
+
+
+def available_cpus():
+    """CPUs this process may use, honouring affinity and container CPU quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_value("/sys/fs/cgroup/cpu.max")
+    if quota and quota[0] != "max":
+        cpus = min(cpus, max(1, -(-int(quota[0]) // int(quota[1]))))
+    else:
+        v1_quota = _cgroup_value("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        v1_period = _cgroup_value("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if v1_quota and v1_period and int(v1_quota[0]) > 0:
+            cpus = min(cpus, max(1, -(-int(v1_quota[0]) // int(v1_period[0]))))
+    return cpus
+
+
+def available_memory():
+    """Bytes of memory this process may use, honouring container limits (None if unknown)"""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        memory = None
+    limit = _cgroup_value("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit and limit[0].isdigit():
+        # cgroup v1 reports "no limit" as a huge number
+        memory = min(memory, int(limit[0])) if memory else int(limit[0])
+    return memory
+
+
+@dataclass(frozen=True)
+class WorkerLimits:
+    """Pool sizes derived from the cores and memory available"""
+    cpus: int
+    memory: Optional[int]
+    office_workers: int
+    documents: int
+
+    @classmethod
+    def detect(cls, settings=None):
+        """Sized from the machine, with overrides from the `workers` section of config.yaml"""
+        settings = settings or {}
+        cpus = available_cpus()
+        memory = available_memory()
+        office = cpus if memory is None else min(cpus, memory // OFFICE_WORKER_BYTES)
+        # Documents mostly wait on the model API, so allow two per core
+        documents = 2 * cpus if memory is None else min(2 * cpus, memory // DOCUMENT_WORKER_BYTES)
+        return cls(
+            cpus=cpus,
+            memory=memory,
+            office_workers=settings.get("office") or max(1, office),
+            documents=settings.get("documents") or max(1, documents),
+        )
+
+
+class OfficePool:
+    """Limits concurrent LibreOffice conversions and gives each its own profile
+
+    soffice processes sharing a user profile hand their work to whichever
+    instance started first, or fail, so each slot has a private profile
+    directory. Profiles are kept between conversions to save LibreOffice's
+    first-start setup and removed at exit. Slots are shared by every event
+    loop in the process.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._free = []
+        self._released = Notifier()
+        self._created = 0
+        self._profiles = []
+        atexit.register(self.cleanup)
+
+    def _try_acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            if self._created < self.size:
+                self._created += 1
+                path = tempfile.mkdtemp(prefix="ocr2md_lo_")
+                self._profiles.append(path)
+                return path
+            return None
+
+    def _release(self, profile):
+        with self._lock:
+            self._free.append(profile)
+        self._released.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, cancel_token=None):
+        """Wait for a free slot; yields the -env:UserInstallation argument for soffice"""
+        profile = await self._released.wait_for(self._try_acquire, cancel_token)
+        try:
+            yield f"-env:UserInstallation={Path(profile).as_uri()}"
+        finally:
+            self._release(profile)
+
+    def cleanup(self):
+        with self._lock:
+            for path in self._profiles:
+                shutil.rmtree(path, ignore_errors=True)
+            self._profiles.clear()
+            self._free.clear()
+
+
+def main(argv=None):
+    """python system_tools.py [--refresh]: print detected tools and pool sizes"""
+    argv = sys.argv[1:] if argv is None else argv
+    tools = get_tools(refresh="--refresh" in argv)
+    for info in tools.tools.values():
+        status = f"{info.version or 'unknown version'} at {info.path}" if info.available else info.error
+        print(f"{info.name:9} {status}")
+    limits = WorkerLimits.detect()
+    memory = f"{limits.memory / 2 ** 30:.1f} GiB" if limits.memory else "unknown"
+    print(f"cpus {limits.cpus}, memory {memory}: "
+          f"{limits.office_workers} office workers, {limits.documents} concurrent documents")
+    missing = [name for name, ok in tools.capabilities().items() if not ok]
+    if missing:
+        print(f"Missing capabilities: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
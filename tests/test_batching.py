@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from PIL import Image
+
+from batching import PageBatcher, split_pages, PAGE_MARKER, MAX_BATCH_PAGES
+from model_registry import parse_config, ConfigError
+
+
+def response(*pages):
+    return "\n".join(f"{PAGE_MARKER.format(i)}\n{text}" for i, text in enumerate(pages, 1))
+
+
+def test_split_pages():
+    assert split_pages(response("# One", "", "Three"), 3) == ["# One", "", "Three"]
+
+
+def test_split_pages_allows_text_before_markers():
+    assert split_pages("Here are the pages:\n" + response("a", "b"), 2) == ["a", "b"]
+
+
+@pytest.mark.parametrize("content", [
+    response("a", "b"),                                      # page missing
+    response("a", "b", "c", "d"),                            # page extra
+    "<<<PAGE 2>>>\nb\n<<<PAGE 1>>>\na\n<<<PAGE 3>>>\nc",     # out of order
+    response("a", "b") + "\n<<<PAGE 2>>>\nb",                # duplicated
+    "a <<<PAGE 1>>> b <<<PAGE 2>>> c <<<PAGE 3>>>",          # markers not on their own line
+    "",
+    None,
+])
+def test_split_pages_rejects_bad_markers(content):
+    assert split_pages(content, 3) is None
+
+
+class FakeBatcher(PageBatcher):
+    """PageBatcher answering from a script instead of a model"""
+
+    def __init__(self, batched_reply, **kwargs):
+        super().__init__(vision_model=None, **kwargs)
+        self.batched_reply = batched_reply
+        self.sizes = []
+
+    async def _complete(self, pages):
+        self.sizes.append(len(pages))
+        if len(pages) > 1:
+            return self.batched_reply(len(pages))
+        return "single"
+
+
+def run_pages(batcher, tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = str(tmp_path / f"page{i}.png")
+        Image.new("RGB", (10, 10), "white").save(path)
+        paths.append(path)
+
+    async def main():
+        return await asyncio.gather(*(batcher.ocr(path) for path in paths))
+    return asyncio.run(main())
+
+
+def test_batched_pages_are_split_by_marker(tmp_path):
+    batcher = FakeBatcher(lambda n: response(*(f"page {i}" for i in range(1, n + 1))), max_pages=4, linger=0.01)
+    assert run_pages(batcher, tmp_path, 4) == ["page 1", "page 2", "page 3", "page 4"]
+    assert batcher.sizes == [4]
+
+
+def test_failed_marker_check_resends_pages_one_by_one(tmp_path):
+    batcher = FakeBatcher(lambda n: "all pages merged together", max_pages=3, linger=0.01)
+    assert run_pages(batcher, tmp_path, 3) == ["single"] * 3
+    assert batcher.sizes == [3, 1, 1, 1]
+
+
+def test_from_config():
+    batcher = PageBatcher.from_config(None, {"max_pixels": 5_000_000, "max_pages": 2, "linger": 0})
+    assert (batcher.max_pixels, batcher.max_pages, batcher.linger) == (5_000_000, 2, 0)
+    assert PageBatcher.from_config(None, {}).max_pages == MAX_BATCH_PAGES
+
+
+@pytest.mark.parametrize("batching", [
+    {"max_pages": 0},
+    {"max_pixels": "lots"},
+    {"linger": -1},
+    {"max_tokens": 100},
+])
+def test_invalid_batching_config(batching):
+    with pytest.raises(ConfigError):
+        parse_config({"batching": batching})
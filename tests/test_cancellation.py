@@ -0,0 +1,125 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelToken, OperationCancelled, DeadlineExceeded
+
+
+def test_cancel_propagates_to_children():
+    parent = CancelToken()
+    child = parent.child()
+    grandchild = child.child()
+    parent.cancel("Stopped")
+    assert child.cancelled and grandchild.cancelled
+    with pytest.raises(OperationCancelled, match="Stopped"):
+        grandchild.check()
+
+
+def test_child_of_cancelled_token_starts_cancelled():
+    parent = CancelToken()
+    parent.cancel()
+    assert parent.child().cancelled
+
+
+def test_cancelling_a_child_leaves_the_parent():
+    parent = CancelToken()
+    parent.child().cancel()
+    assert not parent.cancelled
+
+
+def test_released_child_is_not_cancelled():
+    parent = CancelToken()
+    child = parent.child()
+    child.release()
+    parent.cancel()
+    assert not child.cancelled
+
+
+def test_child_deadline_only_tightens():
+    parent = CancelToken(timeout=10)
+    assert parent.child(timeout=60).deadline == parent.deadline
+    assert parent.child(timeout=1).deadline < parent.deadline
+    assert parent.child().deadline == parent.deadline
+
+
+def test_expired_deadline():
+    token = CancelToken(timeout=0)
+    assert token.expired
+    with pytest.raises(DeadlineExceeded):
+        token.check()
+
+
+def test_guard_returns_the_result():
+    async def main():
+        return await CancelToken().guard(asyncio.sleep(0, "done"))
+    assert asyncio.run(main()) == "done"
+
+
+def test_guard_is_woken_by_cancel_from_another_thread():
+    token = CancelToken()
+
+    async def main():
+        threading.Timer(0.05, token.cancel, args=("Stop",)).start()
+        started = time.monotonic()
+        with pytest.raises(OperationCancelled, match="Stop"):
+            await token.guard(asyncio.sleep(10))
+        return time.monotonic() - started
+    assert asyncio.run(main()) < 1
+
+
+def test_parent_cancel_wakes_a_child_guard():
+    parent = CancelToken()
+    child = parent.child()
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.05, parent.cancel)
+        with pytest.raises(OperationCancelled):
+            await child.guard(asyncio.sleep(10))
+    asyncio.run(main())
+
+
+def test_guard_deadline_and_timeout():
+    async def main():
+        with pytest.raises(DeadlineExceeded, match="Deadline"):
+            await CancelToken(timeout=0.05).guard(asyncio.sleep(10))
+        with pytest.raises(DeadlineExceeded, match="Timed out after 0.05"):
+            await CancelToken().guard(asyncio.sleep(10), timeout=0.05)
+    asyncio.run(main())
+
+
+def test_guard_on_cancelled_token_closes_the_coroutine():
+    token = CancelToken()
+    token.cancel()
+    coro = asyncio.sleep(0)
+
+    async def main():
+        with pytest.raises(OperationCancelled):
+            await token.guard(coro)
+    asyncio.run(main())
+    assert coro.cr_frame is None
+
+
+def test_cancelled_task_leaves_no_unretrieved_exception():
+    errors = []
+
+    async def fails_on_cancel():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            raise RuntimeError("cleanup failed")
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        task = asyncio.ensure_future(CancelToken().guard(asyncio.gather(fails_on_cancel())))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+        gc.collect()
+
+    asyncio.run(main())
+    assert errors == []
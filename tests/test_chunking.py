@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+import pytest
+from PyPDF2 import PdfWriter
+
+import pipeline
+from cancellation import CancelToken, OperationCancelled
+from chunking import ChunkCheckpoint, process_chunked
+from workspace import WorkspaceManager
+
+PAGES = list(range(1, 13))
+
+
+class Completion:
+    def __init__(self, content):
+        self.content = content
+
+
+class RecordingModel:
+    """Answers with the rendered image's name and records every call
+
+    `on_call` may raise or await to interrupt the run at a given image.
+    """
+
+    def __init__(self, on_call=None):
+        self.calls = []
+        self.on_call = on_call
+
+    async def completion(self, image_path, maintain_format, prior_page):
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        self.calls.append((name, prior_page))
+        if self.on_call is not None:
+            await self.on_call(name)
+        return Completion(f"text of {name}")
+
+
+async def fake_render(pdf_path, page, output_dir, dpi=pipeline.IMAGE_DENSITY, cancel_token=None,
+                      output_file=None, poppler_path=None):
+    path = os.path.join(output_dir, f"{output_file}.png")
+    with open(path, "wb") as f:
+        f.write(b"png")
+    return path
+
+
+@pytest.fixture
+def pdf_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "render_page", fake_render)
+    writer = PdfWriter()
+    for _ in PAGES:
+        writer.add_blank_page(width=200, height=200)
+    path = tmp_path / "large.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def convert(tmp_path, pdf_path, model, cancel_token=None, chunk_concurrency=3):
+    manager = WorkspaceManager(root=str(tmp_path))
+
+    async def main():
+        checkpoint = await ChunkCheckpoint.for_document(str(tmp_path / "out"), pdf_path, "mock/model")
+        async with manager.workspace(pdf_path) as workspace:
+            return await process_chunked(
+                pdf_path, PAGES, model, workspace, checkpoint=checkpoint, maintain_format=True,
+                cancel_token=cancel_token, chunk_pages=4, chunk_concurrency=chunk_concurrency,
+            )
+    return asyncio.run(main())
+
+
+def test_resume_skips_finished_chunks_and_their_seed_pages(tmp_path, pdf_path):
+    async def fail_first_chunk(name):
+        if name == "page_00002":
+            raise RuntimeError("model unavailable")
+
+    first = RecordingModel(fail_first_chunk)
+    with pytest.raises(RuntimeError):
+        convert(tmp_path, pdf_path, first)
+    # Chunks 2 and 3 ran alongside chunk 1, each recognising its seed page first
+    assert {"seed_00004", "seed_00008"} <= {name for name, _ in first.calls}
+
+    second = RecordingModel()
+    results = convert(tmp_path, pdf_path, second)
+    assert [name for name, _ in second.calls] == [f"page_{page:05d}" for page in (1, 2, 3, 4)]
+    assert results[5] == "text of page_00005"
+    assert results[4] == "text of page_00004"
+
+
+def test_resume_continues_from_checkpointed_page_without_seed(tmp_path, pdf_path):
+    async def fail_middle_chunk(name):
+        if name == "page_00006":
+            raise RuntimeError("model unavailable")
+
+    with pytest.raises(RuntimeError):
+        convert(tmp_path, pdf_path, RecordingModel(fail_middle_chunk))
+
+    second = RecordingModel()
+    convert(tmp_path, pdf_path, second)
+    # Page 4 is in the checkpoint, so it is passed as context, not recognised again
+    assert second.calls == [
+        ("page_00005", "text of page_00004"),
+        ("page_00006", "text of page_00005"),
+        ("page_00007", "text of page_00006"),
+        ("page_00008", "text of page_00007"),
+    ]
+
+
+def test_cancelled_run_resumes_after_last_saved_chunk(tmp_path, pdf_path):
+    token = CancelToken()
+
+    async def cancel_in_third_chunk(name):
+        if name != "page_00009":
+            return
+        # Cancel once both finished chunks are on disk, as a user would mid-run
+        while len([f for _, _, files in os.walk(tmp_path / "out") for f in files if f.endswith(".json")]) < 2:
+            await asyncio.sleep(0.01)
+        token.cancel()
+        await asyncio.sleep(10)
+
+    first = RecordingModel(cancel_in_third_chunk)
+    with pytest.raises(OperationCancelled):
+        convert(tmp_path, pdf_path, first, cancel_token=token, chunk_concurrency=1)
+    assert [name for name, _ in first.calls][-1] == "page_00009"
+
+    second = RecordingModel()
+    results = convert(tmp_path, pdf_path, second, chunk_concurrency=1)
+    assert second.calls == [
+        ("page_00009", "text of page_00008"),
+        ("page_00010", "text of page_00009"),
+        ("page_00011", "text of page_00010"),
+        ("page_00012", "text of page_00011"),
+    ]
+    assert list(results) == PAGES
@@ -0,0 +1,40 @@
+import pytest
+
+from cli import build_parser, join_page_values
+
+
+def parse(*argv):
+    return build_parser().parse_args(join_page_values(argv))
+
+
+@pytest.mark.parametrize("argv", [
+    ("-p", "-5..-1", "a.pdf"),
+    ("--pages", "-5..-1", "a.pdf"),
+    ("--pages=-5..-1", "a.pdf"),
+    ("-p-5..-1", "a.pdf"),
+])
+def test_pages_starting_with_a_dash(argv):
+    args = parse(*argv)
+    assert args.pages.resolve(10) == [6, 7, 8, 9, 10]
+    assert args.inputs == ["a.pdf"]
+
+
+def test_pages_value_is_not_taken_from_the_next_option():
+    assert join_page_values(["-p", "--model", "x"]) == ["-p", "--model", "x"]
+    assert join_page_values(["--", "-p", "-1"]) == ["--", "-p", "-1"]
+
+
+def test_positive_pages():
+    assert parse("a.pdf", "-p", "1,3").pages.resolve(5) == [1, 3]
+
+
+def test_profile_does_not_take_the_input():
+    args = parse("--profile", "report.pdf")
+    assert args.profile and args.profile_dump is None
+    assert args.inputs == ["report.pdf"]
+    assert parse("--profile-dump", "cprofile", "report.pdf").profile_dump == "cprofile"
+
+
+def test_keep_format_is_opt_in():
+    assert not parse("-p", "1-50", "a.pdf").keep_format
+    assert parse("-p", "1-50", "--keep-format", "a.pdf").keep_format
@@ -0,0 +1,47 @@
+import json
+import logging
+
+import pytest
+
+from logging_setup import setup_logging, stop_logging, correlation_scope
+from model_registry import parse_config, ConfigError
+
+
+def read_records(log_dir):
+    with open(log_dir / "ocr2md.log", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_json_records_keep_traceback_and_context(tmp_path):
+    setup_logging(log_dir=str(tmp_path), console=False)
+    try:
+        logger = logging.getLogger("test")
+        with correlation_scope(document="a.pdf", correlation_id="abc"):
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                logger.exception("Failed %s", "a.pdf", extra={"page": 3})
+    finally:
+        stop_logging()
+    record = read_records(tmp_path)[-1]
+    assert record["message"] == "Failed a.pdf"
+    assert "ValueError: boom" in record["exc_info"]
+    assert (record["correlation_id"], record["document"], record["page"]) == ("abc", "a.pdf", 3)
+
+
+def test_logging_config_accepts_all_keys():
+    settings = {"level": "debug", "sample_rate": 0.5, "json": False, "max_mb": 1.5, "backups": 0}
+    assert dict(parse_config({"logging": settings}).logging) == settings
+
+
+@pytest.mark.parametrize("settings", [
+    {"level": "LOUD"},
+    {"sample_rate": 2},
+    {"json": "yes"},
+    {"max_mb": 0},
+    {"backups": 1.5},
+    {"rotation": "daily"},
+])
+def test_invalid_logging_config(settings):
+    with pytest.raises(ConfigError):
+        parse_config({"logging": settings})
@@ -0,0 +1,40 @@
+import os
+
+from model_registry import parse_config, export_process_env
+
+
+def registry(*models):
+    return parse_config({"vendors": [{"name": "Vendor", "models": [
+        {"name": name, "model_id": name, "env_vars": [{"key": k, "value": v} for k, v in env.items()]}
+        for name, env in models
+    ]}]})
+
+
+def test_completion_kwargs():
+    spec = registry(("bedrock", {
+        "BEDROCK_API_KEY": "key",
+        "AWS_ACCESS_KEY_ID": "id",
+        "AWS_SECRET_ACCESS_KEY": "secret",
+        "AWS_REGION_NAME": "eu-west-1",
+        "VERTEXAI_PROJECT": "project",
+        "OR_SITE_URL": "https://example.com",
+        "EMPTY_API_BASE": "",
+    })).get("bedrock")
+    assert spec.completion_kwargs() == {
+        "api_key": "key",
+        "aws_access_key_id": "id",
+        "aws_secret_access_key": "secret",
+        "aws_region_name": "eu-west-1",
+        "vertex_project": "project",
+    }
+    assert spec.process_env() == {"OR_SITE_URL": "https://example.com"}
+
+
+def test_unmapped_env_vars_are_exported(monkeypatch):
+    monkeypatch.delenv("OCR2MD_TEST_SETTING", raising=False)
+    export_process_env(registry(
+        ("first", {"OCR2MD_TEST_SETTING": "a", "FIRST_API_KEY": "key"}),
+        ("second", {"OCR2MD_TEST_SETTING": "b"}),
+    ))
+    assert os.environ["OCR2MD_TEST_SETTING"] == "a"
+    assert "FIRST_API_KEY" not in os.environ
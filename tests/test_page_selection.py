@@ -0,0 +1,80 @@
+import pytest
+
+from page_selection import PageSelection, PageSelectionError, contiguous_runs
+
+
+def resolve(spec, page_count):
+    return PageSelection.parse(spec).resolve(page_count)
+
+
+@pytest.mark.parametrize("spec", [None, "", "  ", ","])
+def test_empty_selects_all_pages(spec):
+    assert PageSelection.parse(spec) is None
+
+
+@pytest.mark.parametrize("spec, page_count, expected", [
+    ("7", 10, [7]),
+    ("1,3,5-7", 10, [1, 3, 5, 6, 7]),
+    ("3..5", 10, [3, 4, 5]),
+    ("8-", 10, [8, 9, 10]),
+    ("8..", 10, [8, 9, 10]),
+    ("..3", 10, [1, 2, 3]),
+    ("-1", 10, [10]),
+    ("-5..-1", 10, [6, 7, 8, 9, 10]),
+    ("-3..", 10, [8, 9, 10]),
+    ("1-10:3", 10, [1, 4, 7, 10]),
+    (":4", 10, [1, 5, 9]),
+    ("5:2", 10, [5, 7, 9]),
+    ("3,1,3,2-3", 10, [1, 2, 3]),
+    (" 1 - 3 , 5 ", 10, [1, 2, 3, 5]),
+])
+def test_resolve(spec, page_count, expected):
+    assert resolve(spec, page_count) == expected
+
+
+def test_ranges_are_clipped_to_the_document():
+    assert resolve("8-20", 10) == [8, 9, 10]
+    assert resolve("-20..2", 10) == [1, 2]
+    assert resolve("20-", 10) == []
+
+
+def test_clipped_range_keeps_its_step():
+    # -12..-1:3 starts two pages before page 1 of a 10-page document
+    assert resolve("-12..-1:3", 10) == [2, 5, 8]
+
+
+@pytest.mark.parametrize("spec", ["11", "-11"])
+def test_single_page_out_of_range(spec):
+    with pytest.raises(PageSelectionError):
+        resolve(spec, 10)
+
+
+@pytest.mark.parametrize("spec", ["0", "0-3", "-", "..", "a", "1-2-3", "5-2", "1:0", "1;2"])
+def test_invalid_terms(spec):
+    with pytest.raises(PageSelectionError):
+        PageSelection.parse(spec)
+
+
+def test_round_trips_through_str():
+    for spec in ("1,3..5,-1", "-5..-1", "10..:2", "..4"):
+        selection = PageSelection.parse(spec)
+        assert PageSelection.parse(str(selection)).terms == selection.terms
+
+
+def test_coerce():
+    selection = PageSelection.parse("1-3")
+    assert PageSelection.coerce(selection) is selection
+    assert PageSelection.coerce(None) is None
+    assert PageSelection.coerce([]) is None
+    assert PageSelection.coerce("2-3").resolve(5) == [2, 3]
+    assert PageSelection.coerce(4).resolve(5) == [4]
+    assert PageSelection.coerce(["3", 1]).resolve(5) == [1, 3]
+    with pytest.raises(PageSelectionError):
+        PageSelection.coerce([0])
+    with pytest.raises(PageSelectionError):
+        PageSelection.coerce(["x"])
+
+
+def test_contiguous_runs():
+    assert contiguous_runs([1, 2, 3, 5, 7, 8]) == [[1, 2, 3], [5], [7, 8]]
+    assert contiguous_runs([]) == []
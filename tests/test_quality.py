@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from quality import check_page, QualityGate
+
+
+def table(rows, separator="|---|---|---|"):
+    return "\n".join(["| Year | Net | Gross |", separator] + rows)
+
+
+def test_clean_page_passes():
+    assert check_page("# Report\n\nRevenue grew by 10% in 2024.\n") == []
+
+
+def test_empty_page():
+    assert check_page("  \n") == ["empty output"]
+
+
+@pytest.mark.parametrize("separator", ["|---|---|---|", "|:--|--:|:-:|", "|-|-|-|", "--- | --- | ---"])
+def test_table_separators(separator):
+    assert check_page(table(["| 2024 | 1 | 2 |"], separator)) == []
+
+
+def test_table_without_separator():
+    assert check_page("| a | b |\n| 1 | 2 |\n| 3 | 4 |") == ["table 1 has no header separator"]
+
+
+def test_spreadsheet_with_identical_rows_passes():
+    rows = ["| 2024 | 10.00 | 10.00 |"] * 25
+    assert check_page(table(["| 2023 | 9.00 | 9.00 |"] + rows)) == []
+
+
+def test_form_with_identical_lines_passes():
+    form = "\n".join(["Please fill in one line per visitor.", ""] + ["Name: ____ Date: ____"] * 10)
+    assert check_page(form) == []
+
+
+def test_line_loop_to_the_output_limit():
+    page = "# Minutes\n\n" + "\n".join(["The committee approved the budget."] * 200)
+    assert check_page(page) == ["line repeated 200 times"]
+
+
+def test_inline_loop_to_the_output_limit():
+    page = "The results are as follows: " + "and the results are " * 300
+    problems = check_page(page)
+    assert len(problems) == 1 and problems[0].startswith("text repeated")
+
+
+def test_short_repeat_is_not_a_loop():
+    assert check_page("Ha ha ha ha! " + "very very very very very good " * 3) == []
+
+
+@pytest.mark.parametrize("page", [
+    "I'm sorry, but I can't help with this image.",
+    "I cannot process this image.",
+    "抱歉，我无法识别这张图片。",
+])
+def test_refusals(page):
+    assert check_page(page)[0].startswith("refusal text")
+
+
+def test_apologetic_letter_passes():
+    assert check_page("Dear Ms Smith,\n\nI'm sorry, but I will be away next week.\n") == []
+
+
+def test_mojibake():
+    problems = check_page("CafÃ© rÃ©sumÃ© naÃ¯ve")
+    assert len(problems) == 1 and problems[0].endswith("garbled characters")
+
+
+def test_fallback_model_is_built_once_on_first_use():
+    built = []
+
+    def factory():
+        built.append(1)
+        return "fallback"
+
+    gate = QualityGate(fallback_model_id="strong", fallback_factory=factory)
+    assert built == []
+
+    async def escalate():
+        return await asyncio.gather(*(gate.get_fallback() for _ in range(5)))
+
+    assert asyncio.run(escalate()) == ["fallback"] * 5
+    assert built == [1]
+
+
+def test_unusable_fallback_keeps_the_page():
+    def factory():
+        raise RuntimeError("missing API key")
+
+    gate = QualityGate(fallback_model_id="strong", fallback_factory=factory)
+    assert asyncio.run(gate.get_fallback()) is None
+    assert asyncio.run(gate.get_fallback()) is None
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from cancellation import CancelToken, OperationCancelled
+from scheduler import PageScheduler, PriorityClass, INTERACTIVE, BULK
+
+
+class Recorder:
+    """Runs pages through a scheduler and records what was in flight"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.peak = {}
+        self.order = []
+
+    async def page(self, priority, duration=0.01, cancel_token=None):
+        async with self.scheduler.slot(priority, cancel_token):
+            running = dict(self.scheduler._running)
+            for name, count in running.items():
+                self.peak[name] = max(self.peak.get(name, 0), count)
+            self.peak["total"] = max(self.peak.get("total", 0), self.scheduler.running)
+            self.order.append(priority)
+            await asyncio.sleep(duration)
+
+
+def test_slot_limit():
+    scheduler = PageScheduler(slots=3, classes=(PriorityClass(BULK),))
+    recorder = Recorder(scheduler)
+
+    async def main():
+        await asyncio.gather(*(recorder.page(BULK) for _ in range(20)))
+    asyncio.run(main())
+    assert recorder.peak["total"] == 3
+    assert scheduler.running == 0
+
+
+def test_reserved_slots_stay_free_for_interactive():
+    scheduler = PageScheduler(slots=4)
+    recorder = Recorder(scheduler)
+
+    async def main():
+        bulk = [asyncio.ensure_future(recorder.page(BULK, 0.05)) for _ in range(20)]
+        await asyncio.sleep(0.01)
+        # Bulk only gets the two shared slots, so an interactive page starts at once
+        assert scheduler._running[BULK] == 2
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await recorder.page(INTERACTIVE, 0)
+        assert loop.time() - started < 0.02
+        await asyncio.gather(*bulk)
+    asyncio.run(main())
+    assert recorder.peak[BULK] == 2
+
+
+def test_weighted_share_does_not_starve_bulk():
+    scheduler = PageScheduler(slots=1, classes=(
+        PriorityClass(INTERACTIVE, weight=4.0),
+        PriorityClass(BULK, weight=1.0),
+    ))
+    recorder = Recorder(scheduler)
+
+    async def main():
+        await asyncio.gather(*(recorder.page(BULK, 0.001) for _ in range(200)),
+                             *(recorder.page(INTERACTIVE, 0.001) for _ in range(200)))
+    asyncio.run(main())
+    # While both classes have work queued, interactive gets ~4 of every 5 slots
+    first = recorder.order[:100]
+    assert 70 <= first.count(INTERACTIVE) <= 90
+    assert first.count(BULK) >= 10
+
+
+def test_overdue_page_is_served_next():
+    scheduler = PageScheduler(slots=1, classes=(
+        PriorityClass(INTERACTIVE, weight=1000.0),
+        PriorityClass(BULK, weight=1.0, max_wait=0.05),
+    ))
+    recorder = Recorder(scheduler)
+
+    async def main():
+        # Bulk has had its share: fair queuing alone would now serve
+        # thousands of interactive pages first
+        await asyncio.gather(*(recorder.page(BULK, 0) for _ in range(10)))
+        interactive = [asyncio.ensure_future(recorder.page(INTERACTIVE, 0.01)) for _ in range(30)]
+        await asyncio.sleep(0)
+        bulk = asyncio.ensure_future(recorder.page(BULK, 0))
+        await asyncio.gather(bulk, *interactive)
+    asyncio.run(main())
+    served = recorder.order[10:]
+    assert 3 <= served.index(BULK) < 15
+    assert scheduler.sla_misses[BULK] == 1
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    scheduler = PageScheduler(slots=1, classes=(PriorityClass(BULK),))
+    recorder = Recorder(scheduler)
+    token = CancelToken()
+
+    async def main():
+        first = asyncio.ensure_future(recorder.page(BULK, 0.05))
+        await asyncio.sleep(0)
+        asyncio.get_running_loop().call_later(0.01, token.cancel)
+        with pytest.raises(OperationCancelled):
+            await recorder.page(BULK, cancel_token=token)
+        await first
+        await recorder.page(BULK, 0)
+    asyncio.run(main())
+    assert recorder.order == [BULK, BULK]
+    assert scheduler.running == 0
+
+
+def test_from_config():
+    scheduler = PageScheduler.from_config({"slots": 6, "classes": {
+        BULK: {"weight": 2, "timeout": 3600},
+        "nightly": {"weight": 0.5},
+    }})
+    assert scheduler.slots == 6
+    assert scheduler.policy(BULK).weight == 2 and scheduler.policy(BULK).timeout == 3600
+    assert scheduler.policy(INTERACTIVE).reserved == 2
+    assert scheduler.policy("nightly").weight == 0.5
+    with pytest.raises(ValueError):
+        scheduler.policy("unknown")
+
+
+def test_reservations_must_leave_a_shared_slot():
+    with pytest.raises(ValueError):
+        PageScheduler(slots=2)
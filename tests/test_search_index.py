@@ -0,0 +1,56 @@
+import threading
+import time
+
+import search_index
+from search_index import SearchIndex, split_sections
+
+
+def test_split_sections():
+    assert split_sections("Intro\n# One\nText\n## Two\nMore") == [
+        ("", 0, "Intro"), ("One", 6, "# One\nText"), ("Two", 17, "## Two\nMore"),
+    ]
+
+
+def test_pages_are_searchable_once_finished(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    try:
+        doc = index.begin_document("/out/a.md")
+        index.add_page(doc, 1, "# Revenue\nRevenue grew")
+        assert index.search("revenue") == []
+        pages = [(1, "# Revenue\nRevenue grew"), (2, "Costs fell")]
+        index.finish_document(doc, pages)
+        hits = index.search("costs")
+        assert [(hit["page"], hit["heading"], hit["offset"]) for hit in hits] == [(2, "Revenue", 24)]
+    finally:
+        index.close()
+
+
+def test_finish_does_not_wait_for_pages_queued_after_it(tmp_path, monkeypatch):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    other = index.begin_document("/out/other.md")
+    doc = index.begin_document("/out/a.md")
+    # Pages of the other document are stuck until this document has finished
+    gate = threading.Event()
+
+    def slow_split(markdown):
+        if markdown.startswith("page"):
+            gate.wait(10)
+        return split_sections(markdown)
+
+    monkeypatch.setattr(search_index, "split_sections", slow_split)
+    try:
+        with index._lock:
+            index.add_page(doc, 1, "needle")
+            finisher = threading.Thread(target=index.finish_document, args=(doc, [(1, "needle")]))
+            finisher.start()
+            while index._pages.qsize() < 1:
+                time.sleep(0.01)
+            for page in range(1, 51):
+                index.add_page(other, page, f"page {page}")
+        finisher.join(5)
+        assert not finisher.is_alive()
+        gate.set()
+        assert [hit["page"] for hit in index.search("needle")] == [1]
+    finally:
+        gate.set()
+        index.close()
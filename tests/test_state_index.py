@@ -0,0 +1,49 @@
+import json
+import os
+
+from state_index import StateIndex, PageCache
+
+
+def make_input(folder, name, content=b"%PDF-1.4"):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def saved_files(state):
+    with open(state.index_path, encoding="utf-8") as f:
+        return json.load(f)["files"]
+
+
+def test_save_is_debounced_until_forced(tmp_path):
+    state = StateIndex(str(tmp_path / "out"), save_interval=3600)
+    first = make_input(str(tmp_path), "a.pdf")
+    state.update(first, "model", "a.md", PageCache())
+    assert not state.save(force=False)
+    assert not os.path.exists(state.index_path)
+
+    assert state.save()
+    assert list(saved_files(state)) == [state.key(first)]
+    # Nothing changed since
+    assert not state.save()
+
+
+def test_unchanged_file_is_skipped_after_reload(tmp_path):
+    out = str(tmp_path / "out")
+    path = make_input(str(tmp_path), "a.pdf")
+    output = make_input(str(tmp_path), "a.md", b"# a")
+    cache = PageCache()
+    cache.record(1, "digest", "# a")
+    state = StateIndex(out, save_interval=0)
+    state.update(path, "model", output, cache)
+    assert state.save(force=False)
+
+    reloaded = StateIndex(out)
+    assert reloaded.check(path, "model")[0]
+    assert not reloaded.check(path, "other-model")[0]
+    assert reloaded.page_cache(path, "model").get("digest") == "# a"
+
+    reloaded.prune(str(tmp_path), [])
+    assert reloaded.save()
+    assert saved_files(reloaded) == {}
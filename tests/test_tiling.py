@@ -0,0 +1,61 @@
+from tiling import stitch, plan_tiles
+
+
+def test_plan_tiles_covers_the_page_with_overlap():
+    boxes = plan_tiles(2000, 6000, max_tile_pixels=4_000_000)
+    assert boxes[0][1] == 0 and boxes[-1][3] == 6000
+    for (_, _, _, bottom), (_, top, _, _) in zip(boxes, boxes[1:]):
+        assert top < bottom
+
+
+def test_exact_overlap_is_kept_once():
+    first = "# Title\n\nFirst line of text here.\nSecond line of text here."
+    second = "First line of text here.\nSecond line of text here.\nThird line of text here."
+    assert stitch([first, second]) == (
+        "# Title\n\nFirst line of text here.\nSecond line of text here.\nThird line of text here."
+    )
+
+
+def test_lines_cut_by_the_band_edge_are_dropped():
+    # The first tile's bottom edge cuts "Third line", the second tile's top
+    # edge cuts "First line"
+    first = "First line of the paragraph\nSecond line of the paragraph\nThird li"
+    second = "ne of the paragr\nSecond line of the paragraph\nThird line of the paragraph\nFourth line."
+    assert stitch([first, second]) == (
+        "First line of the paragraph\nSecond line of the paragraph\n"
+        "Third line of the paragraph\nFourth line."
+    )
+
+
+def test_overlap_read_slightly_differently():
+    first = "Revenue grew by 10% in 2024, driven by exports.\nCosts were flat."
+    second = "Revenue grew by 10 % in 2024, driven by exports\nCosts were flat.\nMargins improved."
+    assert stitch([first, second]) == (
+        "Revenue grew by 10% in 2024, driven by exports.\nCosts were flat.\nMargins improved."
+    )
+
+
+def test_single_line_cut_on_both_sides_is_joined():
+    first = "Intro paragraph.\nThe quick brown fox jumps over"
+    second = "quick brown fox jumps over the lazy dog.\nNext paragraph."
+    assert stitch([first, second]) == "Intro paragraph.\nThe quick brown fox jumps over the lazy dog.\nNext paragraph."
+
+
+def test_seam_inside_a_paragraph_does_not_split_it():
+    assert stitch(["This sentence is cut by", "the seam between tiles."]) == (
+        "This sentence is cut by\nthe seam between tiles."
+    )
+
+
+def test_seam_between_blocks_gets_a_blank_line():
+    assert stitch(["End of a paragraph.", "## Next section"]) == "End of a paragraph.\n\n## Next section"
+
+
+def test_repeated_table_header_is_dropped():
+    first = "| A | B |\n|---|---|\n| 1 | one |\n| 2 | two |"
+    second = "| A | B |\n|---|---|\n| 2 | two |\n| 3 | three |"
+    assert stitch([first, second]) == "| A | B |\n|---|---|\n| 1 | one |\n| 2 | two |\n| 3 | three |"
+
+
+def test_empty_tiles():
+    assert stitch(["Only text.", ""]) == "Only text."
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import threading
+import time
+
+from worker import CLAIM_DIR, DONE_DIR, FAILED_DIR, FolderQueue, serve
+
+
+def drop(inbox, name, data=b"%PDF-1.4", age=0):
+    path = os.path.join(inbox, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    if age:
+        past = time.time() - age
+        os.utime(path, (past, past))
+    return path
+
+
+def test_pending_waits_for_files_to_settle(tmp_path):
+    inbox = str(tmp_path)
+    queue = FolderQueue(inbox, settle_time=5)
+    drop(inbox, "old.pdf", age=120)
+    drop(inbox, "fresh.pdf")
+    drop(inbox, "growing.pdf", age=60)
+    drop(inbox, "upload.pdf.part", age=60)
+    drop(inbox, ".hidden.pdf", age=60)
+
+    # Nothing is claimed before a second scan has seen it unchanged
+    assert queue.pending() == []
+    assert queue.waiting == 3
+
+    drop(inbox, "growing.pdf", data=b"%PDF-1.4 more", age=60)
+    assert queue.pending() == ["old.pdf"]
+    # fresh.pdf was written less than settle_time ago, growing.pdf changed size
+    assert queue.waiting == 2
+    # Oldest first
+    assert queue.pending() == ["old.pdf", "growing.pdf"]
+    assert queue.waiting == 1
+
+
+def test_pending_applies_accept_filter(tmp_path):
+    inbox = str(tmp_path)
+    queue = FolderQueue(inbox, settle_time=0)
+    drop(inbox, "a.pdf")
+    drop(inbox, "b.docx")
+    queue.pending()
+    assert queue.pending(accept=lambda name: name.endswith(".pdf")) == ["a.pdf"]
+
+
+def test_claim_finish_and_fail(tmp_path):
+    inbox = str(tmp_path)
+    queue = FolderQueue(inbox)
+    drop(inbox, "good.pdf")
+    drop(inbox, "bad.pdf")
+
+    good = queue.claim("good.pdf")
+    assert os.path.dirname(os.path.dirname(good)) == os.path.join(inbox, CLAIM_DIR)
+    assert not os.path.exists(os.path.join(inbox, "good.pdf"))
+    assert queue.claim("good.pdf") is None
+
+    bad = queue.claim("bad.pdf")
+    assert queue.finish(good) == os.path.join(inbox, DONE_DIR, "good.pdf")
+    failed = queue.finish(bad, error="no pages")
+    assert failed == os.path.join(inbox, FAILED_DIR, "bad.pdf")
+    with open(failed + ".error.txt", encoding="utf-8") as f:
+        assert f.read() == "no pages\n"
+    # Claim directories are removed with their file
+    assert os.listdir(os.path.join(inbox, CLAIM_DIR)) == []
+
+
+def test_release_and_requeue_stale(tmp_path):
+    inbox = str(tmp_path)
+    crashed = FolderQueue(inbox, stale_after=60)
+    other = FolderQueue(inbox, stale_after=60)
+    drop(inbox, "a.pdf")
+    drop(inbox, "b.pdf")
+
+    path = crashed.claim("a.pdf")
+    assert crashed.release(path) == os.path.join(inbox, "a.pdf")
+
+    path = crashed.claim("b.pdf")
+    assert other.requeue_stale() == 0
+    past = time.time() - 120
+    os.utime(path, (past, past))
+    os.utime(os.path.dirname(path), (past, past))
+    assert other.requeue_stale() == 1
+    assert sorted(os.listdir(inbox)) == sorted(["a.pdf", "b.pdf", CLAIM_DIR, DONE_DIR, FAILED_DIR])
+    assert os.listdir(os.path.join(inbox, CLAIM_DIR)) == []
+
+
+def test_two_queues_claim_each_file_once(tmp_path):
+    inbox = str(tmp_path)
+    names = [f"doc_{i:03d}.pdf" for i in range(200)]
+    for name in names:
+        drop(inbox, name)
+    queues = [FolderQueue(inbox), FolderQueue(inbox)]
+    claimed = [[], []]
+    start = threading.Barrier(2)
+
+    def consume(i):
+        start.wait()
+        for name in names:
+            path = queues[i].claim(name)
+            if path is not None:
+                claimed[i].append(os.path.basename(path))
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed[0] + claimed[1]) == names
+    # Claims that lost the race leave no empty directories behind
+    assert len(os.listdir(os.path.join(inbox, CLAIM_DIR))) == len(names)
+
+
+def test_two_workers_share_one_inbox(tmp_path):
+    inbox = str(tmp_path)
+    names = [f"doc_{i:02d}.pdf" for i in range(30)]
+    for name in names:
+        drop(inbox, name)
+    converted = []
+
+    async def convert(path):
+        converted.append(os.path.basename(path))
+        await asyncio.sleep(0.001)
+        return True, "ok"
+
+    async def main():
+        return await asyncio.gather(*(
+            serve(FolderQueue(inbox, settle_time=0), convert, concurrency=4, once=True, poll_interval=0.01)
+            for _ in range(2)
+        ))
+
+    assert asyncio.run(main()) == [0, 0]
+    assert sorted(converted) == names
+    assert sorted(os.listdir(os.path.join(inbox, DONE_DIR))) == names
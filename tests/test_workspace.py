@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from cancellation import CancelToken, OperationCancelled
+from system_tools import OfficePool
+from workspace import WorkspaceManager
+
+
+def test_quota_waiter_wakes_on_release(tmp_path):
+    manager = WorkspaceManager(root=str(tmp_path), quota_bytes=100)
+
+    async def main():
+        await manager.acquire(80)
+        waiter = asyncio.ensure_future(manager.acquire(50))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        manager._add_usage(-80)
+        await asyncio.wait_for(waiter, 1)
+        return manager.usage
+    assert asyncio.run(main()) == 50
+
+
+def test_quota_released_from_another_thread(tmp_path):
+    manager = WorkspaceManager(root=str(tmp_path), quota_bytes=100)
+
+    async def main():
+        await manager.acquire(100)
+        threading.Timer(0.05, manager._add_usage, args=(-100,)).start()
+        started = time.monotonic()
+        await asyncio.wait_for(manager.acquire(100), 1)
+        return time.monotonic() - started
+    assert asyncio.run(main()) < 0.5
+
+
+def test_quota_wait_is_cancellable(tmp_path):
+    manager = WorkspaceManager(root=str(tmp_path), quota_bytes=100)
+    token = CancelToken()
+
+    async def main():
+        await manager.acquire(100)
+        asyncio.get_running_loop().call_later(0.05, token.cancel)
+        with pytest.raises(OperationCancelled):
+            await manager.acquire(10, token)
+    asyncio.run(main())
+
+
+def test_office_pool_slots():
+    pool = OfficePool(1)
+    order = []
+
+    async def convert(name):
+        async with pool.slot() as profile:
+            order.append((name, "start"))
+            assert profile.startswith("-env:UserInstallation=file://")
+            await asyncio.sleep(0.02)
+            order.append((name, "end"))
+
+    async def main():
+        await asyncio.wait_for(asyncio.gather(convert("a"), convert("b")), 1)
+    try:
+        asyncio.run(main())
+    finally:
+        pool.cleanup()
+    assert order == [("a", "start"), ("a", "end"), ("b", "start"), ("b", "end")]
+
+
+def test_convert_to_pdf_without_workspace_leaves_only_the_pdf(tmp_path):
+    from converter import PDFConverterTool
+
+    image = tmp_path / "scan.png"
+    Image.new("RGB", (20, 20), "white").save(image)
+    scratch = tmp_path / "scratch"
+    converter = PDFConverterTool()
+    converter.workspaces = WorkspaceManager(root=str(scratch))
+
+    pdf_path = asyncio.run(converter.convert_to_pdf(str(image)))
+    try:
+        assert os.listdir(scratch) == [os.path.basename(pdf_path)]
+        assert converter.workspaces.usage == 0
+    finally:
+        os.remove(pdf_path)
@@ -0,0 +1,248 @@
+import os
+import re
+import math
+import asyncio
+import logging
+from difflib import SequenceMatcher
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Tiling modes accepted by convert_file
+TILING_MODES = ("off", "auto", "always")
+
+# Pages above this many pixels are tiled in "auto" mode (A4 at 300 DPI is ~8.7M)
+MAX_PAGE_PIXELS = 12_000_000
+# Upper bound on pixels per tile, roughly what vision models accept unscaled
+MAX_TILE_PIXELS = 4_000_000
+# Fraction of a tile's height shared with its neighbour
+OVERLAP_RATIO = 0.12
+# Fraction of dark pixels above which a page counts as dense in "auto" mode
+DENSE_INK_RATIO = 0.15
+# Longest overlap, in lines, looked for when stitching neighbouring tiles
+MAX_OVERLAP_LINES = 40
+# Lines at least this similar are the same line read twice
+LINE_MATCH_RATIO = 0.85
+# Characters an overlap must share before it is trusted
+MIN_OVERLAP_CHARS = 8
+
+
+def plan_tiles(width, height, max_tile_pixels=MAX_TILE_PIXELS,
+               overlap_ratio=OVERLAP_RATIO, min_tiles=1):
+    """Split a page into overlapping full-width horizontal bands
+
+    Bands keep reading order and table rows intact, which makes the Markdown
+    of neighbouring tiles straightforward to stitch. Returns a list of
+    (left, top, right, bottom) boxes from top to bottom.
+    """
+    count = max(min_tiles, math.ceil(width * height / max_tile_pixels))
+    if count <= 1:
+        return [(0, 0, width, height)]
+
+    # Solve count * band - (count - 1) * overlap = height for the band height
+    band = math.ceil(height / (count - (count - 1) * overlap_ratio))
+    overlap = int(band * overlap_ratio)
+    step = band - overlap
+    boxes = []
+    top = 0
+    while True:
+        bottom = min(height, top + band)
+        boxes.append((0, top, width, bottom))
+        if bottom >= height:
+            break
+        top += step
+    return boxes
+
+
+def ink_ratio(image):
+    """Fraction of dark pixels, measured on a small grayscale thumbnail"""
+    thumb = image.convert("L")
+    thumb.thumbnail((512, 512))
+    histogram = thumb.histogram()
+    total = sum(histogram)
+    return sum(histogram[:128]) / total if total else 0.0
+
+
+def should_tile(image, mode="auto"):
+    """Decide whether a rendered page should be tiled"""
+    if mode == "always":
+        return True
+    if mode != "auto":
+        return False
+    if image.width * image.height > MAX_PAGE_PIXELS:
+        return True
+    return ink_ratio(image) > DENSE_INK_RATIO
+
+
+def split_page(image_path, output_dir, mode="auto"):
+    """Split a rendered page into tile images
+
+    Returns the tile paths, or [image_path] when the page doesn't need
+    tiling. Dense pages that aren't oversized are split in two so each
+    half is seen at twice the effective resolution.
+    """
+    with Image.open(image_path) as image:
+        if not should_tile(image, mode):
+            return [image_path]
+        min_tiles = 2 if image.width * image.height <= MAX_TILE_PIXELS else 1
+        boxes = plan_tiles(image.width, image.height, min_tiles=min_tiles)
+        if len(boxes) == 1:
+            return [image_path]
+
+        base = os.path.splitext(os.path.basename(image_path))[0]
+        tile_paths = []
+        for i, box in enumerate(boxes):
+            tile_path = os.path.join(output_dir, f"{base}_tile{i:02d}.png")
+            image.crop(box).save(tile_path)
+            tile_paths.append(tile_path)
+    logger.debug("Split %s into %d tiles", image_path, len(tile_paths))
+    return tile_paths
+
+
+def _normalize(line):
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def _same_line(a, b):
+    if a == b:
+        return True
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return matcher.real_quick_ratio() >= LINE_MATCH_RATIO and matcher.ratio() >= LINE_MATCH_RATIO
+
+
+def _join_fragments(a, b):
+    """One line from `a` and `b`, the same line cut by a tile edge, or None
+
+    The end of `a` overlapping the start of `b` is merged; otherwise the
+    longer reading is kept.
+    """
+    short, long_ = sorted((a, b), key=len)
+    if len(_normalize(short)) < MIN_OVERLAP_CHARS:
+        return None
+    match = SequenceMatcher(None, a, b, autojunk=False).find_longest_match(0, len(a), 0, len(b))
+    if match.size < 0.8 * len(short.strip()):
+        return None
+    if match.a + match.size == len(a) and match.b == 0:
+        return a + b[match.size:]
+    return long_
+
+
+def _overlap(previous, current, max_lines=MAX_OVERLAP_LINES):
+    """How to join two tiles: (lines dropped from the end of `previous`,
+    lines dropped from the start of `current`, line joining the two or None,
+    whether they overlapped)
+
+    A band edge usually cuts through a line of text, so the last line of
+    one tile and the first of the next may be fragments of lines the other
+    tile read in full. They may be skipped on either side before looking
+    for the longest run of (nearly) identical lines.
+    """
+    prev_norm = [_normalize(line) for line in previous[-max_lines:]]
+    curr_norm = [_normalize(line) for line in current[:max_lines]]
+    best = None
+    for cut_prev in (0, 1):
+        for cut_curr in (0, 1):
+            prev = prev_norm[:len(prev_norm) - cut_prev]
+            curr = curr_norm[cut_curr:]
+            for k in range(min(len(prev), len(curr)), 0, -1):
+                if sum(len(line) for line in curr[:k]) < MIN_OVERLAP_CHARS:
+                    continue
+                if all(_same_line(a, b) for a, b in zip(prev[len(prev) - k:], curr[:k])):
+                    # Prefer the longest overlap, then the fewest dropped lines
+                    if best is None or (k, -cut_prev - cut_curr) > best[0]:
+                        best = ((k, -cut_prev - cut_curr), cut_prev, cut_curr + k)
+                    break
+    if best is not None:
+        return best[1], best[2], None, True
+    # Only one line in the overlap, cut on both sides
+    if previous and current:
+        joined = _join_fragments(previous[-1].rstrip(), current[0].lstrip())
+        if joined is not None:
+            return 1, 1, joined, True
+    return 0, 0, None, False
+
+
+_BLOCK_START_RE = re.compile(r"^(#|\||>|```|[-*+]\s|\d+[.)]\s)")
+
+
+def _ends_block(line):
+    """Whether a tile ending in `line` probably ends a paragraph"""
+    line = line.strip()
+    return line.endswith((".", "!", "?", ":", "。", "！", "？", "：")) or _BLOCK_START_RE.match(line) is not None
+
+
+def _last_table_header(lines):
+    """Header and separator rows of the table `lines` ends in, if any"""
+    end = len(lines)
+    while end and not lines[end - 1].strip():
+        end -= 1
+    if not end or not lines[end - 1].lstrip().startswith("|"):
+        return None
+    start = end
+    while start and lines[start - 1].lstrip().startswith("|"):
+        start -= 1
+    if end - start >= 2 and re.match(r"^\s*\|?[\s:|-]+\|?\s*$", lines[start + 1]):
+        return [_normalize(lines[start]), _normalize(lines[start + 1])]
+    return None
+
+
+def stitch(tile_markdowns):
+    """Join tile Markdown top to bottom, dropping text repeated in the overlaps
+
+    Lines shared by the end of one tile and the start of the next are kept
+    once, including lines the band edge cut in half. A table header the
+    model repeated at the top of a tile is dropped when the previous tile
+    ended inside the same table. A blank line is only added at a seam
+    without a recognisable overlap that looks like a block boundary.
+    """
+    merged = []
+    for markdown in tile_markdowns:
+        lines = (markdown or "").strip("\n").split("\n")
+        if not merged:
+            merged.extend(lines)
+            continue
+
+        header = _last_table_header(merged)
+        if header and len(lines) >= 2 and [_normalize(l) for l in lines[:2]] == header:
+            lines = lines[2:]
+        cut_prev, cut_curr, joined, overlapped = _overlap(merged, lines)
+        if cut_prev:
+            del merged[-cut_prev:]
+        lines = lines[cut_curr:]
+        if joined is not None:
+            merged.append(joined)
+
+        # After an overlap the next tile's own line breaks apply. Without one,
+        # only start a new block where one probably ends or begins, so a
+        # paragraph cut by the seam stays one paragraph
+        continues_table = header is not None and lines and lines[0].lstrip().startswith("|")
+        if not overlapped and not continues_table and merged and merged[-1].strip() \
+                and lines and lines[0].strip() \
+                and (_ends_block(merged[-1]) or _BLOCK_START_RE.match(lines[0].strip())):
+            merged.append("")
+        merged.extend(lines)
+    return "\n".join(merged).strip()
+
+
+async def ocr_tiled(image_path, work_dir, ocr, mode="auto"):
+    """OCR a page, splitting it into tiles first if needed
+
+    `ocr` is an async callable taking (tile_path, is_first_tile) and returning
+    Markdown. Tiles are recognised concurrently, so a tiled page takes about
+    as long as one tile.
+    """
+    tile_paths = await asyncio.to_thread(split_page, image_path, work_dir, mode)
+    if tile_paths == [image_path]:
+        return await ocr(image_path, True)
+
+    tasks = [asyncio.ensure_future(ocr(path, i == 0)) for i, path in enumerate(tile_paths)]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for path in tile_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return stitch(results)
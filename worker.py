@@ -0,0 +1,232 @@
+import os
+import time
+import uuid
+import shutil
+import signal
+import asyncio
+import logging
+
+from converter import NEED_PDF_CONVERSION, IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Subfolders of the inbox; hidden so they are never picked up as input
+CLAIM_DIR = ".processing"
+DONE_DIR = ".done"
+FAILED_DIR = ".failed"
+# How often an idle worker looks for new files
+POLL_INTERVAL = 2.0
+# Claims are touched this often while their file converts...
+HEARTBEAT_INTERVAL = 30.0
+# ...and returned to the inbox by any worker once untouched for this long
+STALE_AFTER = 300.0
+# A file is only claimed once its size and mtime have stayed the same for
+# this long, so one still being copied into the inbox is left alone
+SETTLE_TIME = 5.0
+# Names uploads commonly use until they are complete; never claimed
+UPLOAD_SUFFIXES = (".part", ".tmp", ".crdownload", ".partial")
+
+
+class FolderQueue:
+    """A shared inbox folder that any number of workers take files from
+
+    A worker claims a file by renaming it into its own directory under
+    `.processing/`; the rename is atomic, so on a shared volume each file is
+    converted by exactly one worker. Finished files move to `.done/` or
+    `.failed/` (with the error next to them). A worker that dies leaves its
+    claim behind, and the claim is put back in the inbox once its heartbeat
+    stops.
+    Uploaders should write to a hidden or `.part` name and rename the file
+    when it is complete; files copied in place are only claimed after their
+    size and mtime have been stable for `settle_time` seconds.
+    """
+
+    def __init__(self, inbox, stale_after=STALE_AFTER, settle_time=SETTLE_TIME):
+        self.inbox = inbox
+        self.stale_after = stale_after
+        self.settle_time = settle_time
+        # Name -> (size, mtime) at the previous scan
+        self._seen = {}
+        # Files found by the last scan that haven't settled yet
+        self.waiting = 0
+        for name in (CLAIM_DIR, DONE_DIR, FAILED_DIR):
+            os.makedirs(os.path.join(inbox, name), exist_ok=True)
+
+    def pending(self, accept=None):
+        """Settled files waiting in the inbox, oldest first"""
+        now = time.time()
+        entries, seen = [], {}
+        with os.scandir(self.inbox) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith(".") or name.lower().endswith(UPLOAD_SUFFIXES) or not entry.is_file():
+                    continue
+                if accept is not None and not accept(name):
+                    continue
+                stat = entry.stat()
+                seen[name] = (stat.st_size, stat.st_mtime)
+                # Unchanged since the last scan and not written to for settle_time
+                if self._seen.get(name) == seen[name] and now - stat.st_mtime >= self.settle_time:
+                    entries.append((stat.st_mtime, name))
+        self._seen = seen
+        self.waiting = len(seen) - len(entries)
+        return [name for _, name in sorted(entries)]
+
+    def claim(self, name):
+        """Path of the claimed file, or None if another worker got it first"""
+        claim_dir = os.path.join(self.inbox, CLAIM_DIR, uuid.uuid4().hex[:12])
+        os.mkdir(claim_dir)
+        path = os.path.join(claim_dir, name)
+        try:
+            os.rename(os.path.join(self.inbox, name), path)
+        except FileNotFoundError:
+            os.rmdir(claim_dir)
+            return None
+        self.heartbeat(path)
+        return path
+
+    def heartbeat(self, path):
+        try:
+            os.utime(path)
+        except OSError as e:
+            logger.warning("Lost claim on %s: %s", path, e)
+
+    def _move(self, path, folder):
+        target = os.path.join(self.inbox, folder, os.path.basename(path))
+        os.replace(path, target)
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        return target
+
+    def finish(self, path, error=None):
+        """Move a claimed file to .done/, or to .failed/ with its error"""
+        if error is None:
+            return self._move(path, DONE_DIR)
+        target = self._move(path, FAILED_DIR)
+        with open(target + ".error.txt", "w", encoding="utf-8") as f:
+            f.write(f"{error}\n")
+        return target
+
+    def release(self, path):
+        """Put a claimed file back in the inbox"""
+        return self._move(path, "")
+
+    def requeue_stale(self):
+        """Return claims whose worker stopped sending heartbeats; returns how many"""
+        requeued = 0
+        claims = os.path.join(self.inbox, CLAIM_DIR)
+        for claim_dir in os.listdir(claims):
+            claim_path = os.path.join(claims, claim_dir)
+            for name in os.listdir(claim_path) if os.path.isdir(claim_path) else ():
+                path = os.path.join(claim_path, name)
+                try:
+                    # The claim directory is fresh even before the first heartbeat
+                    touched = max(os.path.getmtime(path), os.path.getmtime(claim_path))
+                    if time.time() - touched < self.stale_after:
+                        continue
+                    self.release(path)
+                except FileNotFoundError:
+                    # Finished or requeued by another worker meanwhile
+                    continue
+                logger.warning("Requeued %s from a worker that stopped responding", name)
+                requeued += 1
+        return requeued
+
+
+def accepts(tools):
+    """Inbox file filter for what this machine can convert
+
+    Nodes without LibreOffice leave Office files for nodes that have it.
+    """
+    capabilities = tools.capabilities()
+
+    def accept(name):
+        ext = os.path.splitext(name)[1].lower().lstrip(".")
+        if not capabilities["render_pdf"]:
+            return False
+        if ext == "pdf" or ext in IMAGE_EXTENSIONS:
+            return True
+        return ext in NEED_PDF_CONVERSION and capabilities["office_to_pdf"]
+
+    return accept
+
+
+async def serve(queue, convert, accept=None, concurrency=1, once=False, poll_interval=POLL_INTERVAL):
+    """Convert files from `queue` until stopped by SIGTERM/SIGINT
+
+    `convert` is a coroutine function taking a path and returning
+    (success, message). With `once` the worker exits when the inbox is
+    empty instead of waiting for more files. In-flight files are finished
+    before a stop; returns the number of failed files.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Windows, or not running in the main thread
+            pass
+
+    in_flight = set()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    failures = 0
+
+    async def work(path):
+        nonlocal failures
+        try:
+            success, message = await convert(path)
+        except asyncio.CancelledError:
+            # Interrupted mid-conversion: leave the file for another worker
+            queue.release(path)
+            raise
+        except Exception as e:
+            success, message = False, str(e)
+        finally:
+            in_flight.discard(path)
+            semaphore.release()
+        if success:
+            queue.finish(path)
+            logger.info("Converted %s: %s", os.path.basename(path), message)
+        else:
+            failures += 1
+            queue.finish(path, error=message)
+            logger.error("Failed to convert %s: %s", os.path.basename(path), message)
+
+    async def heartbeats():
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            for path in list(in_flight):
+                queue.heartbeat(path)
+
+    heartbeat_task = asyncio.ensure_future(heartbeats())
+    tasks = set()
+    try:
+        while not stop.is_set():
+            await asyncio.to_thread(queue.requeue_stale)
+            claimed = 0
+            for name in await asyncio.to_thread(queue.pending, accept):
+                await semaphore.acquire()
+                if stop.is_set():
+                    semaphore.release()
+                    break
+                path = await asyncio.to_thread(queue.claim, name)
+                if path is None:
+                    semaphore.release()
+                    continue
+                claimed += 1
+                in_flight.add(path)
+                task = asyncio.ensure_future(work(path))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if once and not claimed and not tasks and not queue.waiting:
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        if tasks:
+            logger.info("Stopping: waiting for %d conversion(s) to finish", len(tasks))
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        heartbeat_task.cancel()
+    return failures
@@ -0,0 +1,178 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+
+from cancellation import Notifier
+
+logger = logging.getLogger(__name__)
+
+# Inputs up to this size keep their intermediates on the memory-backed root
+MEMORY_THRESHOLD = 20 * 1024 * 1024
+# Disk space reserved for one rendered page image while it is being recognised
+PAGE_IMAGE_BYTES = 8 * 1024 * 1024
+# /dev/shm is only used by default when it is at least this large; Docker
+# gives containers 64 MB, which a few concurrent documents would fill
+MEMORY_ROOT_MIN_SIZE = 1024 * 1024 * 1024
+# A document only goes to the memory root if this much is left besides its input
+MEMORY_ROOT_MIN_FREE = 256 * 1024 * 1024
+
+
+def _space(path):
+    """(total, free) bytes of the filesystem holding `path`, or None if unknown"""
+    try:
+        st = os.statvfs(path)
+    except (AttributeError, OSError):
+        return None
+    return st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+
+
+def default_memory_root():
+    """tmpfs mount used for small documents, if the platform has a large enough one"""
+    if not os.path.isdir("/dev/shm") or not os.access("/dev/shm", os.W_OK):
+        return None
+    space = _space("/dev/shm")
+    if space is None or space[0] < MEMORY_ROOT_MIN_SIZE:
+        return None
+    return "/dev/shm"
+
+
+class Workspace:
+    """Scratch directory for one document's intermediates"""
+
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+        self._tracked = 0
+        self._active = 0
+
+    def track(self, file_path):
+        """Count a file written into the workspace against the quota until the workspace closes"""
+        size = os.path.getsize(file_path)
+        self._tracked += size
+        self.manager._add_usage(size)
+
+    def discard(self, file_path):
+        """Delete a tracked file early and give its quota back"""
+        size = os.path.getsize(file_path)
+        os.remove(file_path)
+        self._tracked -= size
+        self.manager._add_usage(-size)
+
+    @asynccontextmanager
+    async def reserve(self, nbytes, cancel_token=None):
+        """Hold `nbytes` of quota while a short-lived intermediate exists
+
+        A workspace already holding files can always take one reservation,
+        so documents that are mid-way through can finish and release space
+        instead of deadlocking on the quota.
+        """
+        force = self._tracked > 0 and self._active == 0
+        await self.manager.acquire(nbytes, cancel_token, force=force)
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self.manager._add_usage(-nbytes)
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._add_usage(-self._tracked)
+        self._tracked = 0
+
+
+class WorkspaceManager:
+    """Creates per-document scratch directories and enforces a disk quota
+
+    Each document gets its own directory under `root`, removed as soon as the
+    document finishes. When `quota_bytes` is set, creating an intermediate
+    waits until enough space is released by other documents (backpressure).
+    Documents no larger than `memory_threshold` use `memory_root`, normally
+    a tmpfs such as /dev/shm, so their intermediates never touch the disk,
+    as long as it has MEMORY_ROOT_MIN_FREE to spare when the workspace is
+    created.
+    """
+
+    def __init__(self, root=None, quota_bytes=None, memory_root=None, memory_threshold=MEMORY_THRESHOLD):
+        self.root = root or tempfile.gettempdir()
+        self.quota_bytes = quota_bytes
+        self.memory_root = memory_root
+        self.memory_threshold = memory_threshold
+        self._lock = threading.Lock()
+        self._released = Notifier()
+        self._usage = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build from the `workspace` section of config.yaml"""
+        settings = settings or {}
+        quota_mb = settings.get("quota_mb")
+        threshold_mb = settings.get("memory_threshold_mb")
+        # Unset means use /dev/shm when available and large enough; `false` disables the memory root
+        memory_root = settings.get("memory_root")
+        if memory_root is None:
+            memory_root = default_memory_root()
+        return cls(
+            root=settings.get("root") or None,
+            quota_bytes=int(quota_mb * 1024 * 1024) if quota_mb else None,
+            memory_root=memory_root or None,
+            memory_threshold=int(threshold_mb * 1024 * 1024) if threshold_mb is not None else MEMORY_THRESHOLD,
+        )
+
+    @property
+    def usage(self):
+        """Bytes currently tracked or reserved"""
+        return self._usage
+
+    def _add_usage(self, nbytes):
+        with self._lock:
+            self._usage = max(0, self._usage + nbytes)
+        if nbytes < 0:
+            self._released.notify_all()
+
+    def _try_acquire(self, nbytes, force=False):
+        with self._lock:
+            # A single oversized request is let through when nothing else holds quota
+            if force or self.quota_bytes is None or self._usage == 0 or self._usage + nbytes <= self.quota_bytes:
+                self._usage += nbytes
+                return True
+            return False
+
+    async def acquire(self, nbytes, cancel_token=None, force=False):
+        """Wait until `nbytes` fit in the quota, then count them as used"""
+        await self._released.wait_for(lambda: self._try_acquire(nbytes, force), cancel_token)
+
+    def _choose_root(self, input_path):
+        if self.memory_root and input_path and os.path.exists(input_path):
+            size = os.path.getsize(input_path)
+            if size <= self.memory_threshold:
+                space = _space(self.memory_root)
+                if space is not None and space[1] >= size + MEMORY_ROOT_MIN_FREE:
+                    return self.memory_root
+                logger.debug("Not enough free space on %s for %s", self.memory_root, input_path)
+        return self.root
+
+    def create(self, input_path=None):
+        """New workspace; the caller must close() it"""
+        root = self._choose_root(input_path)
+        try:
+            path = tempfile.mkdtemp(prefix="ocr2md_", dir=root)
+        except OSError as e:
+            if root == self.root:
+                raise
+            logger.warning("Memory scratch root unavailable, using %s: %s", self.root, e)
+            path = tempfile.mkdtemp(prefix="ocr2md_", dir=self.root)
+        return Workspace(self, path)
+
+    @asynccontextmanager
+    async def workspace(self, input_path=None):
+        """Workspace removed deterministically when the block exits"""
+        ws = self.create(input_path)
+        try:
+            yield ws
+        finally:
+            ws.close()